@@ -0,0 +1,80 @@
+import math
+
+from django.conf import settings
+from PIL import Image, UnidentifiedImageError
+
+from .utils import GRAYSCALE_DECODE_FLAGS
+
+
+class ImageTooLarge(ValueError):
+    """Загрузка превышает лимиты DETECTOR_ADMISSION; details попадает в ответ 413."""
+
+    def __init__(self, message, details):
+        super().__init__(message)
+        self.details = details
+
+
+def admission_limits():
+    options = settings.DETECTOR_ADMISSION
+    return {
+        'max_pixels': options['MAX_PIXELS'],
+        'max_bytes': options['MAX_BYTES'],
+        'policy': options['POLICY'],
+    }
+
+
+def read_image_header(image_file):
+    """
+    Размеры и формат изображения по заголовку файла. Pillow читает только заголовок,
+    пиксели не декодируются. Возвращает (width, height, format).
+    """
+    image_file.seek(0)
+    try:
+        with Image.open(image_file) as image:
+            return image.width, image.height, image.format
+    except Image.DecompressionBombError:
+        # Pillow сам отказывается открывать изображения больше 2 * MAX_IMAGE_PIXELS, размеры не сообщаются
+        limits = admission_limits()
+        raise ImageTooLarge(
+            f"Image exceeds the limit of {limits['max_pixels']} pixels",
+            {'limits': limits, 'image': {'bytes': getattr(image_file, 'size', None)}},
+        )
+    except (UnidentifiedImageError, OSError, SyntaxError):
+        raise ValueError("Image format not recognized, check the file format.")
+    finally:
+        image_file.seek(0)
+
+
+def reduced_pixels(width, height, reduce):
+    return math.ceil(width / reduce) * math.ceil(height / reduce)
+
+
+def admit_upload(image_file, reduce=1):
+    """
+    Допуск загрузки до декодирования по размеру файла и размерам из заголовка.
+
+    Возвращает коэффициент уменьшения при декодировании. При POLICY = 'downscale'
+    слишком большое изображение уменьшается в 2 или 4 раза, если этого достаточно;
+    иначе (и при POLICY = 'reject') выбрасывается ImageTooLarge.
+    Нераспознанный формат - ValueError.
+    """
+    limits = admission_limits()
+    size = getattr(image_file, 'size', None)
+    if size is not None and size > limits['max_bytes']:
+        raise ImageTooLarge(
+            f"Upload of {size} bytes exceeds the limit of {limits['max_bytes']} bytes",
+            {'limits': limits, 'image': {'bytes': size}},
+        )
+
+    width, height, image_format = read_image_header(image_file)
+    candidates = [reduce]
+    if limits['policy'] == 'downscale':
+        candidates = [factor for factor in sorted(GRAYSCALE_DECODE_FLAGS) if factor >= reduce]
+    for factor in candidates:
+        if reduced_pixels(width, height, factor) <= limits['max_pixels']:
+            return factor
+
+    raise ImageTooLarge(
+        f"Image of {width}x{height} pixels exceeds the limit of {limits['max_pixels']} pixels",
+        {'limits': limits, 'image': {'width': width, 'height': height, 'bytes': size, 'format': image_format}},
+    )
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class DetectorConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "detector"
+
+    def ready(self):
+        from .authentication import connect_signals
+        connect_signals()
@@ -0,0 +1,101 @@
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+
+class UserStatusCache:
+    """
+    Кэш признака is_active пользователей с временем жизни TTL.
+
+    Отсутствующий пользователь кэшируется как неактивный. Записи ограничены по числу;
+    при переполнении удаляются самые старые.
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[1] <= time.monotonic():
+                return None
+            return entry[0]
+
+    def set(self, user_id, is_active):
+        with self._lock:
+            self._entries.pop(user_id, None)
+            while len(self._entries) >= self.max_entries:
+                # Словарь хранит порядок вставки, первый ключ - самая старая запись
+                del self._entries[next(iter(self._entries))]
+            self._entries[user_id] = (is_active, time.monotonic() + self.ttl)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_user_status_cache = None
+_user_status_cache_lock = threading.Lock()
+
+
+def get_user_status_cache():
+    global _user_status_cache
+    with _user_status_cache_lock:
+        if _user_status_cache is None:
+            options = settings.DETECTOR_AUTH
+            _user_status_cache = UserStatusCache(options['STATUS_CACHE_TTL'], options['STATUS_CACHE_SIZE'])
+        return _user_status_cache
+
+
+def user_is_active(user_id):
+    """Активен ли пользователь: из кэша, при промахе - одним запросом is_active к базе."""
+    cache = get_user_status_cache()
+    is_active = cache.get(user_id)
+    if is_active is None:
+        is_active = bool(
+            get_user_model().objects.filter(**{api_settings.USER_ID_FIELD: user_id})
+            .values_list('is_active', flat=True).first()
+        )
+        cache.set(user_id, is_active)
+    return is_active
+
+
+class DetectorJWTAuthentication(JWTStatelessUserAuthentication):
+    """
+    Аутентификация по JWT без загрузки пользователя из базы.
+
+    Подпись и срок действия токена проверяются как обычно, а request.user - это TokenUser
+    с id и username из claims токена. Удалённые и деактивированные пользователи
+    отклоняются по кэшу статусов, поэтому изменение is_active в других процессах
+    вступает в силу не позже чем через DETECTOR_AUTH['STATUS_CACHE_TTL'] секунд.
+    """
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        if not user_is_active(validated_token[api_settings.USER_ID_CLAIM]):
+            raise AuthenticationFailed('User is inactive or not found', code='user_inactive')
+        return user
+
+
+def _invalidate_user_status(sender, instance, **kwargs):
+    # В текущем процессе изменения пользователя применяются сразу, не дожидаясь TTL
+    get_user_status_cache().invalidate(getattr(instance, api_settings.USER_ID_FIELD))
+
+
+def connect_signals():
+    user_model = get_user_model()
+    post_save.connect(_invalidate_user_status, sender=user_model, dispatch_uid='detector_user_status_save')
+    post_delete.connect(_invalidate_user_status, sender=user_model, dispatch_uid='detector_user_status_delete')
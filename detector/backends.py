@@ -0,0 +1,134 @@
+import inspect
+
+import cv2
+import numpy as np
+from django.conf import settings
+
+from .cache import EXECUTION_PARAMS
+from .utils import Corners, detect_corners, detect_points_of_interest_reference, select_corners, strongest
+
+# Порог по умолчанию для бэкендов с откликом в других единицах, чем у Харриса
+SHI_TOMASI_THRESHOLD = 5000.0
+FAST_THRESHOLD = 20
+
+
+def detect_reference(gray_image, k=0.2, window_size=7, threshold=1500000.0):
+    """Исходная попиксельная реализация Харриса; медленная, для сверки результатов."""
+    points = np.array(detect_points_of_interest_reference(gray_image, k, window_size, threshold)).reshape(-1, 3)
+    return Corners(points[:, 0], points[:, 1], points[:, 2])
+
+
+def _opencv_response(gray_image, window_size, compute):
+    """
+    Карта отклика OpenCV в тех же координатах и единицах, что у harris_response.
+
+    Градиент OpenCV с апертурой 1 - разность соседей без деления на 2, а для float32
+    изображения он ещё делится на размер окна; отклик, степень градиента power,
+    пересчитывается обратно умножением на (window / 2) ** power.
+    """
+    offset = int(window_size / 2)
+    window = 2 * offset + 1
+    height, width = gray_image.shape
+    response, power = compute(np.float32(gray_image), window)
+    return response[offset:height - offset, offset:width - offset].astype(np.float64) * (window / 2) ** power
+
+
+def detect_opencv_harris(gray_image, k=0.2, window_size=7, threshold=1500000.0, nms_radius=0, max_points=None):
+    """
+    Харрис на cv2.cornerHarris. Отклик совпадает с бэкендом numpy с точностью float32,
+    кроме крайних строк и столбцов изображения, где OpenCV иначе считает градиент.
+    """
+    def compute(image, window):
+        return cv2.cornerHarris(image, window, 1, k, borderType=cv2.BORDER_REPLICATE), 4
+
+    offset = int(window_size / 2)
+    response = _opencv_response(gray_image, window_size, compute)
+    ys, xs, rs = select_corners(response, threshold, nms_radius, max_points)
+    return Corners(xs + offset, ys + offset, rs)
+
+
+def detect_shi_tomasi(gray_image, window_size=7, threshold=SHI_TOMASI_THRESHOLD, nms_radius=0, max_points=None):
+    """
+    Ши-Томаси (cv2.cornerMinEigenVal): отклик r - меньшее собственное значение матрицы
+    структуры в тех же единицах, что суммы квадратов градиента у Харриса.
+    """
+    def compute(image, window):
+        return cv2.cornerMinEigenVal(image, window, 1, borderType=cv2.BORDER_REPLICATE), 2
+
+    offset = int(window_size / 2)
+    response = _opencv_response(gray_image, window_size, compute)
+    ys, xs, rs = select_corners(response, threshold, nms_radius, max_points)
+    return Corners(xs + offset, ys + offset, rs)
+
+
+def detect_fast(gray_image, threshold=FAST_THRESHOLD, nms_radius=0, max_points=None):
+    """
+    FAST (cv2.FastFeatureDetector): threshold - разница яркости с центром в уровнях
+    0-255, отклик r - оценка угла FAST. Собственное подавление немаксимумов FAST
+    включено всегда, nms_radius дополнительно прореживает углы в квадрате радиуса.
+    """
+    detector = cv2.FastFeatureDetector_create(int(threshold), nonmaxSuppression=True)
+    keypoints = detector.detect(np.ascontiguousarray(gray_image))
+    xs = np.array([keypoint.pt[0] for keypoint in keypoints], dtype=np.int64)
+    ys = np.array([keypoint.pt[1] for keypoint in keypoints], dtype=np.int64)
+    rs = np.array([keypoint.response for keypoint in keypoints], dtype=np.float64)
+
+    if nms_radius > 0:
+        response = np.zeros(gray_image.shape, np.float64)
+        response[ys, xs] = rs
+        ys, xs, rs = select_corners(response, 0, nms_radius, max_points)
+    else:
+        order = np.lexsort((xs, ys))
+        ys, xs, rs = strongest(ys[order], xs[order], rs[order], max_points)
+    return Corners(xs, ys, rs)
+
+
+# Бэкенды детектора: функция (gray_image, **параметры) -> Corners. Набор параметров
+# и значения по умолчанию у каждого бэкенда свои и берутся из сигнатуры функции
+DETECTOR_BACKENDS = {
+    'reference': detect_reference,
+    'numpy': detect_corners,
+    'opencv_harris': detect_opencv_harris,
+    'shi_tomasi': detect_shi_tomasi,
+    'fast': detect_fast,
+}
+
+
+def get_backend(name=None):
+    name = name or settings.DETECTOR_BACKEND
+    if name not in DETECTOR_BACKENDS:
+        raise ValueError(f"Unknown detector backend: {name}")
+    return DETECTOR_BACKENDS[name]
+
+
+def backend_defaults(name=None):
+    """Параметры детекции бэкенда со значениями по умолчанию, без параметров исполнения."""
+    return {
+        param: parameter.default
+        for param, parameter in inspect.signature(get_backend(name)).parameters.items()
+        if parameter.default is not inspect.Parameter.empty and param not in EXECUTION_PARAMS
+    }
+
+
+def unsupported_params(name, params):
+    defaults = backend_defaults(name)
+    return [param for param in params if param not in defaults and param not in EXECUTION_PARAMS]
+
+
+def resolve_params(name, params):
+    """Полный набор параметров детекции бэкенда: переданные значения поверх значений по умолчанию."""
+    return {**backend_defaults(name), **{param: value for param, value in params.items() if param not in EXECUTION_PARAMS}}
+
+
+def detect_with_backend(gray_image, backend=None, **params):
+    """
+    Детекция выбранным бэкендом (по умолчанию DETECTOR_BACKEND). Параметры исполнения
+    (workers, low_memory) передаются только бэкендам, которые их принимают;
+    параметр, не поддерживаемый бэкендом, - ValueError.
+    """
+    detect = get_backend(backend)
+    unsupported = unsupported_params(backend, params)
+    if unsupported:
+        raise ValueError(f"Backend {backend or settings.DETECTOR_BACKEND} does not support: {', '.join(unsupported)}")
+    accepted = inspect.signature(detect).parameters
+    return detect(gray_image, **{param: value for param, value in params.items() if param in accepted})
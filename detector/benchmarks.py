@@ -0,0 +1,269 @@
+import glob
+import io
+import os
+import platform
+import time
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from .backends import DETECTOR_BACKENDS, detect_with_backend
+from .cache import get_detection_cache
+from .utils import process_image, decode_image, detect_corners, detect_points_of_interest
+from .views import ImageProcessingView
+
+# Размеры синтетических изображений (высота, ширина): от 256x256 до 8K UHD
+SYNTHETIC_SIZES = [(256, 256), (512, 512), (1024, 1024), (2048, 2048), (2160, 3840), (4320, 7680)]
+WINDOW_SIZES = [3, 7, 15, 31]
+# Изображение, на котором сравниваются размеры окна
+WINDOW_BENCHMARK_SIZE = (1024, 1024)
+# Размеры для сравнения бэкендов; попиксельный reference замеряется только на первом
+BACKEND_BENCHMARK_SIZES = [(256, 256), (1024, 1024), (2160, 3840)]
+
+SUITES = ['detect', 'decode', 'serialize', 'request', 'fast-mode', 'backends']
+DEFAULT_SUITES = ['detect', 'decode', 'serialize', 'request']
+
+
+def load_input_images(pattern=None):
+    """Изображения из input/*.png в оттенках серого: список пар (имя файла, массив)."""
+    pattern = pattern or os.path.join(settings.INPUT_DIR, '*.png')
+    return [(os.path.basename(path), process_image(path)) for path in sorted(glob.glob(pattern))]
+
+
+def input_image_paths(pattern=None):
+    return sorted(glob.glob(pattern or os.path.join(settings.INPUT_DIR, '*.png')))
+
+
+def synthetic_image(height, width, cell=16, seed=0):
+    """Воспроизводимое изображение из случайных серых прямоугольников cell x cell - много углов."""
+    rng = np.random.default_rng(seed)
+    cells = rng.integers(0, 256, (max(height // cell, 1), max(width // cell, 1)), dtype=np.uint8)
+    return cv2.resize(cells, (width, height), interpolation=cv2.INTER_NEAREST)
+
+
+def run_timed(func, repeat=3, setup=None):
+    """Времена repeat вызовов func в секундах и результат последнего вызова; setup не входит в замер."""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return timings, result
+
+
+def measure(func, repeat=3):
+    """Медианное время вызова func в секундах и результат последнего вызова."""
+    timings, result = run_timed(func, repeat)
+    return float(np.median(timings)), result
+
+
+def timing_entry(func, repeat, setup=None, **info):
+    """Запись отчёта для одного замера: медиана и минимум в миллисекундах и доп. сведения."""
+    timings, _ = run_timed(func, repeat, setup)
+    return {
+        'median_ms': float(np.median(timings)) * 1000,
+        'min_ms': float(np.min(timings)) * 1000,
+        'runs': repeat,
+        **info,
+    }
+
+
+def benchmark_detect(repeat=3, sizes=None, window_sizes=None):
+    """detect_points_of_interest на входных изображениях, синтетических размерах и разных окнах."""
+    results = {}
+    for name, gray_image in load_input_images():
+        results[f'detect/input/{name}'] = timing_entry(
+            lambda: detect_points_of_interest(gray_image), repeat, pixels=gray_image.size
+        )
+    for height, width in sizes or SYNTHETIC_SIZES:
+        gray_image = synthetic_image(height, width)
+        results[f'detect/synthetic/{width}x{height}'] = timing_entry(
+            lambda: detect_points_of_interest(gray_image), repeat, pixels=gray_image.size
+        )
+        results[f'detect/low-memory/{width}x{height}'] = timing_entry(
+            lambda: detect_points_of_interest(gray_image, low_memory=True), repeat, pixels=gray_image.size
+        )
+    gray_image = synthetic_image(*WINDOW_BENCHMARK_SIZE)
+    for window_size in window_sizes or WINDOW_SIZES:
+        results[f'detect/window/{window_size}'] = timing_entry(
+            lambda: detect_points_of_interest(gray_image, window_size=window_size), repeat, pixels=gray_image.size
+        )
+    return results
+
+
+def benchmark_decode(repeat=3):
+    """Декодирование загрузки в оттенки серого (decode_image) для каждого входного изображения."""
+    results = {}
+    for path in input_image_paths():
+        with open(path, 'rb') as image_file:
+            content = image_file.read()
+        results[f'decode/input/{os.path.basename(path)}'] = timing_entry(
+            lambda: decode_image(io.BytesIO(content)), repeat, bytes=len(content)
+        )
+    return results
+
+
+def benchmark_serialize(repeat=3):
+    """
+    Рендеринг ответа с углами входных изображений рендерером, который ImageProcessingView
+    использует по умолчанию.
+    """
+    renderer = ImageProcessingView.renderer_classes[0]()
+    results = {}
+    for name, gray_image in load_input_images():
+        data = {'points_of_interest': detect_corners(gray_image)}
+        results[f'serialize/input/{name}'] = timing_entry(
+            lambda: renderer.render(data), repeat, points=len(data['points_of_interest'])
+        )
+    return results
+
+
+def benchmark_request(repeat=3):
+    """
+    Полный запрос к /api/process-image/ через тестовый клиент DRF: разбор multipart,
+    декодирование, детекция и рендеринг ответа. Кэш детекции очищается перед каждым
+    запросом, поэтому измеряется путь без попадания в кэш.
+    """
+    client = APIClient()
+    # Пользователь не сохраняется в базу: аутентификация подставляется клиентом
+    client.force_authenticate(user=User(username='benchmark'))
+    url = reverse('image_processing_view')
+    cache = get_detection_cache()
+    results = {}
+    with override_settings(ALLOWED_HOSTS=['testserver']):
+        for path in input_image_paths():
+            with open(path, 'rb') as image_file:
+                content = image_file.read()
+            name = os.path.basename(path)
+
+            def post():
+                upload = SimpleUploadedFile(name, content, content_type='image/png')
+                response = client.post(url, {'image': upload}, format='multipart')
+                if response.status_code != 200:
+                    raise RuntimeError(f'{url} returned {response.status_code} for {name}')
+
+            results[f'request/process-image/{name}'] = timing_entry(post, repeat, setup=cache.clear, bytes=len(content))
+    return results
+
+
+def benchmark_fast_mode(images, repeat=3, **detection_params):
+    """
+    Сравнение режима fast с полным детектором: ускорение и полнота (доля углов
+    полного детектора, найденных в режиме fast) по каждому изображению и в сумме.
+    """
+    rows = []
+    for name, gray_image in images:
+        full_time, full = measure(lambda: detect_corners(gray_image, **detection_params), repeat)
+        fast_time, fast = measure(lambda: detect_corners(gray_image, mode='fast', **detection_params), repeat)
+        found = len(set(zip(fast.x.tolist(), fast.y.tolist())) & set(zip(full.x.tolist(), full.y.tolist())))
+        rows.append({
+            'image': name,
+            'shape': list(gray_image.shape),
+            'full_ms': full_time * 1000,
+            'fast_ms': fast_time * 1000,
+            'speedup': full_time / fast_time if fast_time else None,
+            'full_corners': len(full),
+            'fast_corners': len(fast),
+            'recall': found / len(full) if len(full) else 1.0,
+        })
+
+    full_total = sum(row['full_ms'] for row in rows)
+    fast_total = sum(row['fast_ms'] for row in rows)
+    full_corners = sum(row['full_corners'] for row in rows)
+    return {
+        'images': rows,
+        'speedup': full_total / fast_total if fast_total else None,
+        'recall': sum(row['recall'] * row['full_corners'] for row in rows) / full_corners if full_corners else 1.0,
+    }
+
+
+def benchmark_fast_mode_suite(repeat=3):
+    results = {}
+    for row in benchmark_fast_mode(load_input_images(), repeat)['images']:
+        results[f"fast-mode/full/{row['image']}"] = {'median_ms': row['full_ms'], 'runs': repeat}
+        results[f"fast-mode/fast/{row['image']}"] = {
+            'median_ms': row['fast_ms'], 'runs': repeat, 'speedup': row['speedup'], 'recall': row['recall'],
+        }
+    return results
+
+
+def benchmark_backends(repeat=3, sizes=None):
+    """
+    Все бэкенды детектора с параметрами по умолчанию на синтетических изображениях:
+    время, пропускная способность в мегапикселях в секунду и число углов.
+    """
+    sizes = sizes or BACKEND_BENCHMARK_SIZES
+    results = {}
+    for backend in DETECTOR_BACKENDS:
+        # Попиксельная реализация обрабатывает 256x256 около секунды, большие размеры не замеряются
+        for height, width in sizes[:1] if backend == 'reference' else sizes:
+            gray_image = synthetic_image(height, width)
+            elapsed, corners = measure(lambda: detect_with_backend(gray_image, backend), repeat)
+            results[f'backends/{backend}/{width}x{height}'] = {
+                'median_ms': elapsed * 1000,
+                'runs': repeat,
+                'megapixels_per_s': gray_image.size / elapsed / 1e6 if elapsed else None,
+                'corners': len(corners),
+            }
+    return results
+
+
+def environment_info():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'detector_workers': settings.DETECTOR_WORKERS,
+        'detector_backend': settings.DETECTOR_BACKEND,
+    }
+
+
+def run_benchmarks(suites=None, repeat=3, sizes=None, window_sizes=None):
+    """Запускает наборы замеров и возвращает отчёт {'environment': ..., 'benchmarks': {имя: замер}}."""
+    benchmarks = {}
+    for suite in suites or DEFAULT_SUITES:
+        if suite == 'detect':
+            benchmarks.update(benchmark_detect(repeat, sizes, window_sizes))
+        elif suite == 'decode':
+            benchmarks.update(benchmark_decode(repeat))
+        elif suite == 'serialize':
+            benchmarks.update(benchmark_serialize(repeat))
+        elif suite == 'request':
+            benchmarks.update(benchmark_request(repeat))
+        elif suite == 'fast-mode':
+            benchmarks.update(benchmark_fast_mode_suite(repeat))
+        elif suite == 'backends':
+            benchmarks.update(benchmark_backends(repeat, sizes))
+        else:
+            raise ValueError(f'Unknown benchmark suite: {suite}')
+    return {'environment': environment_info(), 'repeat': repeat, 'benchmarks': benchmarks}
+
+
+def compare_with_baseline(report, baseline, threshold=0.2):
+    """
+    Сравнивает медианы с базовым отчётом. Возвращает список регрессий - замеров,
+    ставших медленнее базовых более чем на threshold (0.2 = на 20%). Замеры,
+    отсутствующие в базовом отчёте, не сравниваются.
+    """
+    regressions = []
+    for name, entry in report['benchmarks'].items():
+        base = baseline.get('benchmarks', {}).get(name)
+        if not base or not base.get('median_ms'):
+            continue
+        ratio = entry['median_ms'] / base['median_ms']
+        if ratio > 1 + threshold:
+            regressions.append({
+                'name': name, 'baseline_ms': base['median_ms'], 'current_ms': entry['median_ms'], 'ratio': ratio,
+            })
+    return regressions
@@ -0,0 +1,141 @@
+import hashlib
+import inspect
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+
+from .utils import Corners, detect_points_of_interest
+
+# Параметры, от которых не зависит результат детекции, в ключ кэша не входят
+EXECUTION_PARAMS = ('workers', 'low_memory')
+
+# Значения параметров детектора по умолчанию: запрос без параметра и запрос
+# с явно переданным значением по умолчанию должны попадать в одну запись кэша
+DEFAULT_DETECTION_PARAMS = {
+    name: parameter.default
+    for name, parameter in inspect.signature(detect_points_of_interest).parameters.items()
+    if parameter.default is not inspect.Parameter.empty and name not in EXECUTION_PARAMS
+}
+
+# Оценка памяти на одну точку [x, y, r] в виде списка Python: сам список и три числа
+POINT_SIZE_ESTIMATE = 168
+
+
+def estimate_size(points):
+    if isinstance(points, Corners):
+        return 256 + points.nbytes
+    return 64 + POINT_SIZE_ESTIMATE * len(points)
+
+
+class DetectionCache:
+    """
+    Кэш результатов детекции по хэшу пикселей изображения и параметрам детектора.
+
+    Первый уровень - LRU в памяти процесса с ограничением по объёму, второй
+    (необязательный) - бэкенд кэша Django, общий для всех воркеров gunicorn.
+    """
+
+    def __init__(self, max_bytes, shared_alias=None, shared_timeout=None):
+        self.max_bytes = max_bytes
+        self.shared_alias = shared_alias
+        self.shared_timeout = shared_timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(gray_image, params):
+        params = {**DEFAULT_DETECTION_PARAMS, **params}
+        # Массивы среди параметров (маска областей интереса) хэшируются по содержимому, а не по repr
+        arrays = sorted((name, np.ascontiguousarray(value)) for name, value in params.items()
+                        if isinstance(value, np.ndarray))
+        params.update((name, (value.shape, value.dtype.str)) for name, value in arrays)
+        pixels = np.ascontiguousarray(gray_image)
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(repr((pixels.shape, pixels.dtype.str, sorted(params.items()))).encode())
+        digest.update(memoryview(pixels).cast('B'))
+        for _, value in arrays:
+            digest.update(memoryview(value).cast('B'))
+        return 'detector:' + digest.hexdigest()
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias] if self.shared_alias else None
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+        points = self.shared.get(key) if self.shared is not None else None
+        with self._lock:
+            if points is None:
+                self.misses += 1
+                return None
+            self.shared_hits += 1
+        self._store(key, points)
+        return points
+
+    def set(self, key, points):
+        self._store(key, points)
+        if self.shared is not None:
+            self.shared.set(key, points, self.shared_timeout)
+
+    def _store(self, key, points):
+        size = estimate_size(points)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous[1]
+            self._entries[key] = (points, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+            self.hits = self.shared_hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+            }
+
+
+_detection_cache = None
+_detection_cache_lock = threading.Lock()
+
+
+def get_detection_cache():
+    global _detection_cache
+    with _detection_cache_lock:
+        if _detection_cache is None:
+            options = settings.DETECTOR_CACHE
+            _detection_cache = DetectionCache(
+                max_bytes=options['MAX_BYTES'],
+                shared_alias=options.get('SHARED_ALIAS'),
+                shared_timeout=options.get('SHARED_TIMEOUT'),
+            )
+        return _detection_cache
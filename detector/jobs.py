@@ -0,0 +1,199 @@
+import io
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.db.models import F
+from django.utils import timezone
+
+from .admission import admit_upload
+from .models import DetectionJob
+from .pipeline import detect_gray_image, finish_detection
+from .utils import decode_image
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    pass
+
+
+def submit_job(image_file, params, priority=0, user_id=None):
+    """
+    Ставит загрузку в очередь заданий. Если в очереди уже MAX_QUEUE_DEPTH
+    заданий, выбрасывает QueueFull.
+    """
+    max_depth = settings.DETECTOR_JOBS['MAX_QUEUE_DEPTH']
+    if DetectionJob.objects.filter(status=DetectionJob.QUEUED).count() >= max_depth:
+        raise QueueFull(f'Job queue is full ({max_depth} queued jobs)')
+
+    image_file.seek(0)
+    return DetectionJob.objects.create(
+        user_id=user_id,
+        priority=priority,
+        image_name=image_file.name or '',
+        image=image_file.read(),
+        params=params,
+    )
+
+
+def _lease_deadline():
+    return timezone.now() + timedelta(seconds=settings.DETECTOR_JOBS['LEASE_TIMEOUT'])
+
+
+def requeue_expired_leases():
+    """
+    Возвращает в очередь выполняющиеся задания с истёкшей арендой: их воркер завершился
+    или завис и больше её не продлевает. Задание, захваченное уже MAX_ATTEMPTS раз,
+    помечается как failed, чтобы изображение, на котором падает воркер, не перезапускалось
+    бесконечно. Возвращает число заданий, снова поставленных в очередь.
+    """
+    now = timezone.now()
+    max_attempts = settings.DETECTOR_JOBS['MAX_ATTEMPTS']
+    expired = DetectionJob.objects.filter(status=DetectionJob.RUNNING, lease_expires_at__lt=now)
+    failed = expired.filter(attempts__gte=max_attempts).update(
+        status=DetectionJob.FAILED, error=f'Job lease expired {max_attempts} times', image=b'',
+        finished_at=now, lease_expires_at=None,
+    )
+    requeued = expired.filter(attempts__lt=max_attempts).update(
+        status=DetectionJob.QUEUED, started_at=None, lease_expires_at=None
+    )
+    if failed or requeued:
+        logger.warning('Requeued %d and failed %d detection jobs with expired leases', requeued, failed)
+    return requeued
+
+
+def claim_next_job():
+    """
+    Забирает из очереди задание с наибольшим приоритетом (при равенстве - самое старое),
+    предварительно вернув в очередь задания с истёкшей арендой.
+
+    Захват выполняется условным UPDATE по статусу, поэтому одно задание не достанется
+    двум воркерам одновременно ни на SQLite, ни на PostgreSQL. Захват выдаёт аренду
+    на LEASE_TIMEOUT секунд и увеличивает attempts.
+    """
+    requeue_expired_leases()
+    while True:
+        job = (
+            DetectionJob.objects.filter(status=DetectionJob.QUEUED)
+            .order_by('-priority', 'created_at')
+            .only('id')
+            .first()
+        )
+        if job is None:
+            return None
+        claimed = DetectionJob.objects.filter(pk=job.pk, status=DetectionJob.QUEUED).update(
+            status=DetectionJob.RUNNING, started_at=timezone.now(), lease_expires_at=_lease_deadline(),
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return DetectionJob.objects.get(pk=job.pk)
+
+
+def _owned(job):
+    # Задание принадлежит воркеру, пока оно выполняется и не было захвачено повторно
+    return DetectionJob.objects.filter(pk=job.pk, status=DetectionJob.RUNNING, attempts=job.attempts)
+
+
+def renew_lease(job):
+    """Продлевает аренду задания; False, если задание уже вернули в очередь или захватили заново."""
+    return bool(_owned(job).update(lease_expires_at=_lease_deadline()))
+
+
+@contextmanager
+def lease_heartbeat(job):
+    """Продлевает аренду задания из фонового потока каждые LEASE_TIMEOUT / 3 секунд."""
+    stop = threading.Event()
+    interval = settings.DETECTOR_JOBS['LEASE_TIMEOUT'] / 3
+
+    def beat():
+        try:
+            while not stop.wait(interval) and renew_lease(job):
+                pass
+        finally:
+            # Поток открывает собственное подключение к базе
+            connections.close_all()
+
+    thread = threading.Thread(target=beat, name=f'detection-job-lease-{job.pk}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_job(job):
+    params = dict(job.params)
+    reduce = params.pop('reduce', 1)
+    try:
+        with lease_heartbeat(job):
+            image_file = io.BytesIO(job.image)
+            reduce = admit_upload(image_file, reduce)
+            gray_image = decode_image(image_file, reduce)
+            points_of_interest = detect_gray_image(gray_image, reduce=reduce, **params)
+            job.result = finish_detection(job.image_name, points_of_interest, reduce).tolist()
+        job.status = DetectionJob.DONE
+    except Exception as e:
+        logger.exception('Detection job %s failed', job.pk)
+        job.error = str(e)
+        job.status = DetectionJob.FAILED
+    job.image = b''
+    job.finished_at = timezone.now()
+    job.lease_expires_at = None
+    # Если аренда истекла и задание уже выполняет другой воркер, результат не записывается
+    if not _owned(job).update(
+        result=job.result, error=job.error, status=job.status, image=b'', finished_at=job.finished_at,
+        lease_expires_at=None,
+    ):
+        logger.warning('Detection job %s lost its lease before finishing; result discarded', job.pk)
+    return job
+
+
+def process_next_job():
+    job = claim_next_job()
+    if job is None:
+        return None
+    return run_job(job)
+
+
+def expired_jobs():
+    deadline = timezone.now() - timedelta(seconds=settings.DETECTOR_JOBS['RESULT_TTL'])
+    return DetectionJob.objects.filter(
+        status__in=[DetectionJob.DONE, DetectionJob.FAILED], finished_at__lt=deadline
+    )
+
+
+def cleanup_expired_jobs():
+    deleted, _ = expired_jobs().delete()
+    return deleted
+
+
+def run_worker(poll_interval=1.0, cleanup_interval=60.0, max_jobs=None, stop_event=None):
+    """
+    Цикл воркера: выполняет задания из очереди, при пустой очереди ждёт poll_interval
+    и раз в cleanup_interval удаляет завершённые задания с истёкшим RESULT_TTL.
+    """
+    processed = 0
+    last_cleanup = 0.0
+    while stop_event is None or not stop_event.is_set():
+        close_old_connections()
+        if time.monotonic() - last_cleanup >= cleanup_interval:
+            cleanup_expired_jobs()
+            last_cleanup = time.monotonic()
+
+        job = process_next_job()
+        if job is None:
+            if max_jobs is not None:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        processed += 1
+        if max_jobs is not None and processed >= max_jobs:
+            break
+    return processed
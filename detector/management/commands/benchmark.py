@@ -0,0 +1,68 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from detector.benchmarks import SUITES, DEFAULT_SUITES, run_benchmarks, compare_with_baseline
+
+
+def parse_size(value):
+    width, _, height = value.lower().partition('x')
+    return int(height or width), int(width)
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks the point of interest detector: detection, decoding, serialization and full requests. '
+        'Writes a JSON report and fails when a stored baseline is exceeded by more than --threshold.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('suites', nargs='*', metavar='suite',
+                            help=f'Benchmarks to run: {", ".join(SUITES)} (default: {" ".join(DEFAULT_SUITES)}).')
+        parser.add_argument('--repeat', type=int, default=3, help='Timed runs per measurement; the median is reported.')
+        parser.add_argument('--sizes', nargs='+', type=parse_size,
+                            help='Synthetic image sizes as WIDTHxHEIGHT (default: 256x256 up to 7680x4320).')
+        parser.add_argument('--window-sizes', nargs='+', type=int, help='Window sizes for the detect suite.')
+        parser.add_argument('--output', help='Write the JSON report to this file.')
+        parser.add_argument('--baseline', help='JSON report to compare against.')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Allowed slowdown against the baseline as a fraction (default: 0.2 = 20%%).')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1')
+        unknown = set(options['suites']) - set(SUITES)
+        if unknown:
+            raise CommandError(f'Unknown benchmark suites: {", ".join(sorted(unknown))}')
+
+        report = run_benchmarks(
+            options['suites'], options['repeat'], sizes=options['sizes'], window_sizes=options['window_sizes']
+        )
+        for name, entry in report['benchmarks'].items():
+            extra = ''.join(f'  {key} {value:.3f}' for key, value in entry.items() if key in ('speedup', 'recall'))
+            self.stdout.write(f"{name:<44} {entry['median_ms']:10.2f} ms{extra}")
+
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                json.dump(report, report_file, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
+
+        if options['baseline']:
+            self.check_baseline(report, options['baseline'], options['threshold'])
+
+    def check_baseline(self, report, baseline_path, threshold):
+        try:
+            with open(baseline_path) as baseline_file:
+                baseline = json.load(baseline_file)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Cannot read baseline {baseline_path}: {e}')
+
+        regressions = compare_with_baseline(report, baseline, threshold)
+        for regression in regressions:
+            self.stderr.write(
+                f"{regression['name']}: {regression['current_ms']:.2f} ms vs baseline "
+                f"{regression['baseline_ms']:.2f} ms ({regression['ratio']:.2f}x)"
+            )
+        if regressions:
+            raise CommandError(f'{len(regressions)} benchmarks regressed by more than {threshold:.0%}')
+        self.stdout.write(f'No regressions against {baseline_path}')
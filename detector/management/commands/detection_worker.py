@@ -0,0 +1,59 @@
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from detector.jobs import run_worker
+
+
+def _worker_process(options):
+    # Дочерний процесс открывает собственные подключения к базе
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    run_worker(poll_interval=options['poll_interval'], cleanup_interval=options['cleanup_interval'])
+
+
+class Command(BaseCommand):
+    help = 'Runs a local pool of worker processes that execute queued detection jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='Number of worker processes.')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--cleanup-interval', type=float, default=60.0,
+                            help='Seconds between removals of expired finished jobs.')
+        parser.add_argument('--once', action='store_true', help='Process queued jobs in this process and exit.')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            processed = run_worker(cleanup_interval=0, max_jobs=float('inf'))
+            self.stdout.write(f'Processed {processed} jobs')
+            return
+
+        if options['processes'] <= 1:
+            self.stdout.write('Starting detection worker')
+            try:
+                run_worker(poll_interval=options['poll_interval'], cleanup_interval=options['cleanup_interval'])
+            except KeyboardInterrupt:
+                pass
+            return
+
+        self.run_pool(options)
+
+    def run_pool(self, options):
+        # Подключения родителя не должны наследоваться дочерними процессами
+        connections.close_all()
+        workers = [
+            multiprocessing.Process(target=_worker_process, args=(options,), name=f'detection-worker-{index}')
+            for index in range(options['processes'])
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f'Started {len(workers)} detection worker processes')
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
+            for worker in workers:
+                worker.join()
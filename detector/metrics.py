@@ -0,0 +1,179 @@
+import contextvars
+import math
+import threading
+import time
+
+from django.conf import settings
+
+# Границы корзин гистограмм (верхние, включительно), как в клиентах Prometheus
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PIXEL_BUCKETS = (16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+CORNER_BUCKETS = (0, 10, 100, 1000, 10000, 100000, 1000000)
+
+# Замеры стадий текущего запроса; None - запрос не инструментируется
+_current_timings = contextvars.ContextVar('detector_stage_timings', default=None)
+
+
+def metrics_enabled():
+    return settings.DETECTOR_METRICS['ENABLED']
+
+
+class StageTimings:
+    """Суммарное время по стадиям одного запроса в порядке первого появления стадии."""
+
+    def __init__(self):
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        # Полосы отклика Харриса считаются в нескольких потоках одновременно
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def server_timing(self, total=None):
+        """Значение заголовка Server-Timing: длительности стадий и, если задан, всего запроса в миллисекундах."""
+        stages = list(self.stages.items())
+        if total is not None:
+            stages.append(('total', total))
+        return ', '.join(f'{name};dur={seconds * 1000:.2f}' for name, seconds in stages)
+
+
+class _Stage:
+    __slots__ = ('timings', 'name', 'start')
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timings.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name):
+    """
+    Контекстный менеджер замера стадии. Вне инструментируемого запроса возвращается
+    общий пустой менеджер, поэтому выключенная инструментация стоит одного чтения contextvar.
+    """
+    timings = _current_timings.get()
+    if timings is None:
+        return _NULL_STAGE
+    return _Stage(timings, name)
+
+
+def start_timings():
+    """Начинает сбор замеров стадий в текущем контексте; возвращает (замеры, токен для finish_timings)."""
+    timings = StageTimings()
+    return timings, _current_timings.set(timings)
+
+
+def finish_timings(token):
+    _current_timings.reset(token)
+
+
+class Histogram:
+    """Гистограмма Prometheus с метками: накопительные корзины, сумма и число наблюдений."""
+
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets) + (math.inf,)
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((key, [list(counts), total, count]) for key, (counts, total, count) in self._series.items())
+        for key, (counts, total, count) in series:
+            labels = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == math.inf else repr(float(bound))
+                bucket_labels = ','.join(labels + ['le="{}"'.format(le)])
+                lines.append(f'{self.name}_bucket{{{bucket_labels}}} {cumulative}')
+            suffix = '{' + ','.join(labels) + '}' if labels else ''
+            lines.append(f'{self.name}_sum{suffix} {total!r}')
+            lines.append(f'{self.name}_count{suffix} {count}')
+        return lines
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+STAGE_SECONDS = Histogram(
+    'detector_stage_seconds', 'Time spent in each stage of a detection request.', LATENCY_BUCKETS, ('view', 'stage')
+)
+REQUEST_SECONDS = Histogram(
+    'detector_request_seconds', 'Total time of a detection request.', LATENCY_BUCKETS, ('view', 'status')
+)
+IMAGE_PIXELS = Histogram('detector_image_pixels', 'Pixels in decoded grayscale images.', PIXEL_BUCKETS)
+CORNER_COUNT = Histogram('detector_corners', 'Corners returned per image.', CORNER_BUCKETS)
+
+HISTOGRAMS = [STAGE_SECONDS, REQUEST_SECONDS, IMAGE_PIXELS, CORNER_COUNT]
+
+
+def observe_request(view, status, timings, total):
+    for name, seconds in timings.stages.items():
+        STAGE_SECONDS.observe(seconds, view=view, stage=name)
+    REQUEST_SECONDS.observe(total, view=view, status=status)
+
+
+def observe_image(gray_image):
+    if metrics_enabled():
+        IMAGE_PIXELS.observe(gray_image.size)
+
+
+def observe_corners(points_of_interest):
+    if metrics_enabled():
+        CORNER_COUNT.observe(len(points_of_interest))
+
+
+def expose(gauges=()):
+    """
+    Все метрики процесса в текстовом формате Prometheus. gauges - дополнительные
+    значения (имя, описание, тип, значение), например статистика кэша детекции.
+    """
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.expose())
+    for name, documentation, metric_type, value in gauges:
+        lines.extend([f'# HELP {name} {documentation}', f'# TYPE {name} {metric_type}', f'{name} {value}'])
+    return '\n'.join(lines) + '\n'
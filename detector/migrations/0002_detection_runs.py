@@ -0,0 +1,55 @@
+# Generated by Django 3.2.25 on 2026-10-17 23:32
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('detector', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DetectionRun',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('image_hash', models.CharField(max_length=64)),
+                ('image_name', models.CharField(blank=True, max_length=255)),
+                ('params', models.JSONField(blank=True, default=dict)),
+                ('point_count', models.IntegerField(default=0)),
+                ('tile_size', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='detection_runs', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DetectionTile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tile_x', models.IntegerField()),
+                ('tile_y', models.IntegerField()),
+                ('count', models.IntegerField()),
+                ('max_r', models.FloatField()),
+                ('min_r', models.FloatField()),
+                ('points', models.BinaryField()),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tiles', to='detector.detectionrun')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='detectiontile',
+            index=models.Index(fields=['run', '-max_r'], name='detector_tile_strength_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='detectiontile',
+            constraint=models.UniqueConstraint(fields=('run', 'tile_y', 'tile_x'), name='detector_tile_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='detectionrun',
+            index=models.Index(fields=['user', 'image_hash'], name='detector_run_image_idx'),
+        ),
+    ]
@@ -0,0 +1,98 @@
+import uuid
+
+from django.conf import settings
+from django.db import models
+
+
+class DetectionJob(models.Model):
+    """
+    Задание на асинхронную детекцию. Загруженный файл хранится в исходном
+    (сжатом) виде до выполнения задания и удаляется после него.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.CASCADE, related_name='detection_jobs'
+    )
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    priority = models.SmallIntegerField(default=0)
+    image_name = models.CharField(max_length=255, blank=True)
+    image = models.BinaryField(blank=True)
+    params = models.JSONField(default=dict, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Аренда выполняющегося задания: воркер продлевает её, пока работает; задание с
+    # истёкшей арендой возвращается в очередь. attempts - номер захвата задания воркером
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', '-priority', 'created_at'], name='detector_job_queue_idx'),
+            models.Index(fields=['status', 'finished_at'], name='detector_job_finished_idx'),
+            models.Index(fields=['status', 'lease_expires_at'], name='detector_job_lease_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.image_name} ({self.status})'
+
+
+class DetectionRun(models.Model):
+    """
+    Сохранённый результат детекции: хэш загруженного файла, параметры и углы,
+    разложенные по тайлам сетки (DetectionTile) для выборок по прямоугольнику.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.CASCADE, related_name='detection_runs'
+    )
+    image_hash = models.CharField(max_length=64)
+    image_name = models.CharField(max_length=255, blank=True)
+    params = models.JSONField(default=dict, blank=True)
+    point_count = models.IntegerField(default=0)
+    tile_size = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'image_hash'], name='detector_run_image_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.image_name} ({self.point_count} points)'
+
+
+class DetectionTile(models.Model):
+    """
+    Углы одного тайла tile_size x tile_size сохранённого результата: упакованный массив
+    x (<i4), y (<i4), r (<f8), отсортированный по убыванию отклика. max_r и min_r
+    позволяют пропускать тайлы, не читая их точки.
+    """
+    run = models.ForeignKey(DetectionRun, on_delete=models.CASCADE, related_name='tiles')
+    tile_x = models.IntegerField()
+    tile_y = models.IntegerField()
+    count = models.IntegerField()
+    max_r = models.FloatField()
+    min_r = models.FloatField()
+    points = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['run', 'tile_y', 'tile_x'], name='detector_tile_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['run', '-max_r'], name='detector_tile_strength_idx'),
+        ]
@@ -0,0 +1,316 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .admission import ImageTooLarge, admit_upload, read_image_header, reduced_pixels
+from .backends import detect_with_backend, resolve_params
+from .cache import get_detection_cache
+from .metrics import stage, observe_image, observe_corners
+from .responses import get_response_map_store
+from .sinks import get_result_sink
+from .streaming import detect_points_of_interest_streaming
+from .tracking import track_points_of_interest, sequence_summary
+from .utils import decode_image
+
+
+def scale_rois(rois, reduce):
+    """
+    Прямоугольники (x, y, width, height) исходного изображения в координатах изображения,
+    декодированного с уменьшением reduce: угол (x, y) уменьшенного изображения попадает
+    в прямоугольник, если в него попадает (x * reduce, y * reduce).
+    """
+    scaled = []
+    for x, y, width, height in rois:
+        left, top = -(-x // reduce), -(-y // reduce)
+        scaled.append([left, top, -(-(x + width) // reduce) - left, -(-(y + height) // reduce) - top])
+    return scaled
+
+
+def decode_mask(mask_file, image_file, reduce=1):
+    """Маска областей интереса того же размера, что изображение; размеры сверяются по заголовкам до декодирования."""
+    if read_image_header(mask_file)[:2] != read_image_header(image_file)[:2]:
+        raise ValueError("Mask size must match the image size.")
+    return decode_image(mask_file, reduce) != 0
+
+
+def detect_gray_image(gray_image, backend=None, reduce=1, **detection_params):
+    """
+    Детекция бэкендом backend (по умолчанию DETECTOR_BACKEND) с учётом кэша результатов.
+    reduce - уменьшение при декодировании, в нём пересчитываются rois. Возвращает Corners.
+    """
+    observe_image(gray_image)
+    if reduce > 1 and detection_params.get('rois'):
+        detection_params['rois'] = scale_rois(detection_params['rois'], reduce)
+    backend = backend or settings.DETECTOR_BACKEND
+    cache = get_detection_cache()
+    with stage('cache'):
+        # Значения по умолчанию у бэкендов разные, поэтому в ключ входят уже разрешённые параметры
+        cache_key = cache.make_key(gray_image, {'backend': backend, **resolve_params(backend, detection_params)})
+        points_of_interest = cache.get(cache_key)
+    if points_of_interest is None:
+        points_of_interest = detect_with_backend(
+            gray_image, backend, workers=settings.DETECTOR_WORKERS, low_memory=settings.DETECTOR_LOW_MEMORY,
+            **detection_params
+        )
+        cache.set(cache_key, points_of_interest)
+    return points_of_interest
+
+
+def finish_detection(name, points_of_interest, reduce=1):
+    """Пересчёт координат в исходное разрешение и передача результата в sink."""
+    if reduce > 1:
+        points_of_interest = points_of_interest.scaled(reduce)
+    observe_corners(points_of_interest)
+    with stage('sink'):
+        get_result_sink().submit(name, points_of_interest)
+    return points_of_interest
+
+
+def detect_upload(image_file, reduce=1, **detection_params):
+    """
+    Полный путь обработки одной загрузки: допуск по заголовку, декодирование, кэш, детекция, sink.
+
+    ImageTooLarge означает, что загрузка превышает лимиты DETECTOR_ADMISSION,
+    ValueError - что её не удалось декодировать.
+    """
+    with stage('admission'):
+        reduce = admit_upload(image_file, reduce)
+    gray_image = decode_image(image_file, reduce)
+    if detection_params.get('mask') is not None:
+        detection_params['mask'] = decode_mask(detection_params['mask'], image_file, reduce)
+    points_of_interest = detect_gray_image(gray_image, reduce=reduce, **detection_params)
+    return finish_detection(image_file.name, points_of_interest, reduce)
+
+
+def detect_upload_progressive(image_file, reduce=1, strip_rows=None, **detection_params):
+    """
+    Потоковый вариант detect_upload: изображение обрабатывается полосами по strip_rows
+    строк (по умолчанию DETECTOR_STREAM['STRIP_ROWS']), углы каждой полосы выдаются сразу.
+
+    Допуск и декодирование выполняются до возврата, поэтому ImageTooLarge и ValueError
+    выбрасываются здесь же. Возвращается генератор записей: по одной на полосу
+    (номер, строки исходного изображения, Corners, время) и итоговая с числом углов
+    и временем до первой полосы. Полный список углов не собирается, поэтому кэш
+    и sink результатов не используются.
+    """
+    start = time.perf_counter()
+    with stage('admission'):
+        reduce = admit_upload(image_file, reduce)
+    gray_image = decode_image(image_file, reduce)
+    observe_image(gray_image)
+    return _progressive_records(gray_image, reduce, strip_rows or settings.DETECTOR_STREAM['STRIP_ROWS'],
+                                detection_params, start)
+
+
+def _progressive_records(gray_image, reduce, strip_rows, detection_params, start):
+    decoded = strip_start = time.perf_counter()
+    # Полоса index покрывает строки карты отклика, смещённые на половину окна
+    offset = int(detection_params.get('window_size', 7) / 2)
+    height = gray_image.shape[0]
+    strips = total = 0
+    first_strip_ms = None
+    for corners in detect_points_of_interest_streaming(gray_image, strip_rows=strip_rows, **detection_params):
+        now = time.perf_counter()
+        if first_strip_ms is None:
+            first_strip_ms = (now - start) * 1000
+        top = offset + strips * strip_rows
+        yield {
+            'strip': strips,
+            'rows': [top * reduce, min(top + strip_rows, height - offset) * reduce],
+            'points_of_interest': corners.scaled(reduce) if reduce > 1 else corners,
+            'elapsed_ms': (now - strip_start) * 1000,
+        }
+        strips += 1
+        total += len(corners)
+        strip_start = time.perf_counter()
+    yield {
+        'done': True,
+        'strips': strips,
+        'total_points': total,
+        'reduce': reduce,
+        'timings': {
+            'decode_ms': (decoded - start) * 1000,
+            'first_strip_ms': first_strip_ms,
+            'total_ms': (time.perf_counter() - start) * 1000,
+        },
+    }
+
+
+def detect_upload_retained(image_file, owner=None, reduce=1, **detection_params):
+    """
+    Как detect_upload, но декодированное изображение и промежуточные карты детекции
+    сохраняются в хранилище карт отклика. Возвращает (Corners, дескриптор); дескриптор
+    None, если изображение не помещается в бюджет DETECTOR_RESPONSE_MAPS.
+    """
+    with stage('admission'):
+        reduce = admit_upload(image_file, reduce)
+    gray_image = decode_image(image_file, reduce)
+    store = get_response_map_store()
+    handle = store.add(gray_image, owner, image_file.name, reduce)
+    if handle is None:
+        points_of_interest = detect_gray_image(gray_image, reduce=reduce, **detection_params)
+    else:
+        observe_image(gray_image)
+        _, points_of_interest = store.detect(handle, owner, workers=settings.DETECTOR_WORKERS, **detection_params)
+    return finish_detection(image_file.name, points_of_interest, reduce), handle
+
+
+def detect_retained(handle, owner=None, **detection_params):
+    """
+    Повторная детекция сохранённого изображения: с новым threshold, nms_radius или max_points
+    используется готовая карта отклика, с новым k - готовые суммы структурного тензора.
+    KeyError - дескриптор неизвестен, вытеснен или принадлежит другому пользователю.
+    """
+    entry, points_of_interest = get_response_map_store().detect(
+        handle, owner, workers=settings.DETECTOR_WORKERS, **detection_params
+    )
+    return finish_detection(entry.name, points_of_interest, entry.reduce)
+
+
+def detect_sequence(image_files, reduce=1, **params):
+    """
+    Кадры последовательности в порядке загрузки: полная детекция на ключевых кадрах,
+    отслеживание углов между ними (track_points_of_interest).
+
+    Кадры декодируются по одному, в памяти одновременно только текущий и предыдущий.
+    Возвращает список пар (имя файла, результат кадра) и сводку sequence_summary.
+    ImageTooLarge или ValueError для любого кадра прерывают обработку последовательности.
+    """
+    reductions = []
+
+    def decode_frames():
+        for image_file in image_files:
+            with stage('admission'):
+                frame_reduce = admit_upload(image_file, reduce)
+            reductions.append(frame_reduce)
+            gray_image = decode_image(image_file, frame_reduce)
+            observe_image(gray_image)
+            yield gray_image
+
+    frames = track_points_of_interest(
+        decode_frames(), workers=settings.DETECTOR_WORKERS, low_memory=settings.DETECTOR_LOW_MEMORY, **params
+    )
+    results = []
+    summaries = []
+    for image_file, frame in zip(image_files, frames):
+        summaries.append(frame)
+        points_of_interest = finish_detection(image_file.name, frame['corners'], reductions[len(summaries) - 1])
+        results.append((image_file.name, {
+            'points_of_interest': points_of_interest,
+            'keyframe': frame['keyframe'],
+            'tracked': frame['tracked'],
+            'elapsed_ms': frame['elapsed_ms'],
+        }))
+    return results, sequence_summary(summaries)
+
+
+_batch_executor = None
+_batch_executor_lock = threading.Lock()
+_async_executor = None
+_async_executor_lock = threading.Lock()
+
+
+def get_batch_executor():
+    global _batch_executor
+    with _batch_executor_lock:
+        if _batch_executor is None:
+            _batch_executor = ThreadPoolExecutor(
+                max_workers=settings.DETECTOR_BATCH['WORKERS'], thread_name_prefix='detector-batch'
+            )
+        return _batch_executor
+
+
+def get_async_executor():
+    """Ограниченный пул потоков, в котором асинхронный эндпоинт выполняет декодирование и детекцию."""
+    global _async_executor
+    with _async_executor_lock:
+        if _async_executor is None:
+            _async_executor = ThreadPoolExecutor(
+                max_workers=settings.DETECTOR_ASYNC['WORKERS'], thread_name_prefix='detector-async'
+            )
+        return _async_executor
+
+
+def error_details(error):
+    """Тело ответа об ошибке загрузки: сообщение и, для ImageTooLarge, лимиты и размеры изображения."""
+    if isinstance(error, ImageTooLarge):
+        return {'error': str(error), **error.details}
+    return {'error': str(error)}
+
+
+def _admit_or_error(image_file, reduce):
+    # Только заголовок: коэффициент уменьшения и число пикселей, которое займёт декодированное изображение
+    try:
+        image_reduce = admit_upload(image_file, reduce)
+        width, height, _ = read_image_header(image_file)
+        return image_reduce, reduced_pixels(width, height, image_reduce), None
+    except ValueError as e:
+        return reduce, 0, error_details(e)
+
+
+def _decode_or_error(image_file, reduce):
+    try:
+        return decode_image(image_file, reduce), None
+    except ValueError as e:
+        return None, error_details(e)
+
+
+def _detect_or_error(gray_image, reduce, detection_params):
+    try:
+        return detect_gray_image(gray_image, reduce=reduce, **detection_params), None
+    except Exception as e:
+        return None, str(e)
+
+
+def detect_batch(image_files, reduce=1, **detection_params):
+    """
+    Обработка нескольких загрузок на общем ограниченном пуле потоков.
+
+    Сначала каждое изображение проходит допуск по заголовку, затем в порядке загрузки
+    проверяется общий бюджет пикселей DETECTOR_BATCH['MAX_PIXELS'] по размерам из заголовков
+    с учётом уменьшения, и декодируются только уместившиеся изображения: бюджет ограничивает
+    пиковую память пакета. Ошибка одного изображения не прерывает пакет: для него
+    возвращается {'error': ...}. Результаты возвращаются списком пар (имя файла, результат)
+    в порядке загрузки.
+    """
+    executor = get_batch_executor()
+    admitted = list(executor.map(lambda image_file: _admit_or_error(image_file, reduce), image_files))
+
+    pixel_budget = settings.DETECTOR_BATCH['MAX_PIXELS']
+    pixels = 0
+    for index, (image_reduce, image_pixels, error) in enumerate(admitted):
+        if error is not None:
+            continue
+        if pixels + image_pixels > pixel_budget:
+            admitted[index] = (image_reduce, 0, {'error': 'Batch pixel limit of {} exceeded'.format(pixel_budget)})
+        else:
+            pixels += image_pixels
+
+    def decode(image_file, admission):
+        image_reduce, _, error = admission
+        if error is not None:
+            return None, image_reduce, error
+        gray_image, error = _decode_or_error(image_file, image_reduce)
+        return gray_image, image_reduce, error
+
+    decoded = list(executor.map(decode, image_files, admitted))
+
+    futures = [
+        executor.submit(_detect_or_error, gray_image, image_reduce, detection_params) if gray_image is not None else None
+        for gray_image, image_reduce, _ in decoded
+    ]
+
+    results = []
+    for image_file, (_, image_reduce, decode_error), future in zip(image_files, decoded, futures):
+        if future is None:
+            results.append((image_file.name, decode_error))
+            continue
+        points_of_interest, error = future.result()
+        if error is not None:
+            results.append((image_file.name, {'error': error}))
+        else:
+            points_of_interest = finish_detection(image_file.name, points_of_interest, image_reduce)
+            results.append((image_file.name, {'points_of_interest': points_of_interest}))
+    return results
@@ -0,0 +1,128 @@
+import io
+import json
+
+import numpy as np
+from rest_framework.renderers import BaseRenderer
+
+from .utils import Corners
+
+try:
+    import msgpack
+except ImportError:  # MessagePack доступен, только если установлен пакет msgpack
+    msgpack = None
+
+# Типы столбцов в бинарных форматах ответа
+CORNER_DTYPE = np.dtype([('x', '<i4'), ('y', '<i4'), ('r', '<f4')])
+
+
+def _json_default(obj, columnar=False):
+    if isinstance(obj, Corners):
+        if columnar:
+            return {'x': obj.x.tolist(), 'y': obj.y.tolist(), 'r': obj.r.tolist()}
+        return obj.tolist()
+    if isinstance(obj, (np.integer, np.floating, np.ndarray)):
+        return obj.tolist()
+    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
+
+
+def to_json(data, columnar=False):
+    """
+    Компактный JSON. Углы выводятся списком [x, y, r] либо, при columnar=True,
+    столбцами {"x": [...], "y": [...], "r": [...]}.
+    """
+    return json.dumps(
+        data, default=lambda obj: _json_default(obj, columnar), ensure_ascii=False, separators=(',', ':')
+    )
+
+
+def _json_fallback(data, renderer_context):
+    # Ошибки и ответы без углов отдаются обычным JSON с соответствующим Content-Type
+    response = (renderer_context or {}).get('response')
+    if response is not None:
+        response['Content-Type'] = 'application/json'
+    return to_json(data).encode('utf-8')
+
+
+class PointsJSONRenderer(BaseRenderer):
+    """JSON, в котором каждая точка - список [x, y, r]."""
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return to_json(data).encode('utf-8')
+
+
+class ColumnarJSONRenderer(BaseRenderer):
+    """Плоский JSON: углы столбцами x, y, r."""
+    media_type = 'application/vnd.poi.columnar+json'
+    format = 'columnar'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return to_json(data, columnar=True).encode('utf-8')
+
+
+class NpyRenderer(BaseRenderer):
+    """
+    Углы одного изображения в формате .npy: структурный массив с полями
+    x (<i4), y (<i4), r (<f4), читается через numpy.load.
+    """
+    media_type = 'application/x-npy'
+    format = 'npy'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        corners = data.get('points_of_interest') if isinstance(data, dict) else None
+        if not isinstance(corners, Corners):
+            return _json_fallback(data, renderer_context)
+
+        array = np.empty(len(corners), dtype=CORNER_DTYPE)
+        array['x'] = corners.x
+        array['y'] = corners.y
+        array['r'] = corners.r
+        buffer = io.BytesIO()
+        np.lib.format.write_array(buffer, array, allow_pickle=False)
+        return buffer.getvalue()
+
+
+def _msgpack_default(obj):
+    if isinstance(obj, Corners):
+        return {
+            'count': len(obj),
+            'x': obj.x.astype('<i4', copy=False).tobytes(),
+            'y': obj.y.astype('<i4', copy=False).tobytes(),
+            'r': obj.r.astype('<f4').tobytes(),
+        }
+    return _json_default(obj)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    MessagePack: углы передаются словарём {count, x, y, r}, где x и y - бинарные
+    столбцы little-endian int32, r - little-endian float32.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_msgpack_default, use_bin_type=True)
+
+
+def corner_renderer_classes(single_image=True):
+    """Доступные форматы ответа для эндпоинтов детекции; первый используется по умолчанию."""
+    renderers = [PointsJSONRenderer, ColumnarJSONRenderer]
+    if single_image:
+        renderers.append(NpyRenderer)
+    if msgpack is not None:
+        renderers.append(MessagePackRenderer)
+    return renderers
@@ -0,0 +1,177 @@
+import threading
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .utils import corners_from_response, response_from_sums, structure_tensor
+
+
+class RetainedImage:
+    """
+    Изображение, сохранённое для повторной детекции, и промежуточные результаты последнего
+    расчёта: суммы структурного тензора для window_size и карта отклика для k.
+    """
+
+    def __init__(self, gray_image, owner=None, name=None, reduce=1):
+        self.gray_image = gray_image
+        self.owner = owner
+        self.name = name
+        self.reduce = reduce
+        self.window_size = self.sums = None
+        self.k = self.response = None
+        self.lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        arrays = [self.gray_image, self.response] + list(self.sums or ())
+        return sum(array.nbytes for array in arrays if array is not None)
+
+
+class ResponseMapStore:
+    """
+    LRU-хранилище изображений с промежуточными картами детекции по дескриптору (handle).
+
+    Повторная детекция с другим threshold, nms_radius или max_points использует готовую
+    карту отклика, с другим k - готовые суммы структурного тензора; заново всё
+    считается только при смене window_size. Объём всех записей ограничен max_bytes,
+    при переполнении удаляются давно не использованные записи.
+
+    Записи живут в памяти процесса, поэтому без общего уровня дескриптор действителен только
+    в воркере, который его выдал. С shared_alias (бэкенд кэша Django, общий для воркеров)
+    туда же сохраняется декодированное изображение: воркер, которому дескриптор неизвестен,
+    загружает его оттуда и один раз пересчитывает карты у себя.
+    """
+
+    def __init__(self, max_bytes, shared_alias=None, shared_timeout=None):
+        self.max_bytes = max_bytes
+        self.shared_alias = shared_alias
+        self.shared_timeout = shared_timeout
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.evictions = 0
+        self.shared_hits = 0
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias] if self.shared_alias else None
+
+    @staticmethod
+    def _shared_key(handle):
+        return 'detector:retained:' + handle
+
+    def add(self, gray_image, owner=None, name=None, reduce=1):
+        """Сохраняет изображение и возвращает его дескриптор; None, если оно больше всего бюджета."""
+        if gray_image.nbytes > self.max_bytes:
+            return None
+        handle = uuid.uuid4().hex
+        with self._lock:
+            self._entries[handle] = RetainedImage(gray_image, owner, name, reduce)
+            self._resize(handle, gray_image.nbytes)
+        if self.shared is not None:
+            self.shared.set(self._shared_key(handle), {
+                'gray_image': gray_image, 'owner': owner, 'name': name, 'reduce': reduce,
+            }, self.shared_timeout)
+        return handle
+
+    def get(self, handle, owner=None):
+        """Запись по дескриптору; KeyError, если её нет, она вытеснена или принадлежит другому владельцу."""
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is not None:
+                if entry.owner != owner:
+                    raise KeyError(handle)
+                self._entries.move_to_end(handle)
+                return entry
+
+        shared = self.shared.get(self._shared_key(handle)) if self.shared is not None else None
+        if shared is None or shared['owner'] != owner:
+            raise KeyError(handle)
+        with self._lock:
+            self.shared_hits += 1
+            entry = self._entries.get(handle)
+            if entry is None:
+                entry = self._entries[handle] = RetainedImage(**shared)
+                self._resize(handle, entry.nbytes)
+            return entry
+
+    def discard(self, handle, owner=None):
+        self.get(handle, owner)
+        with self._lock:
+            if handle in self._entries:
+                self._remove(handle)
+        if self.shared is not None:
+            self.shared.delete(self._shared_key(handle))
+
+    def detect(self, handle, owner=None, k=0.2, window_size=7, threshold=1500000.0, nms_radius=0,
+               max_points=None, workers=1):
+        """
+        Углы сохранённого изображения; результат совпадает с detect_corners с теми же
+        параметрами. Возвращает (запись, Corners) - запись нужна для reduce и имени файла.
+        """
+        entry = self.get(handle, owner)
+        with entry.lock:
+            if entry.window_size != window_size:
+                entry.sums = structure_tensor(entry.gray_image, window_size, workers)
+                entry.window_size, entry.k, entry.response = window_size, None, None
+            if entry.response is None or entry.k != k:
+                entry.response = response_from_sums(*entry.sums, k)
+                entry.k = k
+            response = entry.response
+            if entry.nbytes > self.max_bytes:
+                # Одной записи не хватает бюджета: промежуточные карты не сохраняются
+                entry.window_size = entry.sums = entry.k = entry.response = None
+            size = entry.nbytes
+        with self._lock:
+            if handle in self._entries:
+                self._resize(handle, size)
+        return entry, corners_from_response(response, window_size, threshold, nms_radius, max_points)
+
+    def _resize(self, handle, size):
+        self.current_bytes += size - self._sizes.get(handle, 0)
+        self._sizes[handle] = size
+        # Вытесняются самые старые записи, кроме только что использованной
+        for oldest in [key for key in self._entries if key != handle]:
+            if self.current_bytes <= self.max_bytes:
+                break
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, handle):
+        del self._entries[handle]
+        self.current_bytes -= self._sizes.pop(handle)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'evictions': self.evictions,
+                'shared_hits': self.shared_hits,
+            }
+
+
+_response_map_store = None
+_response_map_store_lock = threading.Lock()
+
+
+def get_response_map_store():
+    global _response_map_store
+    with _response_map_store_lock:
+        if _response_map_store is None:
+            options = settings.DETECTOR_RESPONSE_MAPS
+            _response_map_store = ResponseMapStore(
+                options['MAX_BYTES'],
+                shared_alias=options.get('SHARED_ALIAS'),
+                shared_timeout=options.get('SHARED_TIMEOUT'),
+            )
+        return _response_map_store
@@ -0,0 +1,137 @@
+import base64
+import hashlib
+import json
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .models import DetectionRun, DetectionTile
+from .utils import Corners
+
+# Упакованная точка тайла: координаты в исходном разрешении и отклик без потери точности
+POINT_DTYPE = np.dtype([('x', '<i4'), ('y', '<i4'), ('r', '<f8')])
+
+
+def image_digest(image_file):
+    """SHA-256 загруженного файла; по нему клиенты находят сохранённые результаты без повторной загрузки."""
+    digest = hashlib.sha256()
+    image_file.seek(0)
+    for chunk in iter(lambda: image_file.read(1024 * 1024), b''):
+        digest.update(chunk)
+    image_file.seek(0)
+    return digest.hexdigest()
+
+
+def _strongest_first(points):
+    # Порядок выдачи: по убыванию отклика, при равном отклике - построчно
+    return points[np.lexsort((points['x'], points['y'], -points['r']))]
+
+
+def save_detection_run(corners, image_hash, params=None, image_name='', user_id=None, tile_size=None):
+    """
+    Сохраняет Corners одним DetectionRun и строкой DetectionTile на каждый непустой тайл
+    сетки tile_size x tile_size. Точки тайла хранятся одним бинарным массивом.
+    """
+    tile_size = tile_size or settings.DETECTOR_RESULTS['TILE_SIZE']
+    points = np.empty(len(corners), POINT_DTYPE)
+    points['x'], points['y'], points['r'] = corners.x, corners.y, corners.r
+    tile_xs, tile_ys = points['x'] // tile_size, points['y'] // tile_size
+    points = points[np.lexsort((points['x'], points['y'], -points['r'], tile_xs, tile_ys))]
+    tile_xs, tile_ys = points['x'] // tile_size, points['y'] // tile_size
+    starts = np.flatnonzero(np.diff(tile_ys, prepend=-1) | np.diff(tile_xs, prepend=-1))
+
+    with transaction.atomic():
+        run = DetectionRun.objects.create(
+            user_id=user_id, image_hash=image_hash, image_name=image_name or '', params=params or {},
+            point_count=len(points), tile_size=tile_size,
+        )
+        DetectionTile.objects.bulk_create([
+            DetectionTile(
+                run=run, tile_x=int(tile_xs[start]), tile_y=int(tile_ys[start]), count=len(tile),
+                max_r=float(tile['r'][0]), min_r=float(tile['r'][-1]), points=tile.tobytes(),
+            )
+            for start, tile in zip(starts, np.split(points, starts[1:]))
+        ], batch_size=500)
+    return run
+
+
+def encode_cursor(point):
+    return base64.urlsafe_b64encode(json.dumps([float(point['r']), int(point['y']), int(point['x'])]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        r, y, x = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(r), int(y), int(x)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor.")
+
+
+def _select(points, bbox, cursor):
+    keep = np.ones(len(points), bool)
+    if bbox is not None:
+        x0, y0, x1, y1 = bbox
+        keep &= (points['x'] >= x0) & (points['x'] < x1) & (points['y'] >= y0) & (points['y'] < y1)
+    if cursor is not None:
+        r, y, x = cursor
+        # Точки строго после курсора в порядке (-r, y, x)
+        after = (points['r'] < r) | ((points['r'] == r) & ((points['y'] > y) | ((points['y'] == y) & (points['x'] > x))))
+        keep &= after
+    return points[keep]
+
+
+def query_run_points(run, bbox=None, limit=1000, cursor=None):
+    """
+    Углы сохранённого результата внутри bbox = (x0, y0, x1, y1) (x1, y1 не включаются)
+    по убыванию отклика, страницами по limit. Возвращает (Corners, курсор следующей
+    страницы или None).
+
+    Читаются только тайлы, пересекающие bbox, в порядке убывания max_r: чтение
+    останавливается, как только набранные limit + 1 точек сильнее любого оставшегося
+    тайла. Тайлы, все точки которых уже выданы на предыдущих страницах, пропускаются по min_r.
+    """
+    cursor = decode_cursor(cursor) if cursor else None
+    tiles = DetectionTile.objects.filter(run=run)
+    if bbox is not None:
+        x0, y0, x1, y1 = bbox
+        size = run.tile_size
+        tiles = tiles.filter(
+            tile_x__gte=x0 // size, tile_x__lte=(x1 - 1) // size, tile_y__gte=y0 // size, tile_y__lte=(y1 - 1) // size
+        )
+    if cursor is not None:
+        tiles = tiles.filter(min_r__lte=cursor[0])
+
+    selected = np.empty(0, POINT_DTYPE)
+    pending, pending_count = [], 0
+
+    def merge():
+        return _strongest_first(np.concatenate([selected] + pending))[:limit + 1], [], 0
+
+    for max_r, blob in tiles.order_by('-max_r').values_list('max_r', 'points').iterator(chunk_size=64):
+        # Отклик точки за концом страницы; между слияниями он только занижен, что не меняет результат
+        cutoff = selected['r'][limit] if len(selected) > limit else -np.inf
+        if cutoff > max_r:
+            break
+        # Точки тайла упорядочены так же, как страница, поэтому из него нужны только первые limit + 1
+        points = _select(np.frombuffer(blob, POINT_DTYPE), bbox, cursor)[:limit + 1]
+        points = points[points['r'] >= cutoff]
+        pending.append(points)
+        pending_count += len(points)
+        # Кандидаты сливаются пачками: сортировка после каждого тайла дороже чтения тайлов
+        if pending_count > limit:
+            selected, pending, pending_count = merge()
+    selected, pending, pending_count = merge()
+
+    page = selected[:limit]
+    next_cursor = encode_cursor(page[-1]) if len(selected) > limit else None
+    return Corners(page['x'], page['y'], page['r']), next_cursor
+
+
+def save_upload_run(image_file, corners, params, user_id=None):
+    """Сохраняет результат детекции загруженного файла; файл маски в параметрах заменяется его хэшем."""
+    params = dict(params)
+    params.setdefault('backend', settings.DETECTOR_BACKEND)
+    if 'mask' in params:
+        params['mask'] = image_digest(params['mask'])
+    return save_detection_run(corners, image_digest(image_file), params, image_file.name, user_id)
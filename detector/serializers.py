@@ -1,31 +1,188 @@
+import json
+
 from rest_framework import serializers
-from rest_framework.views import APIView
-from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from rest_framework.parsers import MultiPartParser, FormParser
-from .utils import detect_points_of_interest
-import cv2
-import numpy as np
+from django.conf import settings
+from .backends import DETECTOR_BACKENDS, unsupported_params
+from .models import DetectionRun
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 # from rest_framework.authtoken.models import Token
 
 
+# Максимум прямоугольников областей интереса в одном запросе
+MAX_ROIS = 64
+
+
 class ImageUploadSerializer(serializers.Serializer):
     image = serializers.ImageField()
 
 
-class ImageProcessingView(APIView):
-    permission_classes = [IsAuthenticated]
-    parser_classes = [MultiPartParser, FormParser]
+def _is_roi(roi):
+    if not isinstance(roi, list) or len(roi) != 4 or not all(type(value) is int for value in roi):
+        return False
+    return min(roi[:2]) >= 0 and min(roi[2:]) > 0
+
+
+class RoiField(serializers.Field):
+    """
+    Прямоугольники областей интереса [[x, y, width, height], ...] в координатах исходного
+    изображения: списком в JSON или строкой JSON в поле формы.
+    """
+    default_error_messages = {
+        'invalid': 'Expected a JSON list of [x, y, width, height] rectangles with positive width and height.',
+        'too_many': 'No more than {max_rois} rectangles are allowed.',
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            try:
+                data = json.loads(data)
+            except ValueError:
+                self.fail('invalid')
+        if not isinstance(data, list) or not data or not all(_is_roi(roi) for roi in data):
+            self.fail('invalid')
+        if len(data) > MAX_ROIS:
+            self.fail('too_many', max_rois=MAX_ROIS)
+        return data
+
+    def to_representation(self, value):
+        return value
+
+
+class DetectionParamsSerializer(serializers.Serializer):
+    """
+    Необязательные параметры детектора, передаваемые полями формы вместе с изображением.
+    """
+    k = serializers.FloatField(required=False)
+    window_size = serializers.IntegerField(required=False, min_value=1, max_value=63)
+    threshold = serializers.FloatField(required=False)
+    nms_radius = serializers.IntegerField(required=False, min_value=0, max_value=50)
+    max_points = serializers.IntegerField(required=False, min_value=1)
+    # Уменьшение изображения при декодировании для клиентов, которым достаточно грубой детекции
+    reduce = serializers.ChoiceField(choices=[1, 2, 4], required=False)
+    # fast - поиск кандидатов на уменьшенном уровне пирамиды и уточнение в полном разрешении
+    mode = serializers.ChoiceField(choices=['full', 'fast'], required=False)
+    # Бэкенд детектора; без параметра - DETECTOR_BACKEND
+    backend = serializers.ChoiceField(choices=list(DETECTOR_BACKENDS), required=False)
+    # Поиск углов только внутри прямоугольников
+    rois = RoiField(required=False)
+
+    # Поля, которые передаются бэкенду; остальные обрабатываются до детекции
+    backend_fields = ('k', 'window_size', 'threshold', 'nms_radius', 'max_points', 'mode', 'rois', 'mask')
+
+    def validate(self, attrs):
+        backend = attrs.get('backend') or settings.DETECTOR_BACKEND
+        unsupported = unsupported_params(backend, [name for name in self.backend_fields if name in attrs])
+        if unsupported:
+            raise serializers.ValidationError(
+                {name: f"Not supported by the {backend} backend." for name in unsupported}
+            )
+        return attrs
+
+
+class ImageParamsSerializer(DetectionParamsSerializer):
+    # Сохранить изображение и карты отклика для повторной детекции по дескриптору
+    retain = serializers.BooleanField(required=False, default=False)
+    # Изображение того же размера: углы ищутся только на ненулевых пикселях
+    mask = serializers.FileField(required=False)
+    # Сохранить результат в базе для выборок по прямоугольнику через /api/runs/<run_id>/points/
+    persist = serializers.BooleanField(required=False, default=False)
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        if attrs['retain']:
+            if (attrs.get('backend') or settings.DETECTOR_BACKEND) != 'numpy':
+                raise serializers.ValidationError({'retain': "Response maps are retained only for the numpy backend."})
+            if attrs.get('mode', 'full') != 'full' or 'rois' in attrs or 'mask' in attrs:
+                raise serializers.ValidationError(
+                    {'retain': "Response maps are retained only in full mode without rois or mask."}
+                )
+        return attrs
+
+
+class ResponseMapParamsSerializer(DetectionParamsSerializer):
+    """Параметры повторной детекции на сохранённых картах: изображение уже декодировано, бэкенд - numpy."""
+    reduce = None
+    mode = None
+    backend = None
+    rois = None
+
+    def validate(self, attrs):
+        return attrs
+
+
+class BboxField(serializers.Field):
+    """Прямоугольник \"x0,y0,x1,y1\" в координатах исходного изображения; x1 и y1 не включаются."""
+    default_error_messages = {
+        'invalid': 'Expected "x0,y0,x1,y1" with non-negative integers, x0 < x1 and y0 < y1.',
+    }
+
+    def to_internal_value(self, data):
+        try:
+            bbox = [int(value) for value in str(data).split(',')]
+        except ValueError:
+            self.fail('invalid')
+        if len(bbox) != 4 or min(bbox) < 0 or bbox[0] >= bbox[2] or bbox[1] >= bbox[3]:
+            self.fail('invalid')
+        return tuple(bbox)
+
+    def to_representation(self, value):
+        return ','.join(str(v) for v in value)
+
+
+class RunPointsQuerySerializer(serializers.Serializer):
+    """Параметры выборки углов сохранённого результата."""
+    bbox = BboxField(required=False)
+    limit = serializers.IntegerField(required=False, default=1000, min_value=1)
+    # Курсор next_cursor предыдущей страницы
+    cursor = serializers.CharField(required=False)
+
+    def validate_limit(self, value):
+        max_page_size = settings.DETECTOR_RESULTS['MAX_PAGE_SIZE']
+        if value > max_page_size:
+            raise serializers.ValidationError(f"Ensure this value is less than or equal to {max_page_size}.")
+        return value
+
+
+class DetectionRunSerializer(serializers.ModelSerializer):
+    run_id = serializers.UUIDField(source='pk', read_only=True)
+
+    class Meta:
+        model = DetectionRun
+        fields = ['run_id', 'image_hash', 'image_name', 'params', 'point_count', 'tile_size', 'created_at']
+
+
+class StreamParamsSerializer(DetectionParamsSerializer):
+    """
+    Параметры потоковой детекции: Харрис numpy полосами. max_points и режим fast требуют
+    всех углов изображения сразу, поэтому не поддерживаются.
+    """
+    max_points = None
+    mode = None
+    backend = None
+    rois = None
+    strip_rows = serializers.IntegerField(required=False, min_value=16, max_value=4096)
+
+    unsupported_fields = ('max_points', 'mode', 'backend', 'rois', 'mask')
+
+    def validate(self, attrs):
+        # Удалённые поля иначе молча игнорировались бы
+        unsupported = [name for name in self.unsupported_fields if name in self.initial_data]
+        if unsupported:
+            raise serializers.ValidationError({name: "Not supported by streaming detection." for name in unsupported})
+        return attrs
+
+
+class JobParamsSerializer(DetectionParamsSerializer):
+    priority = serializers.IntegerField(required=False, default=0, min_value=-100, max_value=100)
+
 
-    def post(self, request, *args, **kwargs):
-        serializer = ImageUploadSerializer(data=request.data)
-        if serializer.is_valid():
-            image = cv2.imdecode(np.frombuffer(serializer.validated_data['image'].read(), np.uint8), cv2.IMREAD_COLOR)
-            points = detect_points_of_interest(image)
-            return Response({'points': points})
-        return Response(serializer.errors, status=400)
+class SequenceParamsSerializer(DetectionParamsSerializer):
+    # Отслеженные углы выходят за области интереса, поэтому последовательности их не поддерживают
+    rois = None
+    # Полная детекция повторяется, когда отслежено меньше этой доли углов ключевого кадра
+    min_tracked_ratio = serializers.FloatField(required=False, min_value=0.0, max_value=1.0)
+    keyframe_interval = serializers.IntegerField(required=False, min_value=1)
 
 
 class UserSerializer(serializers.ModelSerializer):
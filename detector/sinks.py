@@ -0,0 +1,138 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from django.utils.text import get_valid_filename
+
+logger = logging.getLogger(__name__)
+
+
+def _json_default(obj):
+    # Corners и массивы numpy записываются прежним списком [x, y, r]
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
+
+
+class NullSink:
+    """Результаты никуда не сохраняются."""
+
+    def __init__(self, **options):
+        pass
+
+    def submit(self, name, points):
+        pass
+
+    def close(self):
+        pass
+
+
+class FileSink:
+    """Каждый результат записывается в отдельный JSON файл в каталоге DIRECTORY."""
+
+    def __init__(self, DIRECTORY, **options):
+        self.directory = DIRECTORY
+        os.makedirs(self.directory, exist_ok=True)
+
+    def submit(self, name, points):
+        filename = '{}_{}_{}.json'.format(
+            time.strftime('%Y%m%d%H%M%S'), uuid.uuid4().hex[:8], get_valid_filename(os.path.basename(name or 'image'))
+        )
+        path = os.path.join(self.directory, filename)
+        # Пишем во временный файл и переименовываем, чтобы читатели не видели частичный JSON
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as json_file:
+            json.dump(points, json_file, separators=(',', ':'), default=_json_default)
+        os.replace(temp_path, path)
+        return path
+
+    def close(self):
+        pass
+
+
+class BackgroundSink:
+    """
+    Фоновая запись результатов в файл JSON Lines.
+
+    Запрос только кладёт результат в ограниченную очередь; поток-писатель забирает
+    результаты пачками до BATCH_SIZE и дописывает их в PATH одним открытием файла.
+    Если очередь заполнена, результат отбрасывается и учитывается в dropped.
+    """
+
+    def __init__(self, PATH, MAX_QUEUE=1000, BATCH_SIZE=100, FLUSH_INTERVAL=1.0, **options):
+        self.path = PATH
+        self.batch_size = BATCH_SIZE
+        self.flush_interval = FLUSH_INTERVAL
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=MAX_QUEUE)
+        self._stop = threading.Event()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='detector-result-sink', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, name, points):
+        try:
+            self._queue.put_nowait({'name': name, 'points': points})
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, batch):
+        try:
+            with open(self.path, 'a') as results_file:
+                for record in batch:
+                    results_file.write(json.dumps(record, separators=(',', ':'), default=_json_default))
+                    results_file.write('\n')
+            self.written += len(batch)
+        except OSError:
+            logger.exception('Failed to write %d detection results to %s', len(batch), self.path)
+
+    def close(self):
+        if not self._stop.is_set():
+            self._stop.set()
+            self._thread.join()
+
+
+SINK_BACKENDS = {
+    'none': NullSink,
+    'file': FileSink,
+    'background': BackgroundSink,
+}
+
+_result_sink = None
+_result_sink_lock = threading.Lock()
+
+
+def create_result_sink(backend, options=None):
+    sink_class = SINK_BACKENDS.get(backend) or import_string(backend)
+    return sink_class(**(options or {}))
+
+
+def get_result_sink():
+    global _result_sink
+    with _result_sink_lock:
+        if _result_sink is None:
+            config = settings.DETECTOR_RESULT_SINK
+            _result_sink = create_result_sink(config['BACKEND'], config.get('OPTIONS'))
+        return _result_sink
@@ -0,0 +1,239 @@
+import io
+import os
+import struct
+from functools import partial
+
+import cv2
+import numpy as np
+from PIL import Image, TiffImagePlugin
+
+from .utils import Corners, ScratchBuffers, detect_in_regions, harris_response_region_low_memory
+
+# Высота полосы карты отклика при потоковой детекции; от неё зависит пиковая память
+STREAM_STRIP_ROWS = 512
+
+# Теги TIFF, по которым строки читаются напрямую из файла
+TIFF_WIDTH, TIFF_LENGTH, TIFF_BITS_PER_SAMPLE, TIFF_COMPRESSION = 256, 257, 258, 259
+TIFF_PHOTOMETRIC, TIFF_STRIP_OFFSETS, TIFF_SAMPLES_PER_PIXEL, TIFF_ROWS_PER_STRIP = 262, 273, 277, 278
+TIFF_PLANAR_CONFIG, TIFF_TILE_WIDTH, TIFF_TILE_LENGTH, TIFF_TILE_OFFSETS = 284, 322, 323, 324
+TIFF_STRIP_BYTE_COUNTS, TIFF_PREDICTOR, TIFF_TILE_BYTE_COUNTS, TIFF_JPEG_TABLES = 279, 317, 325, 347
+TIFF_EXTRA_SAMPLES = 338
+TIFF_SHORT, TIFF_LONG, TIFF_UNDEFINED = 3, 4, 7
+
+
+def _single_strip_tiff(width, rows, chunk, tags):
+    """
+    TIFF из одной сжатой полосы или тайла chunk размером width x rows с тегами
+    кодирования исходного файла. Сжатые данные тайла совпадают с данными полосы
+    того же размера, поэтому тайлы упаковываются так же.
+    """
+    entries = {
+        TIFF_WIDTH: (TIFF_LONG, [width]), TIFF_LENGTH: (TIFF_LONG, [rows]),
+        TIFF_BITS_PER_SAMPLE: (TIFF_SHORT, tags['bits']), TIFF_COMPRESSION: (TIFF_SHORT, [tags['compression']]),
+        TIFF_PHOTOMETRIC: (TIFF_SHORT, [tags['photometric']]), TIFF_STRIP_OFFSETS: (TIFF_LONG, [0]),
+        TIFF_SAMPLES_PER_PIXEL: (TIFF_SHORT, [tags['samples']]), TIFF_ROWS_PER_STRIP: (TIFF_LONG, [rows]),
+        TIFF_STRIP_BYTE_COUNTS: (TIFF_LONG, [len(chunk)]), TIFF_PLANAR_CONFIG: (TIFF_SHORT, [1]),
+    }
+    if tags['predictor'] != 1:
+        entries[TIFF_PREDICTOR] = (TIFF_SHORT, [tags['predictor']])
+    if tags['extra_samples']:
+        entries[TIFF_EXTRA_SAMPLES] = (TIFF_SHORT, tags['extra_samples'])
+    if tags['jpeg_tables']:
+        entries[TIFF_JPEG_TABLES] = (TIFF_UNDEFINED, tags['jpeg_tables'])
+
+    packed = {
+        tag: bytes(values) if kind == TIFF_UNDEFINED else struct.pack(
+            '<{}{}'.format(len(values), 'H' if kind == TIFF_SHORT else 'I'), *values
+        )
+        for tag, (kind, values) in entries.items()
+    }
+    # Файл: заголовок, каталог тегов, значения длиннее 4 байт (выровнены по слову), данные полосы
+    long_values = [packed[tag] + b'\0' * (len(packed[tag]) % 2) for tag in sorted(entries) if len(packed[tag]) > 4]
+    extra_at = 8 + 2 + 12 * len(entries) + 4
+    packed[TIFF_STRIP_OFFSETS] = struct.pack('<I', extra_at + sum(len(value) for value in long_values))
+
+    ifd = [struct.pack('<H', len(entries))]
+    position = extra_at
+    for tag in sorted(entries):
+        kind, values = entries[tag]
+        if len(packed[tag]) > 4:
+            value = struct.pack('<I', position)
+            position += len(packed[tag]) + len(packed[tag]) % 2
+        else:
+            value = packed[tag].ljust(4, b'\0')
+        ifd.append(struct.pack('<HHI', tag, kind, len(values)) + value)
+    return b''.join([b'II*\0', struct.pack('<I', 8)] + ifd + [struct.pack('<I', 0)] + long_values + [bytes(chunk)])
+
+
+class TiffSource:
+    """
+    8-битный TIFF (полосами или тайлами), читаемый по строкам без загрузки всего
+    изображения: файл отображается в память, а запрошенные строки собираются из нужных
+    полос или тайлов и переводятся в оттенки серого.
+
+    Несжатые полосы читаются из файла напрямую. Сжатые (LZW, Deflate, PackBits, JPEG)
+    распаковываются по одной через libtiff в Pillow; распакованными хранятся только полосы
+    и тайлы последнего запроса, поэтому память ограничена полосой изображения,
+    а соседние запросы с общим гало не распаковывают их повторно.
+
+    Поддерживаются изображения в оттенках серого (MinIsWhite, MinIsBlack) и RGB.
+    """
+
+    def __init__(self, path):
+        # TiffImageFile напрямую, а не Image.open: Pillow отказывается открывать
+        # изображения больше MAX_IMAGE_PIXELS, хотя пиксели здесь не декодируются
+        with open(path, 'rb') as tiff_file:
+            try:
+                tags = dict(TiffImagePlugin.TiffImageFile(tiff_file).tag_v2)
+            except SyntaxError as e:
+                # Так Pillow сообщает о повреждённом заголовке или неизвестном сжатии
+                raise ValueError(f"Cannot read TIFF image: {e}") from e
+
+        self.width, self.height = tags[TIFF_WIDTH], tags[TIFF_LENGTH]
+        self.samples = tags.get(TIFF_SAMPLES_PER_PIXEL, 1)
+        self.photometric = tags.get(TIFF_PHOTOMETRIC, 1)
+        bits = tags.get(TIFF_BITS_PER_SAMPLE, (8,))
+        bits = bits if isinstance(bits, tuple) else (bits,)
+        if set(bits) != {8} or self.photometric not in (0, 1, 2):
+            raise ValueError("Only 8-bit grayscale and RGB TIFF images can be streamed.")
+        if self.samples > 1 and tags.get(TIFF_PLANAR_CONFIG, 1) != 1:
+            raise ValueError("TIFF images with separate color planes cannot be streamed.")
+
+        self.data = np.memmap(path, dtype=np.uint8, mode='r')
+        self.tiled = TIFF_TILE_OFFSETS in tags
+        if self.tiled:
+            self.tile_width, self.tile_length = tags[TIFF_TILE_WIDTH], tags[TIFF_TILE_LENGTH]
+            self.offsets = tags[TIFF_TILE_OFFSETS]
+        else:
+            # Полоса - это тайл на всю ширину изображения
+            self.tile_width = self.width
+            self.tile_length = min(tags.get(TIFF_ROWS_PER_STRIP, self.height), self.height)
+            self.offsets = tags[TIFF_STRIP_OFFSETS]
+        self.tiles_across = -(-self.width // self.tile_width)
+
+        self.compression = tags.get(TIFF_COMPRESSION, 1)
+        self.byte_counts = tags.get(TIFF_TILE_BYTE_COUNTS if self.tiled else TIFF_STRIP_BYTE_COUNTS)
+        self.codec_tags = {
+            'bits': list(bits) * (self.samples // len(bits) or 1), 'compression': self.compression,
+            # Полосы в оттенках серого распаковываются без инверсии MinIsWhite, её применяет __getitem__
+            'photometric': self.photometric if self.samples > 1 else 1, 'samples': self.samples,
+            'predictor': tags.get(TIFF_PREDICTOR, 1), 'jpeg_tables': tags.get(TIFF_JPEG_TABLES, b''),
+            'extra_samples': list(np.atleast_1d(tags.get(TIFF_EXTRA_SAMPLES, ()))),
+        }
+        self._decoded = {}
+        if self.compression != 1:
+            if self.byte_counts is None:
+                raise ValueError("Compressed TIFF images without byte counts cannot be streamed.")
+            # Первая полоса распаковывается сразу: неподдерживаемое сжатие обнаруживается при открытии
+            self._tile(0, self.tile_length)
+
+    @property
+    def shape(self):
+        return self.height, self.width
+
+    def __getitem__(self, rows):
+        if not isinstance(rows, slice):
+            raise TypeError('TiffSource supports row slices only')
+        top, bottom, _ = rows.indices(self.height)
+        bottom = max(bottom, top)
+        block = np.empty((bottom - top, self.width, self.samples), np.uint8)
+        decoded = {}
+
+        for tile_row in range(top // self.tile_length, -(-bottom // self.tile_length)):
+            tile_top = tile_row * self.tile_length
+            y0, y1 = max(top, tile_top), min(bottom, tile_top + self.tile_length)
+            # Тайлы на краю дополнены до полного размера, а последняя полоса может быть короче
+            stored_rows = self.tile_length if self.tiled else min(self.tile_length, self.height - tile_top)
+            for tile_column in range(self.tiles_across):
+                index = tile_row * self.tiles_across + tile_column
+                left = tile_column * self.tile_width
+                right = min(left + self.tile_width, self.width)
+                tile = self._tile(index, stored_rows, decoded)
+                block[y0 - top:y1 - top, left:right] = tile[y0 - tile_top:y1 - tile_top, :right - left]
+        self._decoded = decoded
+
+        if self.photometric == 2:
+            return cv2.cvtColor(block[:, :, :3], cv2.COLOR_RGB2GRAY)
+        gray = block[:, :, 0]
+        return 255 - gray if self.photometric == 0 else gray
+
+    def _tile(self, index, stored_rows, decoded=None):
+        """Полоса или тайл index формы (stored_rows, tile_width, samples)."""
+        offset = self.offsets[index]
+        if self.compression == 1:
+            tile = self.data[offset:offset + stored_rows * self.tile_width * self.samples]
+            return tile.reshape(stored_rows, self.tile_width, self.samples)
+
+        tile = self._decoded.get(index)
+        if tile is None:
+            tile = self._decode_tile(index, stored_rows)
+        if decoded is not None:
+            decoded[index] = tile
+        return tile
+
+    def _decode_tile(self, index, stored_rows):
+        offset = self.offsets[index]
+        chunk = self.data[offset:offset + self.byte_counts[index]]
+        encoded = _single_strip_tiff(self.tile_width, stored_rows, chunk, self.codec_tags)
+        try:
+            # libtiff в Pillow, в отличие от OpenCV, сообщает о повреждённых данных исключением
+            with Image.open(io.BytesIO(encoded)) as image:
+                tile = np.asarray(image)
+        except (OSError, SyntaxError) as e:
+            raise ValueError(f"Cannot decode TIFF strip {index} (compression {self.compression}): {e}") from e
+        if tile.dtype != np.uint8 or tile.size != stored_rows * self.tile_width * self.samples:
+            raise ValueError(f"Cannot decode TIFF strip {index} (compression {self.compression}).")
+        return tile.reshape(stored_rows, self.tile_width, self.samples)
+
+
+def open_gray_source(path, shape=None, offset=0):
+    """
+    Источник строк изображения в оттенках серого без чтения файла целиком.
+
+    .npy (двумерный uint8) и сырые данные отображаются в память через numpy; для сырых
+    данных нужны shape = (height, width) и, при наличии заголовка, offset в байтах.
+    .tif/.tiff читаются через TiffSource. Результат поддерживает shape и срезы строк.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.npy':
+        source = np.load(path, mmap_mode='r')
+        if source.ndim != 2 or source.dtype != np.uint8:
+            raise ValueError("Only two-dimensional uint8 .npy images can be streamed.")
+        return source
+    if extension in ('.tif', '.tiff'):
+        return TiffSource(path)
+    if shape is None:
+        raise ValueError("Raw images need shape=(height, width).")
+    return np.memmap(path, dtype=np.uint8, mode='r', offset=offset, shape=tuple(shape))
+
+
+def detect_points_of_interest_streaming(source, k=0.2, window_size=7, threshold=1500000.0,
+                                        nms_radius=0, strip_rows=STREAM_STRIP_ROWS):
+    """
+    Потоковая детекция для изображений, не помещающихся в память.
+
+    source - двумерный массив uint8 или результат open_gray_source. Изображение
+    обрабатывается полосами по strip_rows строк карты отклика; для каждой полосы
+    читаются только её строки с гало окна и радиуса подавления немаксимумов.
+    Генератор выдаёт Corners каждой полосы в построчном порядке; вместе они совпадают
+    с detect_corners для всего изображения. Пиковая память зависит от strip_rows
+    и ширины изображения, но не от его высоты.
+    """
+    offset = int(window_size / 2)
+    window = 2 * offset + 1
+    height, width = source.shape
+    rows = height - window + 1
+    if rows <= 0 or width - window + 1 <= 0:
+        return
+
+    response_region = partial(harris_response_region_low_memory, scratch=ScratchBuffers())
+    for top in range(0, rows, strip_rows):
+        bottom = min(top + strip_rows, rows)
+        # Строка сверху и снизу - для центральной разности градиента, nms_radius - для подавления
+        y0 = max(top - nms_radius - 1, 0)
+        y1 = min(bottom + nms_radius + window, height)
+        block = np.ascontiguousarray(source[y0:y1])
+
+        region = (top - y0, bottom - y0, 0, width - window + 1)
+        ys, xs, rs = detect_in_regions(block, [region], k, window_size, threshold, nms_radius, response_region)
+        yield Corners(xs + offset, ys + y0 + offset, rs)
@@ -4,19 +4,58 @@ import unittest
 import io
 import json
 import os
+import glob
+import importlib
+import shutil
+import tempfile
+import struct
+import zlib
+import time
+import asyncio
+import threading
+import contextlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from config import SECRET_KEY, DEBUG, ALLOWED_HOSTS, BASE_DIR
 from .serializers import ImageUploadSerializer, RegisterUserSerializer, LoginSerializer
 from django.contrib.auth.models import User
 from django.core.files.uploadedfile import SimpleUploadedFile
-from .utils import detect_points_of_interest
-from rest_framework.test import APITestCase, APIClient
-from process_images import process_image, main
-from unittest.mock import mock_open, patch
+from .utils import detect_points_of_interest, detect_points_of_interest_reference, decode_image
+from .utils import detect_corners, detect_low_memory, harris_response_region, harris_response_region_low_memory, Corners
+from .utils import ScratchBuffers, scaled_gradients
+from .utils import harris_response, structure_tensor, disjoint_rectangles
+from .pipeline import detect_gray_image
+from .streaming import STREAM_STRIP_ROWS, open_gray_source, detect_points_of_interest_streaming
+from .tracking import track_points_of_interest
+from .responses import ResponseMapStore
+from .backends import DETECTOR_BACKENDS, detect_with_backend
+from .utils import process_image as process_image_file
+from .cache import DetectionCache, get_detection_cache, estimate_size
+from .sinks import create_result_sink
+from .jobs import process_next_job, cleanup_expired_jobs, claim_next_job, run_job, renew_lease, lease_heartbeat
+from .models import DetectionJob, DetectionTile
+from .results import POINT_DTYPE, _select, image_digest, query_run_points, save_detection_run
+from . import metrics, views, warmup
+from .authentication import DetectorJWTAuthentication, UserStatusCache, get_user_status_cache
+from .views import CustomTokenObtainPairSerializer
+from .benchmarks import benchmark_fast_mode, benchmark_backends, run_benchmarks, compare_with_baseline
+from django.core.management import call_command, CommandError
+from django.utils import timezone
+import msgpack
+from datetime import timedelta
+from django.core.cache import caches
+from django.http import StreamingHttpResponse
+from point_detector.asgi import StreamingASGIHandler
+from django.db import OperationalError
+from rest_framework.test import APITestCase, APIClient, APIRequestFactory
+from process_images import process_image, main, create_session, URL
+import requests
+from unittest.mock import Mock, mock_open, patch
 from rest_framework import status
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from PIL import Image
 from io import BytesIO
 from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
 
 
 class DetectorTests(APITestCase):
@@ -127,14 +166,16 @@ class SerializerTestCase(unittest.TestCase):
                 # Mock для открытия файла и записи
                 mock_file = mock_open()
                 with patch("builtins.open", mock_file):
-                    main(input_files, output_file)
+                    # Mock запроса к API: сервер в тестах не запущен
+                    with patch("process_images.process_image", return_value={"points_of_interest": [1, 2, 3]}):
+                        main(input_files, output_file)
 
-        # Проверка вызовов метода write на объекте файла
+        # Результаты дописываются в файл по мере получения
         handle = mock_file()
-        handle.write.assert_called_once()
+        self.assertGreater(handle.write.call_count, 1)
 
         # Проверка записанных данных
-        written_data = handle.write.call_args[0][0]
+        written_data = ''.join(call[0][0] for call in handle.write.call_args_list)
         if written_data:
             written_data_dict = json.loads(written_data)
         else:
@@ -144,6 +185,82 @@ class SerializerTestCase(unittest.TestCase):
         expected_data_subset = {key: expected_data[key] for key in input_files if key in written_data_dict}
 
         self.assertEqual(written_data_dict, expected_data_subset)
+        self.assertEqual(written_data_dict, expected_data)
+
+
+class ProcessImagesClientTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.output_file = os.path.join(self.directory, 'results.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def fake_process_image(self, image_path, session=None):
+        name = os.path.basename(image_path)
+        if name.startswith('bad'):
+            raise requests.ConnectionError('connection refused')
+        return {'points_of_interest': [[1, 2, 3.0]], 'name': name}
+
+    def test_concurrent_main_streams_all_results(self):
+        # Ограничения в 17 файлов больше нет, неудачные файлы пропускаются
+        input_files = ['{}_Color.png'.format(index) for index in range(40)] + ['bad.png']
+        with patch('process_images.process_image', side_effect=self.fake_process_image):
+            main(iter(input_files), self.output_file, concurrency=4)
+
+        with open(self.output_file, encoding='utf-8') as f:
+            data = json.load(f)
+        self.assertEqual(set(data), set(input_files) - {'bad.png'})
+        self.assertEqual(data['39_Color.png']['name'], '39_Color.png')
+
+    def test_unreadable_file_is_reported_and_skipped(self):
+        # Файл удалён после просмотра каталога: ошибка открытия не прерывает обработку остальных
+        with open(os.path.join(self.directory, 'ok.png'), 'wb') as f:
+            f.write(b'png')
+        session = Mock()
+        session.post.return_value.status_code = 200
+        session.post.return_value.json.return_value = {'points_of_interest': []}
+        output = io.StringIO()
+        with patch('process_images.IMAGES_DIR', self.directory), patch('process_images.create_session', return_value=session):
+            for concurrency in (1, 4):
+                with contextlib.redirect_stdout(output):
+                    main(iter(['missing.png', 'ok.png']), self.output_file, concurrency=concurrency)
+                with open(self.output_file, encoding='utf-8') as f:
+                    self.assertEqual(json.load(f), {'ok.png': {'points_of_interest': []}})
+        self.assertIn('Error processing {}'.format(os.path.join(self.directory, 'missing.png')), output.getvalue())
+
+    def test_session_pools_connections_and_retries_post(self):
+        session = create_session(concurrency=8)
+        adapter = session.get_adapter(URL)
+        self.assertEqual(adapter._pool_maxsize, 8)
+        self.assertEqual(adapter.max_retries.total, 3)
+        self.assertIn('POST', adapter.max_retries.allowed_methods)
+        self.assertIn(503, adapter.max_retries.status_forcelist)
+
+    def test_only_transient_statuses_are_retried(self):
+        requests_seen = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers['Content-Length']))
+                requests_seen.append(self.path)
+                self.send_response(int(self.path.strip('/')))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        session = create_session(backoff_factor=0)
+        for code, attempts in ((500, 1), (503, 4)):
+            requests_seen.clear()
+            response = session.post(f'http://127.0.0.1:{server.server_port}/{code}', files={'image': b'png'})
+            self.assertEqual(response.status_code, code)
+            self.assertEqual(len(requests_seen), attempts)
 
 
 class RegisterUserViewTests(APITestCase):
@@ -256,24 +373,1490 @@ class UtilsTests(unittest.TestCase):
         # Проверяем, что углы не были найдены
         self.assertEqual(len(points), 0)
 
-    def test_detect_points_of_interest_save_json(self):
-        # Генерируем синтетическое черно-белое изображение с простым узором
+    def test_detect_points_of_interest_does_not_write_files(self):
+        # Детектор - чистая функция: сохранением результатов занимаются sinks
         image = np.zeros((100, 100), np.uint8)
-        cv2.circle(image, (50, 50), 10, 255, -1)  # белый круг в центре
+        cv2.rectangle(image, (30, 30), (70, 70), 255, -1)  # белый квадрат в центре
 
-        # Обрабатываем изображение для получения углов
-        points = detect_points_of_interest(image)
+        with patch('builtins.open') as mocked_open:
+            points = detect_points_of_interest(image)
+
+        self.assertGreater(len(points), 0)
+        mocked_open.assert_not_called()
+
+
+class ResultSinkTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.points = [[32, 32, 7346585460.9375], [68, 32, 7346585460.9375]]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_null_sink(self):
+        create_result_sink('none').submit('1_Color.png', self.points)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_file_sink_writes_one_file_per_result(self):
+        sink = create_result_sink('file', {'DIRECTORY': self.directory})
+        first = sink.submit('../1_Color.png', self.points)
+        sink.submit('1_Color.png', [])
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+        self.assertEqual(os.path.dirname(first), self.directory)
+        with open(first) as json_file:
+            self.assertEqual(json.load(json_file), self.points)
+
+    def test_background_sink_flushes_batches(self):
+        path = os.path.join(self.directory, 'results.jsonl')
+        sink = create_result_sink('background', {'PATH': path, 'BATCH_SIZE': 2, 'FLUSH_INTERVAL': 0.05})
+        for index in range(5):
+            sink.submit('{}.png'.format(index), self.points)
+        sink.close()
+        with open(path) as results_file:
+            records = [json.loads(line) for line in results_file]
+        self.assertEqual([record['name'] for record in records], ['0.png', '1.png', '2.png', '3.png', '4.png'])
+        self.assertEqual(records[0]['points'], self.points)
+        self.assertEqual(sink.written, 5)
+
+    def test_background_sink_drops_when_queue_is_full(self):
+        path = os.path.join(self.directory, 'results.jsonl')
+        sink = create_result_sink('background', {'PATH': path, 'MAX_QUEUE': 1, 'FLUSH_INTERVAL': 0.05})
+        with patch.object(sink, '_write'):
+            sink._stop.set()
+            sink._thread.join()
+            sink.submit('a.png', self.points)
+            sink.submit('b.png', self.points)
+        self.assertEqual(sink.dropped, 1)
+
+
+class HarrisEngineTests(unittest.TestCase):
+    def test_matches_reference_on_input_images(self):
+        # Векторизованный детектор должен совпадать с попиксельным эталоном точка в точку
+        paths = sorted(glob.glob('input/*.png'))
+        self.assertGreater(len(paths), 0)
+        for path in paths:
+            with self.subTest(path=path):
+                gray = cv2.cvtColor(cv2.imread(path, cv2.IMREAD_COLOR), cv2.COLOR_BGR2GRAY)
+                self.assertEqual(detect_points_of_interest(gray), detect_points_of_interest_reference(gray))
+
+    def test_matches_reference_for_other_window_sizes(self):
+        image = np.zeros((60, 80), np.uint8)
+        cv2.rectangle(image, (20, 15), (55, 45), 200, -1)
+        for window_size in (3, 4, 9):
+            with self.subTest(window_size=window_size):
+                self.assertEqual(
+                    detect_points_of_interest(image, window_size=window_size),
+                    detect_points_of_interest_reference(image, window_size=window_size)
+                )
+
+    def test_parallel_strips_match_single_threaded(self):
+        # Полосы с гало не должны давать расхождений и дубликатов на стыках
+        gray = cv2.cvtColor(cv2.imread('input/1_Color.png', cv2.IMREAD_COLOR), cv2.COLOR_BGR2GRAY)
+        expected = detect_points_of_interest(gray)
+        for workers in (2, 3, 7):
+            with self.subTest(workers=workers):
+                self.assertEqual(detect_points_of_interest(gray, workers=workers), expected)
+
+    def test_image_smaller_than_window(self):
+        image = np.full((4, 4), 255, np.uint8)
+        self.assertEqual(detect_points_of_interest(image), [])
+        self.assertEqual(detect_points_of_interest(image, low_memory=True), [])
+
+
+class LowMemoryTests(unittest.TestCase):
+    def test_integer_response_is_bit_identical(self):
+        rng = np.random.default_rng(0)
+        # Шахматная доска 0/255 даёт максимальные градиенты и суммы для окна 63
+        checkerboard = (np.indices((150, 170)).sum(axis=0) % 2 * 255).astype(np.uint8)
+        for image in (process_image_file('input/1_Color.png'), rng.integers(0, 256, (97, 131), np.uint8), checkerboard):
+            for window_size in (1, 3, 7, 8, 63):
+                rows, cols = image.shape[0] - window_size // 2 * 2, image.shape[1] - window_size // 2 * 2
+                expected = harris_response_region(image, 0.2, window_size, 0, rows, 0, cols)
+                for top, bottom, left, right in ((0, rows, 0, cols), (5, rows - 3, 2, cols - 1)):
+                    response = harris_response_region_low_memory(image, 0.2, window_size, top, bottom, left, right)
+                    np.testing.assert_array_equal(response, expected[top:bottom, left:right])
+
+    def test_matches_full_detector(self):
+        for path in sorted(glob.glob('input/*.png'))[:3]:
+            image = process_image_file(path)
+            for params in ({}, {'nms_radius': 3}, {'nms_radius': 2, 'max_points': 50}, {'window_size': 15}):
+                expected = detect_corners(image, **params)
+                for workers in (1, 3):
+                    self.assertEqual(detect_corners(image, low_memory=True, workers=workers, **params), expected)
+
+    def test_other_dtypes_use_full_precision(self):
+        image = process_image_file('input/1_Color.png')
+        # 16-битные градиенты переполняют int16, дробные значения теряются при округлении
+        for converted in (image.astype(np.uint16) * 257, image.astype(np.float32) / 255, image.astype(np.float64) + 0.5):
+            for params in ({}, {'threshold': 0.1, 'nms_radius': 2}):
+                self.assertEqual(detect_corners(converted, low_memory=True, **params), detect_corners(converted, **params))
+        with self.assertRaises(ValueError):
+            scaled_gradients(image.astype(np.uint16), ScratchBuffers())
+
+    def test_setting_enables_low_memory_pipeline(self):
+        get_detection_cache().clear()
+        image = process_image_file('input/2_Color.png')
+        with override_settings(DETECTOR_LOW_MEMORY=True):
+            with patch('detector.utils.detect_low_memory', wraps=detect_low_memory) as low_memory:
+                points = detect_gray_image(image)
+        low_memory.assert_called_once()
+        self.assertEqual(points, detect_corners(image))
+
+
+def deflate_tiff_chunks(chunks, row_width, predictor=1):
+    """Сжатие полос или тайлов TIFF zlib; predictor=2 - горизонтальная разность по модулю 256."""
+    if predictor == 2:
+        chunks = [
+            np.diff(np.frombuffer(chunk, np.uint8).reshape(-1, row_width), axis=1, prepend=0).astype(np.uint8).tobytes()
+            for chunk in chunks
+        ]
+    return [zlib.compress(chunk) for chunk in chunks]
+
+
+def tiff_chunks(image, rows_per_strip=None, tile=None):
+    """Несжатые полосы по rows_per_strip строк или тайлы tile = (ширина, высота), дополненные нулями."""
+    height, width = image.shape
+    if not tile:
+        return [image[top:top + rows_per_strip].tobytes() for top in range(0, height, rows_per_strip)]
+    tile_width, tile_length = tile
+    padded = np.zeros((-(-height // tile_length) * tile_length, -(-width // tile_width) * tile_width), np.uint8)
+    padded[:height, :width] = image
+    return [padded[top:top + tile_length, left:left + tile_width].tobytes()
+            for top in range(0, padded.shape[0], tile_length) for left in range(0, padded.shape[1], tile_width)]
+
+
+def write_tiff(path, image, rows_per_strip=None, tile=None, deflate=False, predictor=1):
+    """
+    TIFF в оттенках серого полосами по rows_per_strip строк или тайлами tile = (ширина, высота).
+    deflate=True сжимает полосы и тайлы zlib, predictor=2 - с горизонтальной разностью.
+    """
+    height, width = image.shape
+    chunks = tiff_chunks(image, rows_per_strip, tile)
+    if deflate:
+        chunks = deflate_tiff_chunks(chunks, tile[0] if tile else width, predictor)
+    data = b''.join(chunks)
+    offsets = np.cumsum([8] + [len(chunk) for chunk in chunks[:-1]]).tolist()
+    counts = [len(chunk) for chunk in chunks]
+    arrays_at = 8 + len(data)
+    entries = [(256, 4, [width]), (257, 4, [height]), (258, 3, [8]), (259, 3, [8 if deflate else 1]), (262, 3, [1]),
+               (277, 3, [1]), (317, 3, [predictor])]
+    if tile:
+        entries += [(322, 4, [tile[0]]), (323, 4, [tile[1]]), (324, 4, offsets), (325, 4, counts)]
+    else:
+        entries += [(273, 4, offsets), (278, 4, [rows_per_strip]), (279, 4, counts)]
+    extra = b''
+    ifd_offset = arrays_at
+    for _, _, values in entries:
+        if len(values) > 1:
+            ifd_offset += 4 * len(values)
+    ifd = struct.pack('<H', len(entries))
+    position = arrays_at
+    for tag, kind, values in sorted(entries):
+        if len(values) == 1:
+            value = struct.pack('<H', values[0]) + b'\0\0' if kind == 3 else struct.pack('<I', values[0])
+        else:
+            value = struct.pack('<I', position)
+            extra += struct.pack(f'<{len(values)}I', *values)
+            position += 4 * len(values)
+        ifd += struct.pack('<HHI', tag, kind, len(values)) + value
+    ifd += struct.pack('<I', 0)
+    with open(path, 'wb') as tiff_file:
+        tiff_file.write(b'II*\0' + struct.pack('<I', ifd_offset) + data + extra + ifd)
+
+
+class StreamingDetectionTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.image = process_image_file('input/1_Color.png')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def collect(self, source, **params):
+        parts = list(detect_points_of_interest_streaming(source, **params))
+        self.assertTrue(all(isinstance(part, Corners) for part in parts))
+        return [point for part in parts for point in part.tolist()]
+
+    def test_strips_match_full_detection(self):
+        for params in ({}, {'nms_radius': 3, 'strip_rows': 37}, {'window_size': 15, 'strip_rows': 64},
+                       {'nms_radius': 1, 'strip_rows': 1}):
+            strip_rows = params.pop('strip_rows', STREAM_STRIP_ROWS)
+            self.assertEqual(self.collect(self.image, strip_rows=strip_rows, **params),
+                             detect_points_of_interest(self.image, **params))
+
+    def test_memory_mapped_sources(self):
+        expected = detect_points_of_interest(self.image, nms_radius=2)
+        npy_path = os.path.join(self.directory, 'image.npy')
+        raw_path = os.path.join(self.directory, 'image.raw')
+        np.save(npy_path, self.image)
+        self.image.tofile(raw_path)
+        self.assertEqual(self.collect(open_gray_source(npy_path), nms_radius=2, strip_rows=100), expected)
+        self.assertEqual(
+            self.collect(open_gray_source(raw_path, shape=self.image.shape), nms_radius=2, strip_rows=100), expected
+        )
+        with self.assertRaises(ValueError):
+            open_gray_source(raw_path)
+
+    def test_strip_and_tiled_tiff(self):
+        expected = detect_points_of_interest(self.image)
+        for name, layout in (('strips.tif', {'rows_per_strip': 7}), ('tiles.tif', {'tile': (48, 32)})):
+            path = os.path.join(self.directory, name)
+            write_tiff(path, self.image, **layout)
+            source = open_gray_source(path)
+            np.testing.assert_array_equal(source[13:301], self.image[13:301])
+            self.assertEqual(self.collect(source, strip_rows=50), expected)
+
+    def test_rgb_tiff(self):
+        rgb_path = os.path.join(self.directory, 'rgb.tif')
+        Image.fromarray(np.dstack([self.image] * 3)).save(rgb_path, compression=None)
+        np.testing.assert_array_equal(open_gray_source(rgb_path)[0:10], self.image[0:10])
+
+    def test_compressed_tiff_matches_full_detection(self):
+        expected = detect_points_of_interest(self.image, nms_radius=2)
+        rgb = np.dstack([self.image] * 3)
+        for name, image, compression in (('lzw.tif', self.image, 'tiff_lzw'), ('rgb_lzw.tif', rgb, 'tiff_lzw'),
+                                         ('deflate.tif', self.image, 'tiff_adobe_deflate'),
+                                         ('packbits.tif', self.image, 'packbits')):
+            path = os.path.join(self.directory, name)
+            Image.fromarray(image).save(path, compression=compression)
+            self.assertEqual(self.collect(open_gray_source(path), nms_radius=2, strip_rows=50), expected)
+
+        for name, layout in (('strips.tif', {'rows_per_strip': 7, 'predictor': 2}), ('tiles.tif', {'tile': (48, 32)}),
+                             ('tiles_predictor.tif', {'tile': (48, 32), 'predictor': 2})):
+            path = os.path.join(self.directory, name)
+            write_tiff(path, self.image, deflate=True, **layout)
+            source = open_gray_source(path)
+            np.testing.assert_array_equal(source[13:301], self.image[13:301])
+            self.assertEqual(self.collect(source, nms_radius=2, strip_rows=50), expected)
+
+    def test_compressed_tiff_decodes_each_strip_once(self):
+        path = os.path.join(self.directory, 'strips.tif')
+        write_tiff(path, self.image, rows_per_strip=16, deflate=True)
+        source = open_gray_source(path)
+        with patch.object(source, '_decode_tile', wraps=source._decode_tile) as decode:
+            self.collect(source, nms_radius=2, strip_rows=50)
+        # Соседние запросы перекрываются гало, но полосы на границе не распаковываются повторно
+        self.assertEqual(decode.call_count, -(-self.image.shape[0] // 16))
+        # Хранятся только полосы последнего запроса
+        self.assertLessEqual(len(source._decoded), 50 // 16 + 2)
+
+    def test_unsupported_or_corrupt_compressed_tiff(self):
+        path = os.path.join(self.directory, 'unknown.tif')
+        write_tiff(path, self.image, rows_per_strip=16, deflate=True)
+        with open(path, 'r+b') as tiff_file:
+            data = tiff_file.read()
+            # Тег Compression (259, SHORT, 1 значение) с неизвестным кодом сжатия
+            position = data.index(struct.pack('<HHIH', 259, 3, 1, 8))
+            tiff_file.seek(position + 8)
+            tiff_file.write(struct.pack('<H', 65000))
+        with self.assertRaises(ValueError):
+            open_gray_source(path)
+
+        # Первая полоса повреждена: ошибка распаковки обнаруживается при открытии
+        write_tiff(path, self.image, rows_per_strip=16, deflate=True)
+        with open(path, 'r+b') as tiff_file:
+            tiff_file.seek(8)
+            tiff_file.write(b'\xff' * 64)
+        with self.assertRaises(ValueError):
+            open_gray_source(path)
+
+
+class TrackingTests(unittest.TestCase):
+    def setUp(self):
+        image = process_image_file('input/17_Color.png')
+        # Камера сдвигается на 2 пикселя по каждой оси между кадрами
+        self.frames = [image[shift:shift + 400, shift:shift + 560] for shift in range(0, 10, 2)]
+        self.params = {'nms_radius': 3, 'max_points': 200}
+
+    def test_tracks_between_keyframes(self):
+        results = list(track_points_of_interest(self.frames, **self.params))
+        self.assertEqual([frame['keyframe'] for frame in results], [True, False, False, False, False])
+        self.assertEqual(results[0]['corners'], detect_corners(self.frames[0], **self.params))
+        for frame, result in zip(self.frames[1:], results[1:]):
+            tracked = np.column_stack([result['corners'].x, result['corners'].y])
+            detected = detect_corners(frame, **self.params)
+            detected = np.column_stack([detected.x, detected.y])
+            distances = np.abs(tracked[:, None, :] - detected[None, :, :]).max(axis=2).min(axis=1)
+            self.assertGreater(result['tracked'], 50)
+            self.assertGreater(np.mean(distances <= 1), 0.9)
+
+    def test_redetects_when_tracking_is_lost(self):
+        frames = [self.frames[0], np.zeros_like(self.frames[0]), self.frames[1]]
+        results = list(track_points_of_interest(frames, **self.params))
+        self.assertEqual([frame['keyframe'] for frame in results], [True, True, True])
+        self.assertEqual(len(results[1]['corners']), 0)
+
+    def test_keyframe_interval(self):
+        results = list(track_points_of_interest(self.frames, keyframe_interval=2, **self.params))
+        self.assertEqual([frame['keyframe'] for frame in results], [True, False, True, False, True])
+
+
+class NonMaximumSuppressionTests(unittest.TestCase):
+    def setUp(self):
+        self.image = np.zeros((100, 100), np.uint8)
+        cv2.rectangle(self.image, (30, 30), (70, 70), 255, -1)
+
+    def test_nms_keeps_one_point_per_corner(self):
+        # Кластер соседних точек у каждого угла квадрата сводится к одной точке
+        points = detect_points_of_interest(self.image, nms_radius=3)
+        self.assertEqual([[x, y] for x, y, _ in points], [[32, 32], [68, 32], [32, 68], [68, 68]])
+
+    def test_nms_result_is_subset_of_full_result(self):
+        full = detect_points_of_interest(self.image)
+        suppressed = detect_points_of_interest(self.image, nms_radius=2)
+        self.assertLess(len(suppressed), len(full))
+        for point in suppressed:
+            self.assertIn(point, full)
+
+    def test_max_points_returns_strongest(self):
+        full = detect_points_of_interest(self.image)
+        limited = detect_points_of_interest(self.image, max_points=10)
+        self.assertEqual(len(limited), 10)
+        weakest_kept = min(r for _, _, r in limited)
+        dropped = [point for point in full if point not in limited]
+        self.assertTrue(all(r <= weakest_kept for _, _, r in dropped))
+        # Порядок точек остаётся построчным, как и без ограничения
+        self.assertEqual(limited, [point for point in full if point in limited])
+
+
+class FastModeTests(unittest.TestCase):
+    def setUp(self):
+        self.gray_image = process_image_file('input/1_Color.png')
+
+    def test_fast_mode_is_subset_of_full_mode(self):
+        for nms_radius in (0, 3):
+            full = detect_points_of_interest(self.gray_image, nms_radius=nms_radius)
+            fast = detect_points_of_interest(self.gray_image, nms_radius=nms_radius, mode='fast')
+            self.assertGreater(len(fast), 0.8 * len(full))
+            # Найденные точки совпадают с полным режимом вместе с откликом и порядком
+            self.assertEqual(fast, [point for point in full if point in fast])
+
+    def test_fast_mode_max_points(self):
+        fast = detect_points_of_interest(self.gray_image, mode='fast', max_points=20)
+        full = detect_points_of_interest(self.gray_image, mode='fast')
+        self.assertEqual(len(fast), 20)
+        self.assertEqual(min(r for _, _, r in fast), sorted((r for _, _, r in full), reverse=True)[19])
+
+    def test_fast_mode_benchmark_report(self):
+        report = benchmark_fast_mode([('1_Color.png', self.gray_image)], repeat=1)
+        self.assertEqual(len(report['images']), 1)
+        self.assertGreater(report['recall'], 0.8)
+        self.assertLessEqual(report['recall'], 1.0)
+
+
+class RegionOfInterestTests(unittest.TestCase):
+    def setUp(self):
+        self.gray_image = process_image_file('input/17_Color.png')
+        self.rois = [[100, 50, 200, 150], [250, 100, 100, 300], [400, 400, 300, 300], [0, 0, 5, 5]]
+
+    def filtered(self, corners, keep):
+        return Corners(corners.x[keep], corners.y[keep], corners.r[keep])
+
+    def in_rois(self, corners):
+        keep = np.zeros(len(corners), bool)
+        for x, y, width, height in self.rois:
+            keep |= (corners.x >= x) & (corners.x < x + width) & (corners.y >= y) & (corners.y < y + height)
+        return keep
+
+    def test_rois_and_mask_match_filtered_full_detection(self):
+        mask = np.zeros(self.gray_image.shape, np.uint8)
+        cv2.circle(mask, (320, 240), 100, 255, -1)
+        cv2.circle(mask, (50, 400), 30, 255, -1)
+        for params in ({}, {'nms_radius': 3}, {'window_size': 15, 'threshold': 1e8}):
+            full = detect_corners(self.gray_image, **params)
+            in_rois, on_mask = self.in_rois(full), mask[full.y, full.x] != 0
+            for low_memory in (False, True):
+                self.assertEqual(detect_corners(self.gray_image, rois=self.rois, low_memory=low_memory, **params),
+                                 self.filtered(full, in_rois))
+                self.assertEqual(detect_corners(self.gray_image, mask=mask, low_memory=low_memory, **params),
+                                 self.filtered(full, on_mask))
+            self.assertEqual(detect_corners(self.gray_image, rois=self.rois, mask=mask, **params),
+                             self.filtered(full, in_rois | on_mask))
+
+    def test_max_points_within_rois(self):
+        corners = detect_corners(self.gray_image, rois=self.rois, max_points=5)
+        expected = detect_corners(self.gray_image, rois=self.rois)
+        self.assertEqual(len(corners), 5)
+        self.assertEqual(corners.r.min(), np.sort(expected.r)[-5])
+
+    def test_disjoint_rectangles_cover_union(self):
+        rng = np.random.default_rng(0)
+        rects = []
+        for _ in range(20):
+            top, left = rng.integers(0, 80, 2)
+            rects.append((int(top), int(top + rng.integers(1, 30)), int(left), int(left + rng.integers(1, 30))))
+        union = np.zeros((120, 120), np.int32)
+        for top, bottom, left, right in rects:
+            union[top:bottom, left:right] = 1
+        covered = np.zeros((120, 120), np.int32)
+        for top, bottom, left, right in disjoint_rectangles(rects):
+            covered[top:bottom, left:right] += 1
+        np.testing.assert_array_equal(covered, union)
+
+    def test_cost_scales_with_roi_area(self):
+        image = np.tile(self.gray_image, (4, 4))
+        areas = []
+
+        def response_region(gray_image, k, window_size, top, bottom, left, right):
+            areas.append((bottom - top) * (right - left))
+            return harris_response_region(gray_image, k, window_size, top, bottom, left, right)
+
+        with patch('detector.utils.harris_response_region', response_region):
+            detect_corners(image, rois=[[1000, 800, 200, 100]], nms_radius=2)
+        self.assertEqual(sum(areas), 204 * 104)
+
+    def test_invalid_combinations(self):
+        with self.assertRaises(ValueError):
+            detect_corners(self.gray_image, rois=self.rois, mode='fast')
+        with self.assertRaises(ValueError):
+            detect_corners(self.gray_image, mask=np.ones((10, 10), bool))
+        with self.assertRaises(ValueError):
+            detect_with_backend(self.gray_image, 'opencv_harris', rois=self.rois)
+
+
+class ResponseMapStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.gray_image = process_image_file('input/17_Color.png')
+
+    def test_staged_detection_matches_detector(self):
+        store = ResponseMapStore(64 * 1024 * 1024)
+        handle = store.add(self.gray_image)
+        for params in ({}, {'threshold': 5e6}, {'k': 0.05, 'nms_radius': 3}, {'k': 0.05, 'max_points': 20},
+                       {'window_size': 15, 'threshold': 1e8}, {}):
+            _, corners = store.detect(handle, **params)
+            self.assertEqual(corners, detect_corners(self.gray_image, **params))
+        for workers in (1, 3):
+            sums = structure_tensor(self.gray_image, 7, workers)
+            np.testing.assert_array_equal(
+                sums[0] * sums[2] - sums[1] ** 2 - 0.2 * (sums[0] + sums[2]) ** 2, harris_response(self.gray_image)
+            )
+
+    def test_rethreshold_reuses_maps(self):
+        store = ResponseMapStore(64 * 1024 * 1024)
+        handle = store.add(self.gray_image)
+        store.detect(handle)
+        with patch('detector.responses.structure_tensor') as sums, patch('detector.responses.response_from_sums') as response:
+            store.detect(handle, threshold=1e7, nms_radius=2)
+            sums.assert_not_called()
+            response.assert_not_called()
+        with patch('detector.responses.structure_tensor', wraps=structure_tensor) as sums:
+            store.detect(handle, k=0.1)
+            sums.assert_not_called()
+            store.detect(handle, window_size=9)
+            sums.assert_called_once()
+
+    def test_shared_tier_restores_handle_in_another_worker(self):
+        # Хранилища двух воркеров с общим бэкендом кэша
+        first, second = (ResponseMapStore(64 * 1024 * 1024, shared_alias='default') for _ in range(2))
+        self.addCleanup(caches['default'].clear)
+        handle = first.add(self.gray_image, owner=1, name='a.png', reduce=2)
+        with self.assertRaises(KeyError):
+            ResponseMapStore(64 * 1024 * 1024).get(handle, owner=1)
+        with self.assertRaises(KeyError):
+            second.get(handle, owner=2)
+
+        entry, corners = second.detect(handle, owner=1, threshold=1e7)
+        self.assertEqual((entry.name, entry.reduce), ('a.png', 2))
+        self.assertEqual(corners, detect_corners(self.gray_image, threshold=1e7))
+        self.assertEqual(second.stats()['shared_hits'], 1)
+
+        second.discard(handle, owner=1)
+        with self.assertRaises(KeyError):
+            ResponseMapStore(64 * 1024 * 1024, shared_alias='default').get(handle, owner=1)
+
+    def test_memory_budget_evicts_least_recently_used(self):
+        # Изображение 480x640 с суммами и картой отклика для окна 7 занимает около 10 МБ
+        store = ResponseMapStore(25 * 1024 * 1024)
+        handles = [store.add(self.gray_image) for _ in range(3)]
+        store.detect(handles[0])
+        store.detect(handles[1])
+        store.get(handles[0])
+        store.detect(handles[2])
+        self.assertLessEqual(store.current_bytes, store.max_bytes)
+        self.assertEqual(store.stats()['evictions'], 1)
+        with self.assertRaises(KeyError):
+            store.get(handles[1])
+        store.get(handles[0])
+
+    def test_oversized_entry_keeps_only_image(self):
+        store = ResponseMapStore(2 * self.gray_image.nbytes)
+        handle = store.add(self.gray_image, owner=1)
+        _, corners = store.detect(handle, owner=1)
+        self.assertEqual(corners, detect_corners(self.gray_image))
+        self.assertEqual(store.current_bytes, self.gray_image.nbytes)
+        self.assertIsNone(ResponseMapStore(10).add(self.gray_image))
+        with self.assertRaises(KeyError):
+            store.detect(handle, owner=2)
+
+
+class DetectorBackendTests(unittest.TestCase):
+    def setUp(self):
+        self.gray_image = process_image_file('input/17_Color.png')
+
+    def test_backends_share_output_contract(self):
+        for backend in DETECTOR_BACKENDS:
+            image = self.gray_image[96:192, 128:256] if backend == 'reference' else self.gray_image
+            corners = detect_with_backend(image, backend)
+            self.assertIsInstance(corners, Corners)
+            self.assertGreater(len(corners), 0, backend)
+            # Построчный порядок обхода, как у numpy
+            order = corners.y.astype(np.int64) * image.shape[1] + corners.x
+            self.assertTrue(np.all(np.diff(order) > 0), backend)
+
+    def test_harris_backends_match_numpy(self):
+        crop = self.gray_image[96:192, 128:256]
+        self.assertEqual(detect_with_backend(crop, 'reference').tolist(), detect_points_of_interest(crop))
+        for window_size in (3, 7, 15):
+            expected = detect_corners(self.gray_image, window_size=window_size, nms_radius=3)
+            corners = detect_with_backend(self.gray_image, 'opencv_harris', window_size=window_size, nms_radius=3)
+            np.testing.assert_array_equal(corners.x, expected.x)
+            np.testing.assert_array_equal(corners.y, expected.y)
+            np.testing.assert_allclose(corners.r, expected.r, rtol=1e-3)
+
+    def test_nms_and_max_points(self):
+        for backend in ('opencv_harris', 'shi_tomasi', 'fast'):
+            all_corners = detect_with_backend(self.gray_image, backend)
+            limited = detect_with_backend(self.gray_image, backend, max_points=10)
+            self.assertEqual(len(limited), 10)
+            self.assertEqual(limited.r.min(), np.sort(all_corners.r)[-10])
+            self.assertLess(len(detect_with_backend(self.gray_image, backend, nms_radius=5)), len(all_corners))
+
+    def test_unsupported_params(self):
+        with self.assertRaises(ValueError):
+            detect_with_backend(self.gray_image, 'fast', k=0.1)
+        with self.assertRaises(ValueError):
+            detect_with_backend(self.gray_image, 'unknown')
+        # Параметры исполнения пропускаются бэкендами, которые их не принимают
+        detect_with_backend(self.gray_image, 'shi_tomasi', workers=4, low_memory=True)
+
+    def test_backend_benchmark(self):
+        results = benchmark_backends(repeat=1, sizes=[(64, 96)])
+        self.assertEqual(len(results), len(DETECTOR_BACKENDS))
+        self.assertIn('backends/fast/96x64', results)
+        self.assertGreater(results['backends/numpy/96x64']['megapixels_per_s'], 0)
+
+
+class BenchmarkTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.report_path = os.path.join(self.directory, 'report.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_report_covers_requested_suites(self):
+        report = run_benchmarks(['detect', 'request'], repeat=1, sizes=[(256, 256)], window_sizes=[3])
+        names = report['benchmarks'].keys()
+        self.assertIn('detect/synthetic/256x256', names)
+        self.assertIn('detect/window/3', names)
+        self.assertIn('detect/input/1_Color.png', names)
+        self.assertIn('request/process-image/1_Color.png', names)
+        self.assertTrue(all(entry['median_ms'] > 0 for entry in report['benchmarks'].values()))
+
+    def test_compare_with_baseline(self):
+        report = {'benchmarks': {'a': {'median_ms': 13.0}, 'b': {'median_ms': 11.0}, 'c': {'median_ms': 1.0}}}
+        baseline = {'benchmarks': {'a': {'median_ms': 10.0}, 'b': {'median_ms': 10.0}}}
+        regressions = compare_with_baseline(report, baseline, threshold=0.2)
+        self.assertEqual([regression['name'] for regression in regressions], ['a'])
+
+    def test_command_writes_report_and_fails_on_regression(self):
+        call_command('benchmark', 'serialize', '--repeat', '1', '--output', self.report_path, stdout=io.StringIO())
+        with open(self.report_path) as report_file:
+            report = json.load(report_file)
+        self.assertIn('serialize/input/1_Color.png', report['benchmarks'])
+
+        # Базовый отчёт в 100 раз быстрее текущего - команда должна сообщить о регрессии
+        for entry in report['benchmarks'].values():
+            entry['median_ms'] /= 100
+        with open(self.report_path, 'w') as report_file:
+            json.dump(report, report_file)
+        with self.assertRaises(CommandError):
+            call_command('benchmark', 'serialize', '--repeat', '1', '--baseline', self.report_path,
+                         stdout=io.StringIO(), stderr=io.StringIO())
+
+
+class ImageProcessingViewTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='detector', password='testpass')
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('image_processing_view')
+
+    def post_image(self, **fields):
+        with open('input/1_Color.png', 'rb') as image_file:
+            return self.client.post(self.url, {'image': image_file, **fields}, format='multipart')
+
+    def test_process_image_with_nms_and_max_points(self):
+        response = self.post_image(nms_radius=3, max_points=5)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        points = json.loads(response.content)['points_of_interest']
+        self.assertEqual(len(points), 5)
+
+    def test_process_image_fast_mode(self):
+        response = self.post_image(mode='fast', nms_radius=3)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        full = self.post_image(nms_radius=3)
+        fast_points = json.loads(response.content)['points_of_interest']
+        self.assertTrue(all(point in json.loads(full.content)['points_of_interest'] for point in fast_points))
+
+    def test_process_image_invalid_params(self):
+        response = self.post_image(nms_radius=-1)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('nms_radius', json.loads(response.content)['error'])
+
+    def test_process_image_without_image(self):
+        response = self.client.post(self.url, {}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_process_image_retained_response_map(self):
+        response = self.post_image(retain='true', reduce=2)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = json.loads(response.content)
+        handle_url = reverse('response_map_view', args=[data['handle']])
+        self.assertEqual(data['points_of_interest'], json.loads(self.post_image(reduce=2).content)['points_of_interest'])
+
+        response = self.client.post(handle_url, {'threshold': 1e5, 'k': 0.1, 'nms_radius': 2}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = json.loads(self.post_image(reduce=2, threshold=1e5, k=0.1, nms_radius=2).content)
+        self.assertEqual(json.loads(response.content)['points_of_interest'], expected['points_of_interest'])
+
+        other = User.objects.create_user(username='other', password='testpass')
+        self.client.force_authenticate(user=other)
+        self.assertEqual(self.client.post(handle_url, {}, format='json').status_code, status.HTTP_404_NOT_FOUND)
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.client.delete(handle_url).status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.post(handle_url, {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertIn('unknown to this worker process', json.loads(response.content)['error'])
+
+    def test_process_image_retain_requires_numpy_full_mode(self):
+        self.assertEqual(self.post_image(retain='true', backend='fast').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.post_image(retain='true', mode='fast').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_process_image_with_rois_and_mask(self):
+        rois = [[100, 50, 200, 150], [300, 200, 150, 150]]
+        full = json.loads(self.post_image(nms_radius=2).content)['points_of_interest']
+        response = self.post_image(nms_radius=2, rois=json.dumps(rois))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = [point for point in full
+                    if any(x <= point[0] < x + w and y <= point[1] < y + h for x, y, w, h in rois)]
+        self.assertEqual(json.loads(response.content)['points_of_interest'], expected)
+
+        # При уменьшенном декодировании области пересчитываются, координаты возвращаются в исходном масштабе
+        reduced = json.loads(self.post_image(reduce=2, rois=json.dumps(rois)).content)['points_of_interest']
+        self.assertTrue(reduced)
+        self.assertTrue(all(any(x <= px < x + w and y <= py < y + h for x, y, w, h in rois) for px, py, _ in reduced))
+
+        mask = np.zeros((480, 640), np.uint8)
+        mask[100:300, 200:400] = 255
+        with open('input/1_Color.png', 'rb') as image_file:
+            response = self.client.post(self.url, {
+                'image': image_file, 'nms_radius': 2,
+                'mask': SimpleUploadedFile('mask.png', cv2.imencode('.png', mask)[1].tobytes()),
+            }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = [point for point in full if 200 <= point[0] < 400 and 100 <= point[1] < 300]
+        self.assertEqual(json.loads(response.content)['points_of_interest'], expected)
+
+    def test_process_image_invalid_rois(self):
+        for rois in ('[[1, 2, 3]]', '[[0, 0, 0, 10]]', 'not json', '[]', json.dumps([[0, 0, 1, 1]] * 65)):
+            self.assertEqual(self.post_image(rois=rois).status_code, status.HTTP_400_BAD_REQUEST, rois)
+        self.assertEqual(self.post_image(rois='[[0, 0, 10, 10]]', backend='fast').status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.post_image(rois='[[0, 0, 10, 10]]', mode='fast').status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        with open('input/1_Color.png', 'rb') as image_file:
+            mask = SimpleUploadedFile('mask.png', cv2.imencode('.png', np.ones((10, 10), np.uint8))[1].tobytes())
+            response = self.client.post(self.url, {'image': image_file, 'mask': mask}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_process_image_backend_selection(self):
+        get_detection_cache().clear()
+        gray_image = process_image_file('input/1_Color.png')
+        for backend in ('shi_tomasi', 'fast'):
+            response = self.post_image(backend=backend, nms_radius=3)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(json.loads(response.content)['points_of_interest'],
+                             detect_with_backend(gray_image, backend, nms_radius=3).tolist())
+        with override_settings(DETECTOR_BACKEND='fast'):
+            response = self.post_image()
+        self.assertEqual(json.loads(response.content)['points_of_interest'],
+                         detect_with_backend(gray_image, 'fast').tolist())
+
+    def test_process_image_backend_params(self):
+        response = self.post_image(backend='fast', k=0.1)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('k', json.loads(response.content)['error'])
+        response = self.post_image(backend='unknown')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_process_image_reduced_decode(self):
+        # Координаты после уменьшенного декодирования пересчитываются в исходное разрешение
+        response = self.post_image(reduce=2)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        points = json.loads(response.content)['points_of_interest']
+        self.assertGreater(len(points), 0)
+        self.assertTrue(all(x % 2 == 0 and y % 2 == 0 for x, y, _ in points))
+
+    def test_repeated_upload_is_served_from_cache(self):
+        cache = get_detection_cache()
+        cache.clear()
+        first = self.post_image(max_points=7)
+        second = self.post_image(max_points=7)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(cache.stats()['misses'], 1)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def expected_points(self):
+        return detect_points_of_interest(process_image_file('input/1_Color.png'))
+
+    def test_default_response_is_plain_json(self):
+        # Ответ больше не кодируется в JSON дважды
+        response = self.post_image()
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(response.content)['points_of_interest'], self.expected_points())
 
-        # Проверяем, что JSON файл был создан и содержит данные
-        json_path = 'output/results.json'
-        self.assertTrue(os.path.exists(json_path))
+    def test_columnar_json_format(self):
+        with open('input/1_Color.png', 'rb') as image_file:
+            response = self.client.post(self.url + '?format=columnar', {'image': image_file}, format='multipart')
+        columns = json.loads(response.content)['points_of_interest']
+        self.assertEqual(list(zip(columns['x'], columns['y'], columns['r'])),
+                         [tuple(point) for point in self.expected_points()])
+
+    def test_npy_format(self):
+        with open('input/1_Color.png', 'rb') as image_file:
+            response = self.client.post(self.url, {'image': image_file}, format='multipart',
+                                        HTTP_ACCEPT='application/x-npy')
+        self.assertEqual(response['Content-Type'], 'application/x-npy')
+        array = np.load(BytesIO(response.content))
+        self.assertEqual(array.dtype.names, ('x', 'y', 'r'))
+        self.assertEqual(array['x'].dtype, np.int32)
+        self.assertEqual(array['r'].dtype, np.float32)
+        expected = self.expected_points()
+        self.assertEqual(array[['x', 'y']].tolist(), [(x, y) for x, y, _ in expected])
+        np.testing.assert_allclose(array['r'], [r for _, _, r in expected], rtol=1e-6)
+
+    def test_msgpack_format(self):
+        with open('input/1_Color.png', 'rb') as image_file:
+            response = self.client.post(self.url + '?format=msgpack', {'image': image_file}, format='multipart')
+        payload = msgpack.unpackb(response.content)['points_of_interest']
+        expected = self.expected_points()
+        self.assertEqual(payload['count'], len(expected))
+        self.assertEqual(np.frombuffer(payload['x'], '<i4').tolist(), [x for x, _, _ in expected])
+        self.assertEqual(np.frombuffer(payload['y'], '<i4').tolist(), [y for _, y, _ in expected])
+
+    def test_binary_format_errors_are_json(self):
+        response = self.client.post(self.url + '?format=npy', {}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertIn('error', json.loads(response.content))
+
+    def test_process_image_undecodable_upload(self):
+        upload = SimpleUploadedFile('broken.png', b'not an image', content_type='image/png')
+        response = self.client.post(self.url, {'image': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class DetectorAuthenticationTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='detector', password='testpass')
+        self.token = str(AccessToken.for_user(self.user))
+        get_user_status_cache().clear()
+        get_detection_cache().clear()
+
+    def post_image(self, token=None):
+        with open('input/1_Color.png', 'rb') as image_file:
+            return self.client.post(reverse('image_processing_view'), {'image': image_file}, format='multipart',
+                                    HTTP_AUTHORIZATION=f'Bearer {token or self.token}')
+
+    def test_hot_path_does_not_query_database(self):
+        self.assertEqual(self.post_image().status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.post_image().status_code, status.HTTP_200_OK)
+
+    def test_jobs_are_owned_by_token_user(self):
+        with open('input/1_Color.png', 'rb') as image_file:
+            response = self.client.post(reverse('job_list'), {'image': image_file}, format='multipart',
+                                        HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(DetectionJob.objects.get().user_id, self.user.pk)
+
+    def test_deactivated_user_is_rejected(self):
+        self.assertEqual(self.post_image().status_code, status.HTTP_200_OK)
+        # Сохранение пользователя сбрасывает запись кэша в этом процессе
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.post_image().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_user_is_rejected(self):
+        token = self.token
+        self.user.delete()
+        self.assertEqual(self.post_image(token).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_invalid_token(self):
+        self.assertEqual(self.post_image('invalid').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def authenticate(self, token):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        user, _ = DetectorJWTAuthentication().authenticate(request)
+        return user
+
+    def test_issued_token_carries_username(self):
+        response = self.client.post(reverse('token'), {'username': 'detector', 'password': 'testpass'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        user = self.authenticate(response.data['token'])
+        self.assertEqual((user.id, user.username), (self.user.pk, 'detector'))
+
+    def test_token_pair_serializer_adds_claims(self):
+        token = CustomTokenObtainPairSerializer.get_token(self.user)
+        self.assertEqual(self.authenticate(token.access_token).username, 'detector')
+
+    def test_status_cache_expires(self):
+        cache = UserStatusCache(ttl=60, max_entries=2)
+        cache.set(1, True)
+        cache.set(2, False)
+        self.assertEqual((cache.get(1), cache.get(2)), (True, False))
+        cache.set(3, True)
+        self.assertIsNone(cache.get(1))
+        with patch('detector.authentication.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNone(cache.get(2))
+
+
+class AdmissionTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='detector', password='testpass')
+        self.client.force_authenticate(user=self.user)
+        get_detection_cache().clear()
+
+    def post_image(self, url_name='image_processing_view', **fields):
+        with open('input/1_Color.png', 'rb') as image_file:
+            return self.client.post(reverse(url_name), {'image': image_file, **fields}, format='multipart')
+
+    def test_large_image_rejected_before_decode(self):
+        with override_settings(DETECTOR_ADMISSION={'MAX_PIXELS': 100000, 'MAX_BYTES': 10 ** 7, 'POLICY': 'reject'}):
+            with patch('detector.pipeline.decode_image') as decode:
+                response = self.post_image()
+        decode.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        body = json.loads(response.content)
+        self.assertEqual(body['limits'], {'max_pixels': 100000, 'max_bytes': 10 ** 7, 'policy': 'reject'})
+        self.assertEqual((body['image']['width'], body['image']['height'], body['image']['format']), (640, 480, 'PNG'))
+
+    def test_large_upload_rejected_by_size(self):
+        with override_settings(DETECTOR_ADMISSION={'MAX_PIXELS': 10 ** 8, 'MAX_BYTES': 1000, 'POLICY': 'downscale'}):
+            response = self.post_image()
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertGreater(json.loads(response.content)['image']['bytes'], 1000)
+
+    def test_downscale_policy_reduces_decode(self):
+        expected = json.loads(self.post_image(reduce=2).content)
+        get_detection_cache().clear()
+        with override_settings(DETECTOR_ADMISSION={'MAX_PIXELS': 100000, 'MAX_BYTES': 10 ** 7, 'POLICY': 'downscale'}):
+            response = self.post_image()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content), expected)
+
+    def test_downscale_policy_rejects_when_reduction_is_not_enough(self):
+        with override_settings(DETECTOR_ADMISSION={'MAX_PIXELS': 1000, 'MAX_BYTES': 10 ** 7, 'POLICY': 'downscale'}):
+            response = self.post_image()
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    @override_settings(DETECTOR_ADMISSION={'MAX_PIXELS': 100000, 'MAX_BYTES': 10 ** 7, 'POLICY': 'reject'})
+    def test_batch_and_jobs_apply_limits(self):
+        small = cv2.imencode('.png', np.zeros((100, 100), np.uint8))[1].tobytes()
+        with open('input/1_Color.png', 'rb') as large:
+            response = self.client.post(reverse('batch_processing_view'), {
+                'images': [SimpleUploadedFile('small.png', small), large],
+            }, format='multipart')
+        results = json.loads(response.content)['results']
+        self.assertIn('points_of_interest', results['small.png'])
+        self.assertEqual(results['1_Color.png']['limits']['max_pixels'], 100000)
+
+        response = self.post_image('job_list')
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual(DetectionJob.objects.count(), 0)
+
+
+class AsyncImageProcessingViewTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='detector', password='testpass')
+        self.token = str(AccessToken.for_user(self.user))
+        self.url = reverse('async_image_processing_view')
+
+    def post_image(self, token=None, **fields):
+        token = token or self.token
+        with open('input/1_Color.png', 'rb') as image_file:
+            return self.client.post(self.url, {'image': image_file, **fields}, format='multipart',
+                                    HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_matches_sync_endpoint(self):
+        response = self.post_image(nms_radius=3)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = detect_points_of_interest(process_image_file('input/1_Color.png'), nms_radius=3)
+        self.assertEqual(json.loads(response.content)['points_of_interest'], expected)
+        self.assertEqual(views.async_in_flight.count, 0)
+
+    def test_requires_valid_token(self):
+        response = self.post_image(token='invalid')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(views.async_in_flight.count, 0)
+
+    def test_invalid_params(self):
+        response = self.post_image(window_size=0)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(DETECTOR_ASYNC={'WORKERS': 1, 'MAX_IN_FLIGHT': 1, 'RETRY_AFTER': 3})
+    def test_sheds_load_when_queue_is_full(self):
+        # Место в очереди уже занято другим запросом
+        self.assertTrue(views.async_in_flight.acquire(1))
+        try:
+            response = self.post_image()
+        finally:
+            views.async_in_flight.release()
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '3')
+        self.assertEqual(self.post_image().status_code, status.HTTP_200_OK)
+
+
+@override_settings(DETECTOR_METRICS={'ENABLED': True})
+class StageMetricsTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='detector', password='testpass')
+        self.client.force_authenticate(user=self.user)
+        get_detection_cache().clear()
+        for histogram in metrics.HISTOGRAMS:
+            histogram.clear()
+
+    def post_image(self):
+        with open('input/1_Color.png', 'rb') as image_file:
+            return self.client.post(reverse('image_processing_view'), {'image': image_file}, format='multipart')
+
+    def test_server_timing_header_lists_stages(self):
+        response = self.post_image()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        stages = [entry.split(';')[0] for entry in response['Server-Timing'].split(', ')]
+        for name in ('parse', 'decode', 'cache', 'gradient', 'window_sums', 'response', 'threshold', 'sink',
+                     'render', 'total'):
+            self.assertIn(name, stages)
+
+    def test_parallel_strips_are_timed(self):
+        with override_settings(DETECTOR_WORKERS=4):
+            response = self.post_image()
+        self.assertIn('gradient;dur=', response['Server-Timing'])
+
+    def test_metrics_endpoint_exposes_histograms_and_cache_stats(self):
+        self.post_image()
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        text = response.content.decode()
+        self.assertIn('detector_stage_seconds_bucket{view="ImageProcessingView",stage="decode",le="+Inf"} 1', text)
+        self.assertIn('detector_request_seconds_count{view="ImageProcessingView",status="200"} 1', text)
+        self.assertIn('detector_image_pixels_count 1', text)
+        self.assertIn('detector_corners_count 1', text)
+        self.assertIn('detector_cache_misses_total 1', text)
+
+    def test_disabled_metrics(self):
+        with override_settings(DETECTOR_METRICS={'ENABLED': False}):
+            response = self.post_image()
+            self.assertNotIn('Server-Timing', response)
+            self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotIn('detector_image_pixels_count', metrics.expose())
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram('test_seconds', 'Test.', (0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 5.0):
+            histogram.observe(value)
+        lines = histogram.expose()
+        self.assertIn('test_seconds_bucket{le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{le="1.0"} 3', lines)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 4', lines)
+        self.assertIn('test_seconds_count 4', lines)
+
+
+class StreamingDetectionViewTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='detector', password='testpass')
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('streaming_detection_view')
+
+    def post_image(self, url=None, **fields):
+        with open('input/17_Color.png', 'rb') as image_file:
+            return self.client.post(url or self.url, {'image': image_file, **fields}, format='multipart')
+
+    def records(self, response):
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_strips_match_full_detection(self):
+        records = self.records(self.post_image(strip_rows=64, nms_radius=2, reduce=2))
+        summary = records.pop()
+        expected = json.loads(self.post_image(reverse('image_processing_view'), nms_radius=2, reduce=2).content)
+        self.assertEqual([point for record in records for point in record['points_of_interest']],
+                         expected['points_of_interest'])
+        self.assertTrue(summary['done'])
+        self.assertEqual(summary['strips'], len(records))
+        self.assertEqual(summary['total_points'], len(expected['points_of_interest']))
+        self.assertLessEqual(summary['timings']['first_strip_ms'], summary['timings']['total_ms'])
+        # Полосы по 64 строки уменьшенного изображения покрывают его подряд
+        self.assertEqual(records[1]['rows'][0], records[0]['rows'][1])
+        self.assertEqual(records[0]['rows'][1] - records[0]['rows'][0], 128)
+
+    def test_error_after_start_is_last_record(self):
+        def failing_strips(*args, **kwargs):
+            yield Corners([10], [10], [1e7])
+            raise MemoryError('out of memory')
+
+        with patch('detector.pipeline.detect_points_of_interest_streaming', failing_strips):
+            records = self.records(self.post_image())
+        self.assertEqual(records[0]['points_of_interest'], [[10, 10, 1e7]])
+        self.assertEqual(records[-1], {'error': 'out of memory'})
+
+    def test_asgi_streams_parts_off_event_loop(self):
+        part_threads, messages, ticks = [], [], []
+
+        def parts():
+            for index in range(3):
+                part_threads.append(threading.get_ident())
+                time.sleep(0.05)
+                yield b'%d\n' % index
+
+        async def send(message):
+            messages.append(message)
+
+        async def ticker():
+            while len(messages) < 5:
+                ticks.append(threading.get_ident())
+                await asyncio.sleep(0.01)
+
+        async def run():
+            response = StreamingHttpResponse(parts(), content_type='application/x-ndjson')
+            await asyncio.gather(StreamingASGIHandler().send_response(response, send), ticker())
+
+        asyncio.run(run())
+        self.assertEqual(b''.join(message.get('body', b'') for message in messages), b'0\n1\n2\n')
+        self.assertEqual(messages[0]['headers'][0], (b'Content-Type', b'application/x-ndjson'))
+        # Пока полосы считаются в потоках, цикл событий продолжает работать
+        self.assertGreater(len(ticks), 5)
+        self.assertFalse(set(part_threads) & set(ticks))
+
+    def test_unsupported_params(self):
+        response = self.post_image(max_points=10)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('max_points', json.loads(response.content)['error'])
+        self.assertEqual(self.post_image(strip_rows=1).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ProductionProfileTests(TestCase):
+    def test_production_settings_drop_dev_apps(self):
+        production = importlib.import_module('point_detector.settings_production')
+        self.assertFalse(production.DEBUG)
+        self.assertFalse(set(production.DEV_APPS) & set(production.INSTALLED_APPS))
+        self.assertIn('detector', production.INSTALLED_APPS)
+        self.assertEqual(len(production.MIDDLEWARE), len(set(production.MIDDLEWARE)))
+
+    def test_warm_up_runs_once(self):
+        with patch('detector.warmup._warm_up_ms', None), \
+                patch('detector.warmup.detect_with_backend', wraps=detect_with_backend) as detect:
+            elapsed = warmup.warm_up()
+            self.assertEqual(warmup.warm_up(), elapsed)
+        detect.assert_called_once()
+        self.assertEqual(detect.call_args[0][0].shape, (warmup.WARM_UP_SIZE, warmup.WARM_UP_SIZE))
+
+    def test_readiness(self):
+        response = self.client.get(reverse('ready'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content)['status'], 'ready')
+        with patch('detector.views.connection.ensure_connection', side_effect=OperationalError('db is down')):
+            response = self.client.get(reverse('ready'))
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(json.loads(response.content)['error'], 'db is down')
+
+
+class BatchProcessingViewTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='detector', password='testpass')
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('batch_processing_view')
+        with open('input/1_Color.png', 'rb') as f:
+            self.image_data = f.read()
+
+    def upload(self, name, data=None):
+        return SimpleUploadedFile(name, self.image_data if data is None else data, content_type='image/png')
+
+    def post_batch(self, images, **fields):
+        response = self.client.post(self.url, {'images': images, **fields}, format='multipart')
+        return response, json.loads(response.content)
+
+    def test_batch_results_keyed_by_filename(self):
+        response, data = self.post_batch(
+            [self.upload('a.png'), self.upload('broken.png', b'not an image'), self.upload('a.png')],
+            max_points=3
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = data['results']
+        self.assertEqual(list(results), ['a.png', 'broken.png', 'a.png#2'])
+        self.assertEqual(len(results['a.png']['points_of_interest']), 3)
+        self.assertEqual(results['a.png'], results['a.png#2'])
+        self.assertIn('error', results['broken.png'])
+
+    def test_batch_matches_single_image_detection(self):
+        _, data = self.post_batch([self.upload('1_Color.png')])
+        gray = process_image_file('input/1_Color.png')
+        self.assertEqual(data['results']['1_Color.png']['points_of_interest'], detect_points_of_interest(gray))
+
+    @override_settings(DETECTOR_BATCH={'MAX_FILES': 2, 'MAX_PIXELS': 64 * 1024 * 1024, 'WORKERS': 2})
+    def test_batch_file_limit(self):
+        response, _ = self.post_batch([self.upload('a.png'), self.upload('b.png'), self.upload('c.png')])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(DETECTOR_BATCH={'MAX_FILES': 8, 'MAX_PIXELS': 640 * 480, 'WORKERS': 2})
+    def test_batch_pixel_limit_fails_only_excess_images(self):
+        with patch('detector.pipeline.decode_image', wraps=decode_image) as decode:
+            response, data = self.post_batch([self.upload('a.png'), self.upload('b.png')])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('points_of_interest', data['results']['a.png'])
+        self.assertIn('error', data['results']['b.png'])
+        # Бюджет считается по заголовкам: изображение сверх бюджета не декодируется
+        decode.assert_called_once()
+        # С уменьшением при декодировании оба изображения укладываются в бюджет
+        _, data = self.post_batch([self.upload('a.png'), self.upload('b.png')], reduce=2)
+        self.assertTrue(all('points_of_interest' in result for result in data['results'].values()))
+
+    def test_batch_without_images(self):
+        response = self.client.post(self.url, {}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SequenceProcessingViewTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='detector', password='testpass')
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('sequence_processing_view')
+        image = process_image_file('input/17_Color.png')
+        self.frames = [image[shift:shift + 400, shift:shift + 560] for shift in (0, 2, 4)]
+
+    def upload(self, name, frame):
+        return SimpleUploadedFile(name, cv2.imencode('.png', frame)[1].tobytes(), content_type='image/png')
+
+    def test_sequence_frames_and_summary(self):
+        uploads = [self.upload(f'{index}.png', frame) for index, frame in enumerate(self.frames)]
+        response = self.client.post(self.url, {'frames': uploads, 'max_points': 50}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = json.loads(response.content)
+        self.assertEqual([frame['name'] for frame in data['frames']], ['0.png', '1.png', '2.png'])
+        self.assertEqual([frame['keyframe'] for frame in data['frames']], [True, False, False])
+        self.assertEqual(data['frames'][0]['points_of_interest'],
+                         detect_points_of_interest(self.frames[0], max_points=50))
+        self.assertEqual(data['summary']['frames'], 3)
+        self.assertEqual(data['summary']['keyframes'], 1)
+
+    def test_sequence_errors(self):
+        response = self.client.post(self.url, {}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        uploads = [self.upload('0.png', self.frames[0]), SimpleUploadedFile('1.png', b'not an image')]
+        response = self.client.post(self.url, {'frames': uploads}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(self.url, {'frames': [self.upload('0.png', self.frames[0])],
+                                               'min_tracked_ratio': 2}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class DetectionJobTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='detector', password='testpass')
+        self.client.force_authenticate(user=self.user)
+        with open('input/1_Color.png', 'rb') as f:
+            self.image_data = f.read()
+
+    def submit(self, **fields):
+        upload = SimpleUploadedFile('1_Color.png', self.image_data, content_type='image/png')
+        return self.client.post(reverse('job_list'), {'image': upload, **fields}, format='multipart')
+
+    def poll(self, job_id):
+        return self.client.get(reverse('job_detail', args=[job_id]))
+
+    def test_submit_and_poll(self):
+        response = self.submit(max_points=4)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job_id = response.data['job_id']
+        self.assertEqual(self.poll(job_id).data['status'], DetectionJob.QUEUED)
+
+        process_next_job()
+
+        response = self.poll(job_id)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], DetectionJob.DONE)
+        self.assertEqual(len(response.data['points_of_interest']), 4)
+        # Исходный файл не хранится после выполнения задания
+        self.assertEqual(bytes(DetectionJob.objects.get(pk=job_id).image), b'')
+
+    def test_higher_priority_runs_first(self):
+        low = self.submit(priority=0).data['job_id']
+        high = self.submit(priority=5).data['job_id']
+        self.assertEqual(str(process_next_job().pk), high)
+        self.assertEqual(str(process_next_job().pk), low)
+        self.assertIsNone(process_next_job())
+
+    def test_failed_job_reports_error(self):
+        # Заголовок PNG читается, но данные изображения обрезаны - ошибка возникает уже в воркере
+        with open('input/1_Color.png', 'rb') as image_file:
+            truncated = image_file.read(64)
+        upload = SimpleUploadedFile('broken.png', truncated, content_type='image/png')
+        job_id = self.client.post(reverse('job_list'), {'image': upload}, format='multipart').data['job_id']
+        process_next_job()
+        response = self.poll(job_id)
+        self.assertEqual(response.data['status'], DetectionJob.FAILED)
+        self.assertIn('error', response.data)
+
+    @override_settings(DETECTOR_JOBS={'MAX_QUEUE_DEPTH': 1, 'RESULT_TTL': 60, 'LEASE_TIMEOUT': 60, 'MAX_ATTEMPTS': 3})
+    def test_queue_depth_limit(self):
+        self.assertEqual(self.submit().status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(self.submit().status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    @override_settings(DETECTOR_JOBS={'MAX_QUEUE_DEPTH': 10, 'RESULT_TTL': 60, 'LEASE_TIMEOUT': 60, 'MAX_ATTEMPTS': 3})
+    def test_expired_jobs_are_cleaned_up(self):
+        job_id = self.submit().data['job_id']
+        process_next_job()
+        DetectionJob.objects.filter(pk=job_id).update(finished_at=timezone.now() - timedelta(seconds=120))
+        self.assertEqual(self.poll(job_id).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(cleanup_expired_jobs(), 1)
+        self.assertFalse(DetectionJob.objects.filter(pk=job_id).exists())
+
+    def test_jobs_are_private_to_their_owner(self):
+        job_id = self.submit().data['job_id']
+        self.client.force_authenticate(user=User.objects.create_user(username='other', password='testpass'))
+        self.assertEqual(self.poll(job_id).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_worker_command_once(self):
+        job_ids = [self.submit().data['job_id'] for _ in range(2)]
+        call_command('detection_worker', '--once', stdout=io.StringIO())
+        for job_id in job_ids:
+            self.assertEqual(self.poll(job_id).data['status'], DetectionJob.DONE)
+
+    def expire_lease(self, job_id):
+        DetectionJob.objects.filter(pk=job_id).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+    def test_expired_lease_is_requeued(self):
+        job_id = self.submit(max_points=4).data['job_id']
+        # Воркер забрал задание и завершился, не продлив аренду
+        lost = claim_next_job()
+        self.assertEqual(lost.status, DetectionJob.RUNNING)
+        self.assertIsNotNone(lost.lease_expires_at)
+        self.assertIsNone(claim_next_job())
+
+        self.expire_lease(job_id)
+        job = process_next_job()
+        self.assertEqual(str(job.pk), job_id)
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(self.poll(job_id).data['status'], DetectionJob.DONE)
+
+        # Прежний воркер не может продлить аренду или перезаписать результат
+        self.assertFalse(renew_lease(lost))
+        run_job(lost)
+        self.assertEqual(len(self.poll(job_id).data['points_of_interest']), 4)
+
+    def test_live_lease_is_not_requeued(self):
+        self.submit()
+        job = claim_next_job()
+        self.assertTrue(renew_lease(job))
+        self.assertIsNone(claim_next_job())
+
+    @override_settings(DETECTOR_JOBS={'MAX_QUEUE_DEPTH': 10, 'RESULT_TTL': 60, 'LEASE_TIMEOUT': 60, 'MAX_ATTEMPTS': 2})
+    def test_job_fails_after_max_attempts(self):
+        job_id = self.submit().data['job_id']
+        for _ in range(2):
+            claim_next_job()
+            self.expire_lease(job_id)
+        self.assertIsNone(claim_next_job())
+        job = DetectionJob.objects.get(pk=job_id)
+        self.assertEqual(job.status, DetectionJob.FAILED)
+        self.assertIn('lease expired', job.error)
+        self.assertEqual(bytes(job.image), b'')
+
+    @override_settings(DETECTOR_JOBS={'MAX_QUEUE_DEPTH': 10, 'RESULT_TTL': 60, 'LEASE_TIMEOUT': 0.03, 'MAX_ATTEMPTS': 3})
+    def test_heartbeat_renews_lease_while_running(self):
+        job = DetectionJob()
+        with patch('detector.jobs.renew_lease', return_value=True) as renew:
+            with lease_heartbeat(job):
+                time.sleep(0.1)
+        self.assertGreaterEqual(renew.call_count, 2)
+        renew.assert_called_with(job)
+
+
+class DetectionRunTests(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        count = 5000
+        # Повторяющиеся отклики проверяют порядок при равном r
+        self.corners = Corners(rng.integers(0, 2000, count), rng.integers(0, 1500, count),
+                               rng.integers(0, 800, count).astype(np.float64) * 1e4)
+        self.run = save_detection_run(self.corners, 'a' * 64, {'k': 0.2}, 'synthetic.png', tile_size=128)
+
+    def expected(self, bbox=None):
+        x, y, r = self.corners.x, self.corners.y, self.corners.r
+        keep = np.ones(len(x), bool)
+        if bbox is not None:
+            keep = (x >= bbox[0]) & (x < bbox[2]) & (y >= bbox[1]) & (y < bbox[3])
+        order = np.lexsort((x[keep], y[keep], -r[keep]))
+        return Corners(x[keep][order], y[keep][order], r[keep][order])
+
+    def test_tiles_pack_all_points(self):
+        tiles = self.run.tiles.all()
+        self.assertEqual(sum(tile.count for tile in tiles), len(self.corners))
+        self.assertEqual(self.run.point_count, len(self.corners))
+        self.assertTrue(all(len(bytes(tile.points)) == tile.count * POINT_DTYPE.itemsize for tile in tiles))
+
+    def test_query_returns_strongest_first(self):
+        page, cursor = query_run_points(self.run, limit=len(self.corners))
+        self.assertEqual(page, self.expected())
+        self.assertIsNone(cursor)
+        bbox = (300, 200, 1100, 700)
+        page, _ = query_run_points(self.run, bbox=bbox, limit=len(self.corners))
+        self.assertEqual(page, self.expected(bbox))
+
+    def test_cursor_pagination_covers_all_points(self):
+        bbox = (100, 100, 1700, 1300)
+        pages, cursor = [], None
+        while True:
+            page, cursor = query_run_points(self.run, bbox=bbox, limit=333, cursor=cursor)
+            pages.append(page)
+            if cursor is None:
+                break
+        self.assertTrue(all(len(page) == 333 for page in pages[:-1]))
+        joined = Corners(*(np.concatenate([getattr(page, name) for page in pages]) for name in 'xyr'))
+        self.assertEqual(joined, self.expected(bbox))
+
+    def test_query_stops_reading_weaker_tiles(self):
+        with patch('detector.results._select', wraps=_select) as select:
+            query_run_points(self.run, limit=10)
+        self.assertLess(select.call_count, self.run.tiles.count() // 2)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            query_run_points(self.run, cursor='not-a-cursor')
+
+
+class DetectionRunViewTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='detector', password='testpass')
+        self.client.force_authenticate(user=self.user)
+
+    def persist_image(self, **fields):
+        with open('input/1_Color.png', 'rb') as image_file:
+            return self.client.post(reverse('image_processing_view'), {'image': image_file, 'persist': 'true', **fields},
+                                    format='multipart')
+
+    def test_persisted_run_is_queried_by_bbox(self):
+        response = self.persist_image(reduce=2)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = json.loads(response.content)
+        points = data['points_of_interest']
+        points_url = reverse('run_points', args=[data['run_id']])
+
+        with open('input/1_Color.png', 'rb') as image_file:
+            image_hash = image_digest(image_file)
+        runs = json.loads(self.client.get(reverse('run_list'), {'image_hash': image_hash}).content)['runs']
+        self.assertEqual([run['run_id'] for run in runs], [data['run_id']])
+        self.assertEqual(runs[0]['params']['reduce'], 2)
+        self.assertEqual(runs[0]['point_count'], len(points))
+
+        bbox = (100, 50, 400, 300)
+        collected, cursor = [], None
+        while True:
+            query = {'bbox': ','.join(map(str, bbox)), 'limit': 7}
+            if cursor:
+                query['cursor'] = cursor
+            page = json.loads(self.client.get(points_url, query).content)
+            collected += page['points_of_interest']
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        inside = [p for p in points if bbox[0] <= p[0] < bbox[2] and bbox[1] <= p[1] < bbox[3]]
+        self.assertEqual(collected, sorted(inside, key=lambda p: (-p[2], p[1], p[0])))
+
+    def test_runs_are_private_and_deletable(self):
+        with open('input/1_Color.png', 'rb') as mask_file:
+            run_id = json.loads(self.persist_image(mask=mask_file).content)['run_id']
+        detail_url = reverse('run_detail', args=[run_id])
+        self.assertEqual(len(json.loads(self.client.get(detail_url).content)['params']['mask']), 64)
+
+        other = User.objects.create_user(username='other', password='testpass')
+        self.client.force_authenticate(user=other)
+        self.assertEqual(self.client.get(reverse('run_points', args=[run_id])).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.delete(detail_url).status_code, status.HTTP_404_NOT_FOUND)
+
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.client.delete(detail_url).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(DetectionTile.objects.exists())
+
+    def test_invalid_query_params(self):
+        run_id = json.loads(self.persist_image().content)['run_id']
+        points_url = reverse('run_points', args=[run_id])
+        self.assertEqual(self.client.get(points_url, {'bbox': '5,5,1,1'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(points_url, {'limit': 10 ** 6}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(points_url, {'cursor': '!!'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class DetectionCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.image = np.zeros((40, 40), np.uint8)
+        cv2.rectangle(self.image, (10, 10), (30, 30), 255, -1)
+        self.points = [[12, 12, 2.0], [28, 12, 2.0]]
+
+    def test_key_depends_on_pixels_and_params(self):
+        key = DetectionCache.make_key(self.image, {})
+        self.assertEqual(key, DetectionCache.make_key(self.image.copy(), {'k': 0.2, 'window_size': 7}))
+        self.assertNotEqual(key, DetectionCache.make_key(self.image, {'threshold': 1.0}))
+        other = self.image.copy()
+        other[0, 0] = 1
+        self.assertNotEqual(key, DetectionCache.make_key(other, {}))
+
+    def test_key_hashes_mask_contents(self):
+        mask = np.zeros((40, 40), bool)
+        key = DetectionCache.make_key(self.image, {'mask': mask})
+        self.assertEqual(key, DetectionCache.make_key(self.image, {'mask': mask.copy()}))
+        mask[39, 39] = True
+        self.assertNotEqual(key, DetectionCache.make_key(self.image, {'mask': mask}))
+
+    def test_hits_misses_and_evictions(self):
+        cache = DetectionCache(max_bytes=2 * estimate_size(self.points))
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', self.points)
+        cache.set('b', self.points)
+        self.assertIs(cache.get('a'), self.points)
+        # 'b' использовался давнее всего и вытесняется первым
+        cache.set('c', self.points)
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertEqual(cache.stats()['hits'], 2)
+        self.assertEqual(cache.stats()['misses'], 2)
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.stats()['entries'], 2)
+
+    def test_shared_tier_is_used_on_local_miss(self):
+        caches['default'].clear()
+        writer = DetectionCache(max_bytes=1024 * 1024, shared_alias='default')
+        reader = DetectionCache(max_bytes=1024 * 1024, shared_alias='default')
+        writer.set('shared-key', self.points)
+        self.assertEqual(reader.get('shared-key'), self.points)
+        self.assertEqual(reader.get('shared-key'), self.points)
+        self.assertEqual(reader.stats()['shared_hits'], 1)
+        self.assertEqual(reader.stats()['hits'], 1)
+
+
+class DecodeImageTests(unittest.TestCase):
+    def setUp(self):
+        with open('input/1_Color.png', 'rb') as f:
+            self.image_data = f.read()
 
-        with open(json_path, 'r') as json_file:
-            data = json.load(json_file)
-            self.assertEqual(data, points)
+    def test_decode_from_memory_matches_file(self):
+        upload = SimpleUploadedFile('1_Color.png', self.image_data, content_type='image/png')
+        gray = decode_image(upload)
+        self.assertEqual(gray.ndim, 2)
+        self.assertTrue(np.array_equal(gray, process_image_file('input/1_Color.png')))
 
-        # Удаляем JSON файл после теста
-        os.remove(json_path)
+    def test_decode_reduced(self):
+        upload = SimpleUploadedFile('1_Color.png', self.image_data, content_type='image/png')
+        self.assertEqual(decode_image(upload, reduce=4).shape, (120, 160))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,95 @@
+import math
+import time
+
+import cv2
+import numpy as np
+
+from .backends import detect_with_backend, resolve_params
+from .utils import Corners
+
+# Параметры пирамидального Лукаса-Канаде: окно поиска, число уровней пирамиды и критерий остановки
+TRACK_WINDOW = (21, 21)
+TRACK_PYRAMID_LEVELS = 3
+TRACK_CRITERIA = (cv2.TERM_CRITERIA_COUNT | cv2.TERM_CRITERIA_EPS, 30, 0.01)
+
+# Полная детекция повторяется, когда отслеживается меньше этой доли углов последнего ключевого кадра
+MIN_TRACKED_RATIO = 0.5
+
+
+def track_points_of_interest(frames, backend=None, min_tracked_ratio=MIN_TRACKED_RATIO, keyframe_interval=None,
+                             **detection_params):
+    """
+    Углы для последовательности кадров в оттенках серого с отслеживанием между ключевыми кадрами.
+
+    На ключевом кадре выполняется полная детекция бэкендом backend с параметрами detection_params,
+    на остальных углы предыдущего кадра переносятся оптическим потоком Лукаса-Канаде.
+    Новый ключевой кадр назначается, когда отслежено меньше min_tracked_ratio углов
+    последнего ключевого кадра или прошло keyframe_interval кадров. Отклик r отслеженного
+    угла - значение с ключевого кадра.
+
+    Генератор выдаёт для каждого кадра словарь: corners (Corners), keyframe, tracked
+    (число отслеженных углов, для ключевого кадра - найденных) и elapsed_ms - время
+    обработки кадра.
+    """
+    # Ближе offset к краю отклик не считается, такие отслеженные углы отбрасываются
+    offset = int(resolve_params(backend, detection_params).get('window_size', 1) / 2)
+    previous_frame = points = responses = None
+    keyframe_count = since_keyframe = 0
+
+    for frame in frames:
+        start = time.perf_counter()
+        tracked = 0
+        if previous_frame is not None and len(points) and previous_frame.shape == frame.shape:
+            moved, status, _ = cv2.calcOpticalFlowPyrLK(
+                previous_frame, frame, points.reshape(-1, 1, 2), None,
+                winSize=TRACK_WINDOW, maxLevel=TRACK_PYRAMID_LEVELS, criteria=TRACK_CRITERIA,
+            )
+            moved = moved.reshape(-1, 2)
+            height, width = frame.shape
+            keep = (status.ravel() == 1) & np.isfinite(moved).all(axis=1)
+            keep &= (moved[:, 0] >= offset) & (moved[:, 0] <= width - 1 - offset)
+            keep &= (moved[:, 1] >= offset) & (moved[:, 1] <= height - 1 - offset)
+            tracked = int(keep.sum())
+
+        interval_reached = keyframe_interval is not None and since_keyframe + 1 >= keyframe_interval
+        too_few_tracked = tracked < max(1, math.ceil(min_tracked_ratio * keyframe_count))
+        keyframe = previous_frame is None or previous_frame.shape != frame.shape or too_few_tracked or interval_reached
+        if keyframe:
+            corners = detect_with_backend(frame, backend, **detection_params)
+            points = np.column_stack([corners.x, corners.y]).astype(np.float32)
+            responses = corners.r
+            keyframe_count = tracked = len(corners)
+            since_keyframe = 0
+        else:
+            points, responses = moved[keep], responses[keep]
+            rounded = np.rint(points).astype(np.int32)
+            corners = Corners(rounded[:, 0], rounded[:, 1], responses)
+            since_keyframe += 1
+
+        previous_frame = frame
+        yield {
+            'corners': corners,
+            'keyframe': keyframe,
+            'tracked': tracked,
+            'elapsed_ms': (time.perf_counter() - start) * 1000,
+        }
+
+
+def sequence_summary(frames):
+    """
+    Сводка по кадрам track_points_of_interest: общее время, среднее время ключевых
+    и отслеживаемых кадров и оценка времени полной детекции на каждом кадре
+    (среднее время ключевого кадра, умноженное на число кадров).
+    """
+    keyframe_ms = [frame['elapsed_ms'] for frame in frames if frame['keyframe']]
+    tracked_ms = [frame['elapsed_ms'] for frame in frames if not frame['keyframe']]
+    keyframe_mean = sum(keyframe_ms) / len(keyframe_ms) if keyframe_ms else 0.0
+    total = sum(keyframe_ms) + sum(tracked_ms)
+    return {
+        'frames': len(frames),
+        'keyframes': len(keyframe_ms),
+        'total_ms': total,
+        'keyframe_mean_ms': keyframe_mean,
+        'tracked_mean_ms': sum(tracked_ms) / len(tracked_ms) if tracked_ms else 0.0,
+        'estimated_full_detection_ms': keyframe_mean * len(frames),
+    }
@@ -1,10 +1,22 @@
 from django.urls import path
-from .views import ImageProcessingView, RegisterUserView, ObtainTokenView, CustomTokenRefreshView
+from .views import ImageProcessingView, BatchProcessingView, RegisterUserView, ObtainTokenView, CustomTokenRefreshView
+from .views import JobListView, JobDetailView, SequenceProcessingView, ResponseMapView, async_image_processing_view
+from .views import DetectionRunListView, DetectionRunDetailView, DetectionRunPointsView, StreamingDetectionView
 
 urlpatterns = [
     path('register/', RegisterUserView.as_view(), name='register'),
     path('token/', ObtainTokenView.as_view(), name='token'),
     path('process-image/', ImageProcessingView.as_view(), name='image_processing_view'),
+    path('process-image-async/', async_image_processing_view, name='async_image_processing_view'),
+    path('process-image-stream/', StreamingDetectionView.as_view(), name='streaming_detection_view'),
+    path('process-batch/', BatchProcessingView.as_view(), name='batch_processing_view'),
+    path('process-sequence/', SequenceProcessingView.as_view(), name='sequence_processing_view'),
+    path('response-maps/<str:handle>/', ResponseMapView.as_view(), name='response_map_view'),
+    path('runs/', DetectionRunListView.as_view(), name='run_list'),
+    path('runs/<uuid:run_id>/', DetectionRunDetailView.as_view(), name='run_detail'),
+    path('runs/<uuid:run_id>/points/', DetectionRunPointsView.as_view(), name='run_points'),
+    path('jobs/', JobListView.as_view(), name='job_list'),
+    path('jobs/<uuid:job_id>/', JobDetailView.as_view(), name='job_detail'),
     path('detect/', ImageProcessingView.as_view(), name='detect_points_of_interest'),
     path('token/refresh/', CustomTokenRefreshView.as_view(), name='token_refresh'),
 ]
@@ -1,17 +1,594 @@
+import contextvars
 import cv2
 import numpy as np
-import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
+from .metrics import stage
 
-def process_image(image_path):
-    image = cv2.imread(image_path, cv2.IMREAD_COLOR)
-    if image is None:
+# Минимальная высота полосы, при которой деление изображения между потоками окупается
+MIN_STRIP_ROWS = 64
+
+# Высота полос в экономном по памяти режиме: отклик и буферы существуют только для одной полосы
+LOW_MEMORY_STRIP_ROWS = 128
+
+# Режим fast: число уровней пирамиды, понижающий множитель порога на грубом уровне
+# и размер блоков, в которых отклик пересчитывается в полном разрешении
+FAST_PYRAMID_LEVELS = 1
+FAST_COARSE_THRESHOLD_FACTOR = 0.25
+FAST_BLOCK_SIZE = 32
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+# Флаги декодирования сразу в оттенки серого, в том числе с уменьшением в 2 и 4 раза
+GRAYSCALE_DECODE_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+}
+
+
+def process_image(image_path, reduce=1):
+    with stage('decode'):
+        gray = cv2.imread(image_path, GRAYSCALE_DECODE_FLAGS[reduce])
+    if gray is None:
         raise ValueError("Image not loaded properly, check the file path and format.")
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
     return gray
 
 
-def detect_points_of_interest(gray_image, k=0.2, window_size=7, threshold=1500000.0):
+def decode_image(uploaded_file, reduce=1):
+    """
+    Декодирует загруженный файл Django сразу в оттенки серого.
+
+    Файл из TemporaryFileUploadHandler уже лежит на диске и читается OpenCV напрямую,
+    для файла в памяти декодируется буфер BytesIO без копирования. При reduce = 2 или 4
+    изображение уменьшается при декодировании.
+    """
+    if hasattr(uploaded_file, 'temporary_file_path'):
+        return process_image(uploaded_file.temporary_file_path(), reduce)
+
+    flag = GRAYSCALE_DECODE_FLAGS[reduce]
+    source = getattr(uploaded_file, 'file', uploaded_file)
+    with stage('decode'):
+        if hasattr(source, 'getbuffer'):
+            with source.getbuffer() as buffer:
+                gray = _imdecode(np.frombuffer(buffer, np.uint8), flag)
+        else:
+            uploaded_file.seek(0)
+            gray = _imdecode(np.frombuffer(uploaded_file.read(), np.uint8), flag)
+
+    if gray is None:
+        raise ValueError("Image not decoded properly, check the file format.")
+    return gray
+
+
+def _imdecode(data, flag):
+    # Пустой буфер OpenCV считает ошибкой вызова, а не недекодируемым изображением
+    if data.size == 0:
+        return None
+    return cv2.imdecode(data, flag)
+
+
+def window_sums(values, window_size):
+    """
+    Суммы значений по всем окнам window_size x window_size через интегральное изображение.
+
+    Элемент [i, j] результата равен values[i:i + window_size, j:j + window_size].sum().
+    """
+    height, width = values.shape
+    integral = np.zeros((height + 1, width + 1), dtype=np.float64)
+    np.cumsum(values, axis=0, out=integral[1:, 1:])
+    np.cumsum(integral[1:, 1:], axis=1, out=integral[1:, 1:])
+    total = integral[window_size:, window_size:] - integral[:-window_size, window_size:]
+    total -= integral[window_size:, :-window_size]
+    total += integral[:-window_size, :-window_size]
+    return total
+
+
+def structure_tensor_region(gray_image, window_size, top, bottom, left, right):
+    """
+    Суммы Sxx, Sxy, Syy по окну для прямоугольника [top:bottom, left:right] полной карты отклика.
+
+    Считывается только нужная полоса изображения с гало: offset строк/столбцов на окно
+    и ещё одна строка/столбец на центральную разность градиента, поэтому значения
+    совпадают с расчётом по всему изображению.
+    """
+    offset = int(window_size / 2)
+    window = 2 * offset + 1
+    height, width = gray_image.shape
+    y0, y1 = max(top - 1, 0), min(bottom + window, height)
+    x0, x1 = max(left - 1, 0), min(right + window, width)
+
+    with stage('gradient'):
+        dy, dx = np.gradient(gray_image[y0:y1, x0:x1])
+        rows = slice(top - y0, bottom + window - 1 - y0)
+        cols = slice(left - x0, right + window - 1 - x0)
+        dy, dx = dy[rows, cols], dx[rows, cols]
+
+    with stage('window_sums'):
+        Sxx = window_sums(dx * dx, window)
+        Sxy = window_sums(dy * dx, window)
+        Syy = window_sums(dy * dy, window)
+    return Sxx, Sxy, Syy
+
+
+def response_from_sums(Sxx, Sxy, Syy, k):
+    """Отклик Харриса по суммам структурного тензора: det - k * trace^2."""
+    with stage('response'):
+        det = (Sxx * Syy) - (Sxy**2)
+        trace = Sxx + Syy
+        return det - k * (trace**2)
+
+
+def harris_response_region(gray_image, k, window_size, top, bottom, left, right):
+    """Карта отклика Харриса для прямоугольника [top:bottom, left:right] полной карты отклика."""
+    return response_from_sums(*structure_tensor_region(gray_image, window_size, top, bottom, left, right), k)
+
+
+class ScratchBuffers:
+    """Рабочие буферы, переиспользуемые между полосами одного изображения."""
+
+    def __init__(self):
+        self._buffers = {}
+
+    def get(self, name, shape, dtype):
+        size = int(np.prod(shape))
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.size < size:
+            buffer = self._buffers[name] = np.empty(size, dtype)
+        return buffer[:size].reshape(shape)
+
+
+def scaled_gradients(block, scratch):
+    """
+    Удвоенный np.gradient изображения uint8 в int16, без потери точности: внутри
+    это разность соседей через один пиксель, на краях - удвоенная разность соседних.
+    Для других типов int16 переполняется или отбрасывает дробную часть, поэтому они не принимаются.
+    """
+    if block.dtype != np.uint8:
+        raise ValueError(f"Integer gradients require a uint8 image, got {block.dtype}.")
+    height, width = block.shape
+    gy = scratch.get('gy', (height, width), np.int16)
+    gx = scratch.get('gx', (height, width), np.int16)
+    for gradient, axis in ((gy, 0), (gx, 1)):
+        gradient, values = np.moveaxis(gradient, axis, 0), np.moveaxis(block, axis, 0)
+        np.subtract(values[2:], values[:-2], out=gradient[1:-1], dtype=np.int16)
+        np.subtract(values[1], values[0], out=gradient[0], dtype=np.int16)
+        np.subtract(values[-1], values[-2], out=gradient[-1], dtype=np.int16)
+        gradient[0] *= 2
+        gradient[-1] *= 2
+    return gy, gx
+
+
+def window_sums_exact(values, window_size, scratch, out):
+    """window_sums для целых значений: интегральное изображение в int64, результат в out."""
+    height, width = values.shape
+    integral = scratch.get('integral', (height + 1, width + 1), np.int64)
+    integral[0] = 0
+    integral[:, 0] = 0
+    np.cumsum(values, axis=0, dtype=np.int64, out=integral[1:, 1:])
+    np.cumsum(integral[1:, 1:], axis=1, out=integral[1:, 1:])
+    np.subtract(integral[window_size:, window_size:], integral[:-window_size, window_size:], out=out)
+    out -= integral[window_size:, :-window_size]
+    out += integral[:-window_size, :-window_size]
+    return out
+
+
+def harris_response_region_low_memory(gray_image, k, window_size, top, bottom, left, right, scratch=None):
+    """
+    То же, что harris_response_region, но градиенты хранятся в int16, произведения в int32,
+    суммы по окну в int64, а все промежуточные массивы берутся из scratch.
+
+    Суммы по окну в 4 раза больше исходных и вычисляются точно; после умножения на 0.25
+    отклик считается теми же операциями float64, поэтому результат совпадает
+    с harris_response_region бит в бит. Возвращаемый массив - буфер scratch,
+    он действителен до следующего вызова с тем же scratch.
+
+    Целочисленная арифметика точна только для uint8; изображения других типов
+    (16-битные, float) считаются harris_response_region в float64.
+    """
+    if gray_image.dtype != np.uint8:
+        return harris_response_region(gray_image, k, window_size, top, bottom, left, right)
+    scratch = scratch if scratch is not None else ScratchBuffers()
+    offset = int(window_size / 2)
+    window = 2 * offset + 1
+    height, width = gray_image.shape
+    y0, y1 = max(top - 1, 0), min(bottom + window, height)
+    x0, x1 = max(left - 1, 0), min(right + window, width)
+
+    with stage('gradient'):
+        gy, gx = scaled_gradients(gray_image[y0:y1, x0:x1], scratch)
+        rows = slice(top - y0, bottom + window - 1 - y0)
+        cols = slice(left - x0, right + window - 1 - x0)
+        gy, gx = gy[rows, cols], gx[rows, cols]
+
+    shape = (bottom - top, right - left)
+    sums = {}
+    with stage('window_sums'):
+        product = scratch.get('product', gx.shape, np.int32)
+        exact = scratch.get('exact', shape, np.int64)
+        for name, first, second in (('Sxx', gx, gx), ('Sxy', gy, gx), ('Syy', gy, gy)):
+            np.multiply(first, second, out=product, dtype=np.int32)
+            window_sums_exact(product, window, scratch, exact)
+            # Суммы произведений удвоенных градиентов в 4 раза больше; деление на 4 точное
+            sums[name] = np.multiply(exact, 0.25, out=scratch.get(name, shape, np.float64))
+
+    with stage('response'):
+        Sxx, Sxy, Syy = sums['Sxx'], sums['Sxy'], sums['Syy']
+        response = np.multiply(Sxx, Syy, out=scratch.get('response', shape, np.float64))
+        np.multiply(Sxy, Sxy, out=Sxy)
+        response -= Sxy
+        trace = np.add(Sxx, Syy, out=Sxx)
+        np.multiply(trace, trace, out=trace)
+        trace *= k
+        response -= trace
+        return response
+
+
+def _map_strips(region_func, gray_image, window_size, workers, *args):
+    """
+    region_func(gray_image, *args, top, bottom, 0, cols) для всей карты отклика: одним
+    вызовом или, при workers > 1, горизонтальными полосами в пуле потоков.
+    Возвращает результаты полос в исходном порядке строк; None - карта пуста.
+    """
+    window = 2 * int(window_size / 2) + 1
+    rows = gray_image.shape[0] - window + 1
+    cols = gray_image.shape[1] - window + 1
+    if rows <= 0 or cols <= 0:
+        return None
+
+    strips = min(workers, rows // MIN_STRIP_ROWS)
+    if strips <= 1:
+        return [region_func(gray_image, *args, 0, rows, 0, cols)]
+
+    bounds = np.linspace(0, rows, strips + 1).astype(int)
+    # Полосы выполняются в контексте запроса, чтобы их стадии попали в замеры запроса
+    futures = [
+        _get_executor(workers).submit(
+            contextvars.copy_context().run, region_func, gray_image, *args, top, bottom, 0, cols
+        )
+        for top, bottom in zip(bounds[:-1], bounds[1:])
+    ]
+    return [future.result() for future in futures]
+
+
+def harris_response(gray_image, k=0.2, window_size=7, workers=1):
+    """
+    Карта отклика Харриса для центров окон в диапазоне offset..shape - offset.
+
+    Элемент [i, j] соответствует точке (x = j + offset, y = i + offset).
+    При workers > 1 карта считается горизонтальными полосами в пуле потоков
+    и склеивается в исходном порядке строк.
+    """
+    strips = _map_strips(harris_response_region, gray_image, window_size, workers, k, window_size)
+    if strips is None:
+        return np.empty((0, 0), dtype=np.float64)
+    return strips[0] if len(strips) == 1 else np.vstack(strips)
+
+
+def structure_tensor(gray_image, window_size=7, workers=1):
+    """
+    Суммы Sxx, Sxy, Syy по окну для всей карты отклика (в координатах harris_response).
+    Из них отклик для любого k считается без повторного расчёта градиентов и сумм.
+    """
+    strips = _map_strips(structure_tensor_region, gray_image, window_size, workers, window_size)
+    if strips is None:
+        return tuple(np.empty((0, 0), dtype=np.float64) for _ in range(3))
+    if len(strips) == 1:
+        return strips[0]
+    return tuple(np.vstack(column) for column in zip(*strips))
+
+
+def _get_executor(workers):
+    # Пулы создаются один раз на процесс и переиспользуются между запросами
+    with _executors_lock:
+        executor = _executors.get(workers)
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='harris')
+            _executors[workers] = executor
+        return executor
+
+
+def select_corners(response, threshold, nms_radius=0, max_points=None):
+    """
+    Отбор углов на карте отклика: порог, подавление немаксимумов и ограничение top-K.
+
+    Возвращает массивы индексов строк, столбцов и значений отклика в построчном порядке.
+    При nms_radius > 0 остаются только точки, отклик которых не меньше отклика соседей
+    в квадрате (2 * nms_radius + 1)^2. При max_points остаются max_points самых сильных
+    точек; полная сортировка кандидатов при этом не выполняется.
+    """
+    with stage('threshold'):
+        mask = response > threshold
+        if nms_radius > 0 and response.size:
+            size = 2 * nms_radius + 1
+            local_max = cv2.dilate(response, np.ones((size, size), np.uint8))
+            mask &= response >= local_max
+
+        ys, xs = np.nonzero(mask)
+        return strongest(ys, xs, response[ys, xs], max_points)
+
+
+def strongest(ys, xs, rs, max_points):
+    """Оставляет max_points точек с наибольшим откликом, сохраняя их исходный порядок."""
+    if max_points is not None and len(rs) > max_points:
+        top = np.argpartition(rs, len(rs) - max_points)[len(rs) - max_points:]
+        top.sort()
+        ys, xs, rs = ys[top], xs[top], rs[top]
+    return ys, xs, rs
+
+
+def detect_in_regions(gray_image, regions, k, window_size, threshold, nms_radius=0,
+                      response_region=harris_response_region):
+    """
+    Углы внутри непересекающихся прямоугольников (top, bottom, left, right) карты отклика.
+
+    Отклик считается только для прямоугольников (с гало изображения), для подавления
+    немаксимумов прямоугольник дополнительно расширяется на nms_radius. Возвращает
+    индексы строк, столбцов и отклики в построчном порядке, как select_corners.
+    """
+    window = 2 * int(window_size / 2) + 1
+    rows = gray_image.shape[0] - window + 1
+    cols = gray_image.shape[1] - window + 1
+
+    parts = []
+    for top, bottom, left, right in regions:
+        outer_top, outer_bottom = max(top - nms_radius, 0), min(bottom + nms_radius, rows)
+        outer_left, outer_right = max(left - nms_radius, 0), min(right + nms_radius, cols)
+        response = response_region(gray_image, k, window_size, outer_top, outer_bottom, outer_left, outer_right)
+        ys, xs, rs = select_corners(response, threshold, nms_radius)
+        ys, xs = ys + outer_top, xs + outer_left
+        inside = (ys >= top) & (ys < bottom) & (xs >= left) & (xs < right)
+        parts.append((ys[inside], xs[inside], rs[inside]))
+
+    if not parts:
+        return np.empty(0, np.intp), np.empty(0, np.intp), np.empty(0, np.float64)
+    ys, xs, rs = (np.concatenate(column) for column in zip(*parts))
+    order = np.lexsort((xs, ys))
+    return ys[order], xs[order], rs[order]
+
+
+def detect_low_memory(gray_image, k, window_size, threshold, workers=1, nms_radius=0):
+    """
+    Полный детектор по горизонтальным полосам LOW_MEMORY_STRIP_ROWS с целочисленной
+    арифметикой: карта отклика всего изображения не создаётся. При workers > 1 полосы
+    делятся на workers непрерывных групп, у каждой группы свои буферы.
+    """
+    window = 2 * int(window_size / 2) + 1
+    rows = gray_image.shape[0] - window + 1
+    cols = gray_image.shape[1] - window + 1
+    if rows <= 0 or cols <= 0:
+        return np.empty(0, np.intp), np.empty(0, np.intp), np.empty(0, np.float64)
+
+    strips = [(top, min(top + LOW_MEMORY_STRIP_ROWS, rows), 0, cols) for top in range(0, rows, LOW_MEMORY_STRIP_ROWS)]
+
+    def detect_group(group):
+        response_region = partial(harris_response_region_low_memory, scratch=ScratchBuffers())
+        return detect_in_regions(gray_image, group, k, window_size, threshold, nms_radius, response_region)
+
+    groups = [group.tolist() for group in np.array_split(np.array(strips), min(workers, len(strips))) if len(group)]
+    if len(groups) <= 1:
+        return detect_group(strips)
+    futures = [_get_executor(workers).submit(contextvars.copy_context().run, detect_group, group) for group in groups]
+    # Группы идут подряд по строкам, поэтому склейка сохраняет построчный порядок
+    return tuple(np.concatenate(column) for column in zip(*(future.result() for future in futures)))
+
+
+def _block_runs(marked, block, rows, cols):
+    # Подряд идущие отмеченные блоки одной строки сетки объединяются в один прямоугольник
+    regions = []
+    for block_row in np.nonzero(marked.any(axis=1))[0]:
+        edges = np.diff(np.concatenate(([0], marked[block_row].astype(np.int8), [0])))
+        for start, stop in zip(np.nonzero(edges == 1)[0], np.nonzero(edges == -1)[0]):
+            regions.append((
+                block_row * block, min((block_row + 1) * block, rows), start * block, min(stop * block, cols)
+            ))
+    return regions
+
+
+def pyramid_candidate_regions(gray_image, k, window_size, threshold, levels=FAST_PYRAMID_LEVELS):
+    """
+    Области карты отклика полного разрешения, где стоит искать углы в режиме fast.
+
+    Отклик считается на уровне пирамиды, уменьшенном в 2^levels раз, с порогом
+    threshold * FAST_COARSE_THRESHOLD_FACTOR. Каждый найденный кандидат отмечает блоки
+    FAST_BLOCK_SIZE x FAST_BLOCK_SIZE полного разрешения в радиусе 2 * 2^levels пикселей.
+    """
+    offset = int(window_size / 2)
+    window = 2 * offset + 1
+    rows = gray_image.shape[0] - window + 1
+    cols = gray_image.shape[1] - window + 1
+    if rows <= 0 or cols <= 0:
+        return []
+
+    coarse = gray_image
+    for _ in range(levels):
+        coarse = cv2.pyrDown(coarse)
+    coarse_response = harris_response(coarse, k, window_size)
+    coarse_ys, coarse_xs = np.nonzero(coarse_response > threshold * FAST_COARSE_THRESHOLD_FACTOR)
+
+    # Центр окна (c + offset) грубого уровня соответствует (c + offset) * scale полного разрешения
+    scale = 2 ** levels
+    radius = 2 * scale
+    ys = (coarse_ys + offset) * scale - offset
+    xs = (coarse_xs + offset) * scale - offset
+
+    block = FAST_BLOCK_SIZE
+    marked = np.zeros(((rows + block - 1) // block, (cols + block - 1) // block), dtype=bool)
+    # Радиус меньше размера блока, поэтому окрестность кандидата задевает не больше двух блоков по оси
+    for dy in (-radius, radius):
+        for dx in (-radius, radius):
+            block_ys = np.clip((ys + dy) // block, 0, marked.shape[0] - 1)
+            block_xs = np.clip((xs + dx) // block, 0, marked.shape[1] - 1)
+            marked[block_ys, block_xs] = True
+    return _block_runs(marked, block, rows, cols)
+
+
+def disjoint_rectangles(rects):
+    """
+    Объединение прямоугольников (top, bottom, left, right) в виде непересекающихся
+    прямоугольников: горизонтальные полосы между границами, в каждой - объединённые
+    интервалы столбцов; одинаковые интервалы соседних полос склеиваются по вертикали.
+    """
+    edges = sorted({y for top, bottom, _, _ in rects for y in (top, bottom)})
+    regions = []
+    active = {}
+    for band_top, band_bottom in zip(edges[:-1], edges[1:]):
+        intervals = []
+        for left, right in sorted((left, right) for top, bottom, left, right in rects
+                                  if top <= band_top and bottom >= band_bottom):
+            if intervals and left <= intervals[-1][1]:
+                intervals[-1][1] = max(intervals[-1][1], right)
+            else:
+                intervals.append([left, right])
+        intervals = set(map(tuple, intervals))
+        for interval in set(active) - intervals:
+            regions.append((active.pop(interval), band_top) + interval)
+        for interval in intervals - set(active):
+            active[interval] = band_top
+    if edges:
+        regions.extend((top, edges[-1]) + interval for interval, top in active.items())
+    return regions
+
+
+def roi_regions(shape, window_size, rois=None, mask=None):
+    """
+    Непересекающиеся прямоугольники карты отклика (top, bottom, left, right) для углов
+    с центрами внутри rois - прямоугольников (x, y, width, height) в координатах
+    изображения - и внутри ограничивающих прямоугольников связных областей маски.
+    """
+    offset = int(window_size / 2)
+    window = 2 * offset + 1
+    rows, cols = shape[0] - window + 1, shape[1] - window + 1
+    boxes = [tuple(roi) for roi in rois or ()]
+    if mask is not None:
+        _, _, stats, _ = cv2.connectedComponentsWithStats(mask.astype(np.uint8), connectivity=8)
+        boxes.extend(tuple(stat[:4]) for stat in stats[1:])
+
+    rects = []
+    for x, y, width, height in boxes:
+        top, bottom = max(y - offset, 0), min(y + height - offset, rows)
+        left, right = max(x - offset, 0), min(x + width - offset, cols)
+        if top < bottom and left < right:
+            rects.append((int(top), int(bottom), int(left), int(right)))
+    return disjoint_rectangles(rects)
+
+
+def detect_in_rois(gray_image, k, window_size, threshold, nms_radius=0, rois=None, mask=None, low_memory=False):
+    """
+    Углы только с центрами внутри rois или ненулевых пикселей маски (mask - массив
+    размера изображения). Градиенты и суммы считаются лишь для ограничивающих
+    прямоугольников с гало, поэтому время зависит от площади областей, а не изображения.
+    Результат совпадает с углами полной детекции, попавшими в области.
+    """
+    if mask is not None and mask.shape != gray_image.shape:
+        raise ValueError("Mask size must match the image size.")
+    offset = int(window_size / 2)
+    regions = roi_regions(gray_image.shape, window_size, rois, mask)
+    response_region = harris_response_region
+    if low_memory:
+        response_region = partial(harris_response_region_low_memory, scratch=ScratchBuffers())
+        regions = [(top, min(top + LOW_MEMORY_STRIP_ROWS, bottom), left, right)
+                   for top, bottom, left, right in regions for top in range(top, bottom, LOW_MEMORY_STRIP_ROWS)]
+    ys, xs, rs = detect_in_regions(gray_image, regions, k, window_size, threshold, nms_radius, response_region)
+
+    if mask is not None:
+        # Прямоугольники связных областей шире самой маски: остаются углы на маске или в rois
+        inside = mask[ys + offset, xs + offset] != 0
+        for x, y, width, height in rois or ():
+            inside |= (xs + offset >= x) & (xs + offset < x + width) & (ys + offset >= y) & (ys + offset < y + height)
+        ys, xs, rs = ys[inside], xs[inside], rs[inside]
+    return ys, xs, rs
+
+
+class Corners:
+    """
+    Найденные углы в виде столбцов: координаты x, y (int32) и отклик r (float64).
+    """
+    __slots__ = ('x', 'y', 'r')
+
+    def __init__(self, x, y, r):
+        self.x = np.asarray(x, dtype=np.int32)
+        self.y = np.asarray(y, dtype=np.int32)
+        self.r = np.asarray(r, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.x)
+
+    def __eq__(self, other):
+        if not isinstance(other, Corners):
+            return NotImplemented
+        return all(np.array_equal(a, b) for a, b in zip((self.x, self.y, self.r), (other.x, other.y, other.r)))
+
+    @property
+    def nbytes(self):
+        return self.x.nbytes + self.y.nbytes + self.r.nbytes
+
+    def scaled(self, factor):
+        """Координаты, умноженные на factor (после уменьшенного декодирования)."""
+        return Corners(self.x * factor, self.y * factor, self.r)
+
+    def tolist(self):
+        """Список [x, y, r] из чисел Python - прежний формат результата детектора."""
+        return [list(point) for point in zip(self.x.tolist(), self.y.tolist(), self.r.tolist())]
+
+
+def corners_from_response(response, window_size, threshold, nms_radius=0, max_points=None):
+    """Углы на полной карте отклика harris_response в координатах изображения."""
+    offset = int(window_size / 2)
+    # Порог применяется ко всей карте сразу; nonzero сохраняет построчный порядок обхода
+    ys, xs, rs = select_corners(response, threshold, nms_radius, max_points)
+    return Corners(xs + offset, ys + offset, rs)
+
+
+def detect_corners(gray_image, k=0.2, window_size=7, threshold=1500000.0, workers=1,
+                   nms_radius=0, max_points=None, mode='full', low_memory=False, rois=None, mask=None):
+    """
+    mode='full' - полный расчёт отклика; mode='fast' - поиск кандидатов на уменьшенном
+    уровне пирамиды и точный расчёт отклика только в их окрестностях. Режим fast
+    возвращает подмножество результата full с теми же значениями отклика.
+
+    low_memory=True - режим full по полосам с целочисленными промежуточными массивами
+    (detect_low_memory); результат тот же, пиковая память в разы меньше. Для изображений
+    не uint8 полосы считаются в float64, как в режиме full.
+
+    rois (прямоугольники (x, y, width, height)) и mask ограничивают поиск областями
+    изображения (detect_in_rois); max_points применяется к углам в областях.
+    """
+    offset = int(window_size / 2)
+    if rois is not None or mask is not None:
+        if mode == 'fast':
+            raise ValueError("Regions of interest cannot be combined with mode 'fast'.")
+        ys, xs, rs = detect_in_rois(gray_image, k, window_size, threshold, nms_radius, rois, mask, low_memory)
+        ys, xs, rs = strongest(ys, xs, rs, max_points)
+    elif mode == 'fast':
+        regions = pyramid_candidate_regions(gray_image, k, window_size, threshold)
+        ys, xs, rs = detect_in_regions(gray_image, regions, k, window_size, threshold, nms_radius)
+        ys, xs, rs = strongest(ys, xs, rs, max_points)
+    elif low_memory:
+        ys, xs, rs = detect_low_memory(gray_image, k, window_size, threshold, workers, nms_radius)
+        ys, xs, rs = strongest(ys, xs, rs, max_points)
+    else:
+        return corners_from_response(harris_response(gray_image, k, window_size, workers), window_size,
+                                     threshold, nms_radius, max_points)
+    return Corners(xs + offset, ys + offset, rs)
+
+
+def detect_points_of_interest(gray_image, k=0.2, window_size=7, threshold=1500000.0, workers=1,
+                              nms_radius=0, max_points=None, mode='full', low_memory=False, rois=None, mask=None):
+    return detect_corners(
+        gray_image, k, window_size, threshold, workers, nms_radius, max_points, mode, low_memory, rois, mask
+    ).tolist()
+
+
+def detect_points_of_interest_reference(gray_image, k=0.2, window_size=7, threshold=1500000.0):
+    """
+    Исходная попиксельная реализация детектора. Используется как эталон для проверки
+    векторизованной версии; в запросах доступна только как бэкенд reference.
+    """
     corner_list = []
     offset = int(window_size / 2)
     y_range = gray_image.shape[0] - offset
@@ -45,8 +622,4 @@ def detect_points_of_interest(gray_image, k=0.2, window_size=7, threshold=150000
             if r > threshold:
                 corner_list.append([x, y, r])
 
-    # Конвертация результата в формат JSON и сохранение в файл
-    with open('output/results.json', 'w') as json_file:
-        json.dump(corner_list, json_file)
-
     return corner_list
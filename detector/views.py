@@ -1,19 +1,37 @@
+import asyncio
+import threading
+import time
+
+from asgiref.sync import sync_to_async
 from rest_framework.authtoken.models import Token
 from rest_framework.response import Response
 from rest_framework.views import APIView
-import tempfile
-from .utils import process_image, detect_points_of_interest
+from .pipeline import detect_upload, detect_batch, detect_sequence, get_async_executor, error_details
+from .pipeline import detect_upload_retained, detect_retained, detect_upload_progressive
+from .admission import ImageTooLarge, admit_upload
+from .renderers import corner_renderer_classes, to_json
+from .jobs import submit_job, expired_jobs, QueueFull
+from .models import DetectionJob, DetectionRun
+from .results import query_run_points, save_upload_run
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from django.contrib.auth import authenticate
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
 from rest_framework_simplejwt.tokens import AccessToken
-import json
-import os
-import numpy as np
-from .serializers import RegisterUserSerializer
+from .authentication import DetectorJWTAuthentication
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.http import HttpResponse, HttpResponseNotAllowed, Http404, StreamingHttpResponse
+from .cache import get_detection_cache
+from .responses import get_response_map_store
+from .warmup import warm_up
+from .metrics import metrics_enabled, start_timings, finish_timings, stage, observe_request, expose
+from .serializers import RegisterUserSerializer, DetectionParamsSerializer, JobParamsSerializer, SequenceParamsSerializer
+from .serializers import ImageParamsSerializer, ResponseMapParamsSerializer, RunPointsQuerySerializer
+from .serializers import DetectionRunSerializer, StreamParamsSerializer
 
 
 # Создадим эндпоинты для регистрации и получения токенов
@@ -33,61 +51,567 @@ class ObtainTokenView(APIView):
         password = request.data.get('password')
         user = authenticate(username=username, password=password)
         if user is not None:
-            # Создаем токен доступа
+            # Создаем токен доступа; username из claims использует DetectorJWTAuthentication
             access_token = AccessToken.for_user(user)
+            access_token['username'] = user.username
             return Response({'token': str(access_token)}, status=status.HTTP_200_OK)
         return Response({'error': 'Invalid credentials'}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class ImageProcessingView(APIView):
+class StageTimingMixin:
+    """
+    Замер стадий запроса при DETECTOR_METRICS['ENABLED']: длительности стадий возвращаются
+    в заголовке Server-Timing и попадают в гистограммы /metrics. Ответ рендерится здесь же,
+    чтобы в замеры вошло кодирование ответа.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if not metrics_enabled():
+            return super().dispatch(request, *args, **kwargs)
+
+        start = time.perf_counter()
+        timings, token = start_timings()
+        try:
+            response = super().dispatch(request, *args, **kwargs)
+            if hasattr(response, 'render'):
+                with stage('render'):
+                    response.render()
+        finally:
+            finish_timings(token)
+        total = time.perf_counter() - start
+
+        response['Server-Timing'] = timings.server_timing(total)
+        observe_request(self.__class__.__name__, response.status_code, timings, total)
+        return response
+
+
+class ImageProcessingView(StageTimingMixin, APIView):
+    authentication_classes = [DetectorJWTAuthentication]
     permission_classes = [IsAuthenticated]
     parser_classes = (MultiPartParser, FormParser)
+    # Формат ответа выбирается по Accept или параметру ?format=json|columnar|npy|msgpack
+    renderer_classes = corner_renderer_classes()
 
     def post(self, request, *args, **kwargs):
-        image_file = request.FILES.get('image')
+        # Разбор multipart (и запись больших загрузок во временный файл) выполняется при первом обращении
+        with stage('parse'):
+            image_file = request.FILES.get('image')
         if not image_file:
             return Response(
-                self.serialize_response({"error": "No image provided"}),
+                {"error": "No image provided"},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Сохраняем загруженное изображение во временный файл
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-            temp_file.write(image_file.read())
-            temp_file_path = temp_file.name
+        params = ImageParamsSerializer(data=request.data)
+        if not params.is_valid():
+            return Response(
+                {"error": params.errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        detection_params = dict(params.validated_data)
+        retain = detection_params.pop('retain')
+        persist = detection_params.pop('persist')
+        reduce = detection_params.pop('reduce', 1)
+        run_params = {**detection_params, 'reduce': reduce}
 
         try:
-            gray_image = process_image(temp_file_path)
-            points_of_interest = detect_points_of_interest(gray_image)
+            if retain:
+                # Карты отклика сохраняются для повторной детекции через /api/response-maps/<handle>/
+                detection_params.pop('backend', None)
+                detection_params.pop('mode', None)
+                points_of_interest, handle = detect_upload_retained(
+                    image_file, request.user.pk, reduce, **detection_params
+                )
+                data = {"points_of_interest": points_of_interest, "handle": handle}
+            else:
+                # Загрузка декодируется сразу в оттенки серого, без временного файла
+                points_of_interest = detect_upload(image_file, reduce, **detection_params)
+                data = {"points_of_interest": points_of_interest}
+            if persist:
+                with stage('persist'):
+                    run = save_upload_run(image_file, points_of_interest, run_params, request.user.pk)
+                data["run_id"] = str(run.pk)
+            return Response(data, status=status.HTTP_200_OK)
+        except ImageTooLarge as e:
+            # Изображение отклонено по заголовку, до декодирования
             return Response(
-                self.serialize_response({"points_of_interest": points_of_interest}),
-                status=status.HTTP_200_OK
+                error_details(e),
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+        except ValueError as e:
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_400_BAD_REQUEST
             )
         except Exception as e:
             return Response(
-                self.serialize_response({"error": str(e)}),
+                {"error": str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
-        finally:
-            # Удаляем временный файл после обработки
-            os.remove(temp_file_path)
-
-    def serialize_response(self, data):
-        """
-        Сериализует данные в JSON строку с компактным форматом, обрабатывая нестандартные типы данных.
-        """
-        def default_serializer(obj):
-            if isinstance(obj, (np.int8, np.int16, np.int32, np.int64, np.uint8, np.uint16, np.uint32, np.uint64)):
-                return int(obj)
-            if isinstance(obj, np.float32) or isinstance(obj, np.float64):
-                return float(obj)
-            raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
-        return json.dumps(data, default=default_serializer, ensure_ascii=False, separators=(',', ':'))
 
 
-class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
+class ResponseMapView(StageTimingMixin, APIView):
+    """
+    Повторная детекция изображения, загруженного в /api/process-image/ с retain=true.
+
+    POST с новыми k, window_size, threshold, nms_radius, max_points не декодирует изображение
+    заново: при неизменных k и window_size используется сохранённая карта отклика, при
+    новом k - сохранённые суммы структурного тензора. DELETE освобождает память.
+    Карты хранятся в памяти процесса, вытесненный дескриптор возвращает 404. Без общего уровня
+    DETECTOR_RESPONSE_MAPS['SHARED_ALIAS'] дескриптор известен только выдавшему его воркеру.
+    """
+    authentication_classes = [DetectorJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    parser_classes = (JSONParser, FormParser, MultiPartParser)
+    renderer_classes = corner_renderer_classes()
+
+    def post(self, request, handle, *args, **kwargs):
+        params = ResponseMapParamsSerializer(data=request.data)
+        if not params.is_valid():
+            return Response(
+                {"error": params.errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            points_of_interest = detect_retained(handle, request.user.pk, **params.validated_data)
+        except KeyError:
+            return self.not_found()
+        return Response(
+            {"handle": handle, "points_of_interest": points_of_interest},
+            status=status.HTTP_200_OK
+        )
+
+    def delete(self, request, handle, *args, **kwargs):
+        try:
+            get_response_map_store().discard(handle, request.user.pk)
+        except KeyError:
+            return self.not_found()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
     @staticmethod
-    def get_token(user):
+    def not_found():
+        if settings.DETECTOR_RESPONSE_MAPS.get('SHARED_ALIAS'):
+            error = "Response map not found or evicted, upload the image again with retain=true"
+        else:
+            error = (
+                "Response map handle is unknown to this worker process or was evicted: retained maps are kept "
+                "per process unless DETECTOR_RESPONSE_MAPS_SHARED_ALIAS is set; upload the image again with retain=true"
+            )
+        return Response({"error": error}, status=status.HTTP_404_NOT_FOUND)
+
+
+def ndjson_lines(records):
+    try:
+        for record in records:
+            yield to_json(record) + '\n'
+    except Exception as e:
+        # Статус ответа уже отправлен, поэтому ошибка передаётся последней записью
+        yield to_json({"error": str(e)}) + '\n'
+
+
+class StreamingDetectionView(APIView):
+    """
+    Потоковая детекция: изображение обрабатывается полосами, и углы каждой полосы
+    отправляются отдельной строкой JSON (application/x-ndjson), как только готовы.
+    Последняя строка - итог с числом углов и временем до первой полосы.
+    """
+    authentication_classes = [DetectorJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    parser_classes = (MultiPartParser, FormParser)
+
+    def post(self, request, *args, **kwargs):
+        image_file = request.FILES.get('image')
+        if not image_file:
+            return Response({"error": "No image provided"}, status=status.HTTP_400_BAD_REQUEST)
+
+        params = StreamParamsSerializer(data=request.data)
+        if not params.is_valid():
+            return Response({"error": params.errors}, status=status.HTTP_400_BAD_REQUEST)
+        detection_params = dict(params.validated_data)
+        reduce = detection_params.pop('reduce', 1)
+
+        # Ошибки допуска и декодирования возвращаются обычным ответом, до начала потока
+        try:
+            records = detect_upload_progressive(image_file, reduce, **detection_params)
+        except ImageTooLarge as e:
+            return Response(error_details(e), status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(ndjson_lines(records), content_type='application/x-ndjson')
+        response['Cache-Control'] = 'no-cache'
+        # nginx иначе буферизует ответ целиком
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class DetectionRunListView(APIView):
+    """Сохранённые результаты пользователя, новые первыми; ?image_hash= - только для этого файла."""
+    authentication_classes = [DetectorJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    max_runs = 100
+
+    def get(self, request, *args, **kwargs):
+        runs = DetectionRun.objects.filter(user_id=request.user.pk).order_by('-created_at')
+        image_hash = request.query_params.get('image_hash')
+        if image_hash:
+            runs = runs.filter(image_hash=image_hash)
+        return Response(
+            {"runs": DetectionRunSerializer(runs[:self.max_runs], many=True).data},
+            status=status.HTTP_200_OK
+        )
+
+
+class DetectionRunDetailView(APIView):
+    """Параметры сохранённого результата (GET) и его удаление вместе с тайлами (DELETE)."""
+    authentication_classes = [DetectorJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, run_id, *args, **kwargs):
+        run = DetectionRun.objects.filter(pk=run_id, user_id=request.user.pk).first()
+        if run is None:
+            return run_not_found()
+        return Response(DetectionRunSerializer(run).data, status=status.HTTP_200_OK)
+
+    def delete(self, request, run_id, *args, **kwargs):
+        deleted, _ = DetectionRun.objects.filter(pk=run_id, user_id=request.user.pk).delete()
+        if not deleted:
+            return run_not_found()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class DetectionRunPointsView(StageTimingMixin, APIView):
+    """
+    Углы сохранённого результата внутри bbox по убыванию отклика, страницами по limit.
+    Следующая страница запрашивается с cursor=next_cursor; на последней next_cursor - null.
+    Читаются только тайлы, пересекающие bbox и способные попасть на страницу.
+    """
+    authentication_classes = [DetectorJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    renderer_classes = corner_renderer_classes(single_image=False)
+
+    def get(self, request, run_id, *args, **kwargs):
+        params = RunPointsQuerySerializer(data=request.query_params)
+        if not params.is_valid():
+            return Response(
+                {"error": params.errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        run = DetectionRun.objects.filter(pk=run_id, user_id=request.user.pk).first()
+        if run is None:
+            return run_not_found()
+
+        try:
+            with stage('query'):
+                points_of_interest, next_cursor = query_run_points(run, **params.validated_data)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            {"run_id": str(run.pk), "points_of_interest": points_of_interest, "next_cursor": next_cursor},
+            status=status.HTTP_200_OK
+        )
+
+
+def run_not_found():
+    return Response({"error": "Detection run not found"}, status=status.HTTP_404_NOT_FOUND)
+
+
+class BatchProcessingView(ImageProcessingView):
+    """
+    Детекция для нескольких изображений, переданных в поле images одного multipart запроса.
+
+    Результаты возвращаются по именам файлов; ошибка одного изображения не прерывает пакет.
+    """
+    renderer_classes = corner_renderer_classes(single_image=False)
+
+    def post(self, request, *args, **kwargs):
+        with stage('parse'):
+            image_files = request.FILES.getlist('images')
+        if not image_files:
+            return Response(
+                {"error": "No images provided"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        max_files = settings.DETECTOR_BATCH['MAX_FILES']
+        if len(image_files) > max_files:
+            return Response(
+                {"error": f"Too many images in batch, limit is {max_files}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        params = DetectionParamsSerializer(data=request.data)
+        if not params.is_valid():
+            return Response(
+                {"error": params.errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        detection_params = dict(params.validated_data)
+        reduce = detection_params.pop('reduce', 1)
+
+        results = {}
+        for name, result in detect_batch(image_files, reduce, **detection_params):
+            # Одинаковые имена файлов в пакете получают суффикс с номером
+            key, suffix = name, 2
+            while key in results:
+                key, suffix = f"{name}#{suffix}", suffix + 1
+            results[key] = result
+
+        return Response(
+            {"results": results},
+            status=status.HTTP_200_OK
+        )
+
+
+class SequenceProcessingView(ImageProcessingView):
+    """
+    Последовательность кадров (поле frames, в порядке съёмки): полная детекция только
+    на ключевых кадрах, между ними углы отслеживаются оптическим потоком.
+
+    Для каждого кадра возвращаются углы, признак ключевого кадра, число отслеженных
+    углов и время обработки; в summary - сравнение с полной детекцией на каждом кадре.
+    """
+    renderer_classes = corner_renderer_classes(single_image=False)
+
+    def post(self, request, *args, **kwargs):
+        with stage('parse'):
+            image_files = request.FILES.getlist('frames')
+        if not image_files:
+            return Response(
+                {"error": "No frames provided"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        max_files = settings.DETECTOR_BATCH['MAX_FILES']
+        if len(image_files) > max_files:
+            return Response(
+                {"error": f"Too many frames in sequence, limit is {max_files}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        params = SequenceParamsSerializer(data=request.data)
+        if not params.is_valid():
+            return Response(
+                {"error": params.errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        detection_params = dict(params.validated_data)
+        reduce = detection_params.pop('reduce', 1)
+
+        try:
+            frames, summary = detect_sequence(image_files, reduce, **detection_params)
+        except ImageTooLarge as e:
+            return Response(error_details(e), status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(
+            {"frames": [{"name": name, **result} for name, result in frames], "summary": summary},
+            status=status.HTTP_200_OK
+        )
+
+
+class JobListView(APIView):
+    """Постановка изображения в очередь асинхронной детекции."""
+    authentication_classes = [DetectorJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    parser_classes = (MultiPartParser, FormParser)
+
+    def post(self, request, *args, **kwargs):
+        image_file = request.FILES.get('image')
+        if not image_file:
+            return Response({"error": "No image provided"}, status=status.HTTP_400_BAD_REQUEST)
+
+        params = JobParamsSerializer(data=request.data)
+        if not params.is_valid():
+            return Response({"error": params.errors}, status=status.HTTP_400_BAD_REQUEST)
+        detection_params = dict(params.validated_data)
+        priority = detection_params.pop('priority')
+
+        # Слишком большие и нераспознанные изображения не ставятся в очередь
+        try:
+            admit_upload(image_file, detection_params.get('reduce', 1))
+        except ImageTooLarge as e:
+            return Response(error_details(e), status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            job = submit_job(image_file, detection_params, priority=priority, user_id=request.user.pk)
+        except QueueFull as e:
+            return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response({"job_id": str(job.pk), "status": job.status}, status=status.HTTP_202_ACCEPTED)
+
+
+class JobDetailView(APIView):
+    """Статус задания и, после завершения, его результат."""
+    authentication_classes = [DetectorJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id, *args, **kwargs):
+        job = (
+            DetectionJob.objects.filter(pk=job_id, user_id=request.user.pk)
+            .exclude(pk__in=expired_jobs().values('pk'))
+            .defer('image')
+            .first()
+        )
+        if job is None:
+            return Response({"error": "Job not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        data = {"job_id": str(job.pk), "status": job.status}
+        if job.status == DetectionJob.DONE:
+            data["points_of_interest"] = job.result
+        elif job.status == DetectionJob.FAILED:
+            data["error"] = job.error
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class InFlightLimiter:
+    """Счётчик запросов в обработке с верхней границей, общий для потоков процесса."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, limit):
+        with self._lock:
+            if self.count >= limit:
+                return False
+            self.count += 1
+            return True
+
+    def release(self, *args):
+        with self._lock:
+            self.count -= 1
+
+
+async_in_flight = InFlightLimiter()
+
+
+def json_response(data, status_code):
+    return HttpResponse(to_json(data), status=status_code, content_type='application/json')
+
+
+def _authenticate(request):
+    try:
+        result = DetectorJWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result is not None else None
+
+
+def _detect_request(request):
+    # Выполняется в пуле детекции: разбор multipart, проверка параметров, декодирование и детекция
+    image_file = request.FILES.get('image')
+    if not image_file:
+        return {"error": "No image provided"}, status.HTTP_400_BAD_REQUEST
+
+    params = DetectionParamsSerializer(data=request.POST)
+    if not params.is_valid():
+        return {"error": params.errors}, status.HTTP_400_BAD_REQUEST
+    detection_params = dict(params.validated_data)
+    reduce = detection_params.pop('reduce', 1)
+
+    try:
+        points_of_interest = detect_upload(image_file, reduce, **detection_params)
+        return {"points_of_interest": points_of_interest}, status.HTTP_200_OK
+    except ImageTooLarge as e:
+        return error_details(e), status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    except ValueError as e:
+        return {"error": str(e)}, status.HTTP_400_BAD_REQUEST
+    except Exception as e:
+        return {"error": str(e)}, status.HTTP_500_INTERNAL_SERVER_ERROR
+
+
+async def async_image_processing_view(request):
+    """
+    Асинхронный вариант /api/process-image/ для запуска под ASGI.
+
+    Загрузка принимается в цикле событий, а разбор, декодирование и детекция выполняются
+    в ограниченном пуле DETECTOR_ASYNC['WORKERS']. Если в обработке уже MAX_IN_FLIGHT
+    запросов, сразу возвращается 503 с заголовком Retry-After, а не растёт очередь.
+    Место в очереди освобождается, когда детекция в пуле завершена, даже если клиент
+    уже отключился.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    options = settings.DETECTOR_ASYNC
+    if not async_in_flight.acquire(options['MAX_IN_FLIGHT']):
+        response = json_response({"error": "Server is busy, retry later"}, status.HTTP_503_SERVICE_UNAVAILABLE)
+        response['Retry-After'] = str(options['RETRY_AFTER'])
+        return response
+
+    submitted = False
+    try:
+        user = await sync_to_async(_authenticate)(request)
+        if user is None:
+            return json_response(
+                {"detail": "Authentication credentials were not provided or are invalid."},
+                status.HTTP_401_UNAUTHORIZED
+            )
+        future = get_async_executor().submit(_detect_request, request)
+        future.add_done_callback(async_in_flight.release)
+        submitted = True
+        data, status_code = await asyncio.wrap_future(future)
+        return json_response(data, status_code)
+    finally:
+        if not submitted:
+            async_in_flight.release()
+
+
+# Аутентификация по JWT в заголовке, поэтому CSRF не проверяется, как и у APIView.
+# Декоратор csrf_exempt в Django 3.2 превращает корутину в синхронную функцию
+async_image_processing_view.csrf_exempt = True
+
+
+def metrics_view(request):
+    """
+    Метрики процесса в текстовом формате Prometheus: гистограммы стадий и длительности
+    запросов, размеров изображений и числа углов, статистика кэша детекции.
+    Каждый воркер gunicorn отдаёт собственные значения.
+    """
+    if not metrics_enabled():
+        raise Http404('Metrics are disabled')
+
+    cache_stats = get_detection_cache().stats()
+    map_stats = get_response_map_store().stats()
+    gauges = [
+        ('detector_cache_hits_total', 'Detection cache hits in process memory.', 'counter', cache_stats['hits']),
+        ('detector_cache_shared_hits_total', 'Detection cache hits in the shared cache.', 'counter',
+         cache_stats['shared_hits']),
+        ('detector_cache_misses_total', 'Detection cache misses.', 'counter', cache_stats['misses']),
+        ('detector_cache_evictions_total', 'Detection cache evictions.', 'counter', cache_stats['evictions']),
+        ('detector_cache_entries', 'Entries in the detection cache.', 'gauge', cache_stats['entries']),
+        ('detector_cache_bytes', 'Estimated size of the detection cache.', 'gauge', cache_stats['bytes']),
+        ('detector_response_maps_entries', 'Images retained for re-thresholding.', 'gauge', map_stats['entries']),
+        ('detector_response_maps_bytes', 'Memory used by retained response maps.', 'gauge', map_stats['bytes']),
+        ('detector_response_maps_evictions_total', 'Retained images evicted from the response map store.', 'counter',
+         map_stats['evictions']),
+        ('detector_response_maps_shared_hits_total', 'Retained images restored from the shared cache.', 'counter',
+         map_stats['shared_hits']),
+    ]
+    return HttpResponse(expose(gauges), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def readiness_view(request):
+    """
+    Готовность воркера к запросам для балансировщика и healthcheck: детектор прогрет
+    (под gunicorn - ещё до первого запроса) и база данных доступна; иначе 503.
+    """
+    warm_up_ms = warm_up()
+    try:
+        connection.ensure_connection()
+    except DatabaseError as e:
+        return json_response({"status": "unavailable", "error": str(e)}, status.HTTP_503_SERVICE_UNAVAILABLE)
+    return json_response({"status": "ready", "warm_up_ms": warm_up_ms}, status.HTTP_200_OK)
+
+
+class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
         token = super().get_token(user)
 
         # Добавьте дополнительные данные в токен
@@ -0,0 +1,44 @@
+import io
+import threading
+import time
+
+import cv2
+import numpy as np
+from django.urls import get_resolver
+
+from .backends import detect_with_backend
+from .utils import decode_image
+
+# Размер синтетического изображения для прогрева: достаточно, чтобы пройти все стадии детекции
+WARM_UP_SIZE = 64
+
+_warm_up_ms = None
+_warm_up_lock = threading.Lock()
+
+
+def load_application():
+    """
+    Импорт URLconf и через него всех представлений, сериализаторов и OpenCV. Django делает
+    это при первом запросе; в мастере gunicorn с preload_app модули загружаются один раз
+    до fork, и их страницы памяти остаются общими для воркеров.
+    """
+    return len(get_resolver().url_patterns)
+
+
+def warm_up():
+    """
+    Прогрев процесса маленькой детекцией: декодирование PNG и детектор DETECTOR_BACKEND.
+    OpenCV и numpy при первом вызове инициализируют пулы потоков и диспетчеризацию
+    под процессор, иначе за это платит первый запрос. Выполняется один раз на процесс
+    и возвращает длительность прогрева в миллисекундах.
+    """
+    global _warm_up_ms
+    with _warm_up_lock:
+        if _warm_up_ms is None:
+            start = time.perf_counter()
+            image = np.zeros((WARM_UP_SIZE, WARM_UP_SIZE), np.uint8)
+            image[WARM_UP_SIZE // 4:-WARM_UP_SIZE // 4, WARM_UP_SIZE // 4:-WARM_UP_SIZE // 4] = 255
+            _, encoded = cv2.imencode('.png', image)
+            detect_with_backend(decode_image(io.BytesIO(encoded.tobytes())), threshold=0)
+            _warm_up_ms = (time.perf_counter() - start) * 1000
+        return _warm_up_ms
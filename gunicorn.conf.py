@@ -0,0 +1,34 @@
+"""
+Конфигурация gunicorn для продакшена: gunicorn -c gunicorn.conf.py
+
+Приложение загружается в мастере до fork (preload_app), поэтому Django, numpy, OpenCV
+и все представления импортируются один раз, а их страницы памяти остаются общими
+для воркеров (copy-on-write). Каждый воркер до приёма запросов выполняет маленькую
+детекцию (detector.warmup.warm_up).
+"""
+import gc
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'point_detector.settings_production')
+
+wsgi_app = 'point_detector.asgi:application'
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', '3'))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'uvicorn.workers.UvicornWorker')
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+preload_app = True
+
+
+def when_ready(server):
+    # Вызывается в мастере после загрузки приложения и до запуска воркеров
+    from detector.warmup import load_application
+    load_application()
+    # Сборщик мусора не обходит уже загруженные объекты и не копирует их страницы в воркерах
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    # OpenCV создаёт пулы потоков при первом вызове, а потоки не переживают fork,
+    # поэтому детекция для прогрева выполняется в каждом воркере, а не в мастере
+    from detector.warmup import warm_up
+    worker.log.info('Detector warmed up in %.1f ms', warm_up())
@@ -22,7 +22,8 @@ TESTS_TEMP_DIR = tempfile.mkdtemp()
 sentry_sdk.init(
     dsn="https://<YOUR_SENTRY_DSN>@o0.ingest.sentry.io/0",
     integrations=[DjangoIntegration()],
-    traces_sample_rate=1.0,
+    # Доля запросов с трассировкой производительности (1.0 - каждый запрос)
+    traces_sample_rate=float(os.getenv('SENTRY_TRACES_SAMPLE_RATE', '1.0')),
     send_default_pii=True
 )
 
@@ -118,6 +119,13 @@ SIMPLE_JWT = {
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
 }
 
+# Эндпоинты детекции доверяют claims проверенного JWT и не загружают пользователя из базы;
+# признак is_active кэшируется на STATUS_CACHE_TTL секунд
+DETECTOR_AUTH = {
+    'STATUS_CACHE_TTL': int(os.getenv('DETECTOR_AUTH_STATUS_CACHE_TTL', '60')),
+    'STATUS_CACHE_SIZE': 10000,
+}
+
 ROOT_URLCONF = "point_detector.urls"
 
 TEMPLATES = [
@@ -197,3 +205,117 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 TEST_COVERAGE_RATE = 70
+
+# Детектор точек интереса
+# Число потоков, между которыми делится расчёт отклика Харриса для одного изображения
+DETECTOR_WORKERS = int(os.getenv('DETECTOR_WORKERS', '1'))
+
+# Экономный по памяти расчёт (полосы, целочисленные градиенты и суммы) с тем же результатом:
+# позволяет запускать больше воркеров на одной машине ценой небольшой потери скорости
+DETECTOR_LOW_MEMORY = os.getenv('DETECTOR_LOW_MEMORY', '0') == '1'
+
+# Бэкенд детектора по умолчанию (запрос может выбрать другой параметром backend):
+# 'numpy' - векторизованный Харрис, 'reference' - исходная попиксельная реализация,
+# 'opencv_harris', 'shi_tomasi', 'fast' - детекторы OpenCV
+DETECTOR_BACKEND = os.getenv('DETECTOR_BACKEND', 'numpy')
+
+# Потоковая детекция /api/process-image-stream/: высота полосы в строках. Время до первых
+# углов пропорционально STRIP_ROWS и ширине изображения и не зависит от его высоты
+DETECTOR_STREAM = {
+    'STRIP_ROWS': int(os.getenv('DETECTOR_STREAM_STRIP_ROWS', '128')),
+}
+
+# Кэш результатов детекции: LRU в памяти процесса и, при заданном SHARED_ALIAS,
+# общий для всех воркеров уровень на бэкенде кэша Django (например, 'detector')
+DETECTOR_CACHE = {
+    'MAX_BYTES': int(os.getenv('DETECTOR_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+    'SHARED_ALIAS': os.getenv('DETECTOR_CACHE_SHARED_ALIAS') or None,
+    'SHARED_TIMEOUT': 60 * 60,
+}
+
+# Изображения, загруженные с retain=true, и их карты отклика для повторной детекции
+# (/api/response-maps/<handle>/): LRU в памяти процесса с ограничением по объёму.
+# Изображение 1920x1080 с суммами и картой отклика занимает около 68 МБ.
+# Память у каждого воркера своя: без SHARED_ALIAS дескриптор действителен только в воркере,
+# который его выдал, и другой воркер gunicorn ответит на него 404. С SHARED_ALIAS
+# (бэкенд кэша Django, общий для воркеров, например 'detector') там хранится декодированное
+# изображение, и любой воркер восстанавливает запись по дескриптору
+DETECTOR_RESPONSE_MAPS = {
+    'MAX_BYTES': int(os.getenv('DETECTOR_RESPONSE_MAPS_MAX_BYTES', str(256 * 1024 * 1024))),
+    'SHARED_ALIAS': os.getenv('DETECTOR_RESPONSE_MAPS_SHARED_ALIAS') or None,
+    'SHARED_TIMEOUT': 60 * 60,
+}
+
+# Пакетная детекция: максимум файлов и суммарных пикселей в одном запросе, размер пула
+DETECTOR_BATCH = {
+    'MAX_FILES': int(os.getenv('DETECTOR_BATCH_MAX_FILES', '64')),
+    'MAX_PIXELS': int(os.getenv('DETECTOR_BATCH_MAX_PIXELS', str(64 * 1024 * 1024))),
+    'WORKERS': int(os.getenv('DETECTOR_BATCH_WORKERS', '4')),
+}
+
+# Асинхронные задания детекции (python manage.py detection_worker):
+# максимальная глубина очереди и время хранения завершённых заданий в секундах.
+# Воркер продлевает аренду выполняемого задания каждые LEASE_TIMEOUT / 3 секунд; задание,
+# аренда которого истекла (воркер завершился или завис), возвращается в очередь, а после
+# MAX_ATTEMPTS захватов помечается как failed
+DETECTOR_JOBS = {
+    'MAX_QUEUE_DEPTH': int(os.getenv('DETECTOR_JOBS_MAX_QUEUE_DEPTH', '1000')),
+    'RESULT_TTL': int(os.getenv('DETECTOR_JOBS_RESULT_TTL', str(24 * 60 * 60))),
+    'LEASE_TIMEOUT': float(os.getenv('DETECTOR_JOBS_LEASE_TIMEOUT', '60')),
+    'MAX_ATTEMPTS': int(os.getenv('DETECTOR_JOBS_MAX_ATTEMPTS', '3')),
+}
+
+# Сохранённые результаты детекции (persist=true, /api/runs/): углы хранятся по тайлам
+# TILE_SIZE x TILE_SIZE пикселей исходного изображения; MAX_PAGE_SIZE - наибольший limit
+# страницы выборки /api/runs/<run_id>/points/
+DETECTOR_RESULTS = {
+    'TILE_SIZE': int(os.getenv('DETECTOR_RESULTS_TILE_SIZE', '256')),
+    'MAX_PAGE_SIZE': int(os.getenv('DETECTOR_RESULTS_MAX_PAGE_SIZE', '10000')),
+}
+
+# Сохранение результатов детекции вне пути запроса:
+# 'none' - не сохранять, 'file' - отдельный JSON файл на запрос в DIRECTORY,
+# 'background' - фоновый поток дописывает пачки результатов в PATH (JSON Lines)
+DETECTOR_RESULT_SINK = {
+    'BACKEND': os.getenv('DETECTOR_RESULT_SINK', 'none'),
+    'OPTIONS': {
+        'DIRECTORY': OUTPUT_DIR,
+        'PATH': os.path.join(OUTPUT_DIR, 'results.jsonl'),
+        'MAX_QUEUE': 1000,
+        'BATCH_SIZE': 100,
+        'FLUSH_INTERVAL': 1.0,
+    },
+}
+
+# Допуск загрузок до декодирования по размеру файла и размерам из заголовка изображения.
+# POLICY: 'reject' - ответ 413; 'downscale' - декодирование с уменьшением в 2 или 4 раза,
+# если так изображение укладывается в MAX_PIXELS (координаты возвращаются в исходном масштабе)
+DETECTOR_ADMISSION = {
+    'MAX_PIXELS': int(os.getenv('DETECTOR_MAX_PIXELS', str(40 * 1000 * 1000))),
+    'MAX_BYTES': int(os.getenv('DETECTOR_MAX_BYTES', str(50 * 1024 * 1024))),
+    'POLICY': os.getenv('DETECTOR_ADMISSION_POLICY', 'reject'),
+}
+
+# Асинхронный эндпоинт /api/process-image-async/ (под ASGI): число потоков детекции,
+# максимум запросов в обработке и очереди, после которого отвечаем 503 с Retry-After (в секундах)
+DETECTOR_ASYNC = {
+    'WORKERS': int(os.getenv('DETECTOR_ASYNC_WORKERS', '4')),
+    'MAX_IN_FLIGHT': int(os.getenv('DETECTOR_ASYNC_MAX_IN_FLIGHT', '16')),
+    'RETRY_AFTER': int(os.getenv('DETECTOR_ASYNC_RETRY_AFTER', '1')),
+}
+
+# Замер стадий запросов детекции: заголовок Server-Timing и гистограммы Prometheus на /metrics
+DETECTOR_METRICS = {
+    'ENABLED': os.getenv('DETECTOR_METRICS', '0') == '1',
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'detector': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'point_detector_cache'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
@@ -0,0 +1,36 @@
+"""
+Настройки для продакшена (DJANGO_SETTINGS_MODULE=point_detector.settings_production):
+общие настройки из settings.py и отличия от режима разработки.
+"""
+import os
+
+# settings.py инициализирует Sentry при импорте: трассируется только доля запросов
+os.environ.setdefault('SENTRY_TRACES_SAMPLE_RATE', '0.05')
+
+from .settings import *  # noqa: E402,F401,F403
+from .settings import INSTALLED_APPS, MIDDLEWARE  # noqa: E402
+
+DEBUG = False
+
+ALLOWED_HOSTS = [host for host in os.getenv('ALLOWED_HOSTS', 'localhost,127.0.0.1').split(',') if host]
+
+# Приложения для разработки: генерация схемы, проверки качества кода, shell_plus
+DEV_APPS = ('drf_yasg', 'django_extensions', 'eqator', 'rest_framework_swagger')
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in DEV_APPS]
+
+# Повторы в MIDDLEWARE выполнялись бы дважды на каждый запрос
+MIDDLEWARE = list(dict.fromkeys(MIDDLEWARE))
+
+# PostgreSQL, как в config-3.py, если задано имя базы; соединения переиспользуются между запросами
+if os.getenv('DB_NAME'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME'),
+            'USER': os.getenv('DB_USER'),
+            'PASSWORD': os.getenv('DB_PASSWORD'),
+            'HOST': os.getenv('DB_HOST'),
+            'PORT': os.getenv('DB_PORT'),
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        }
+    }
@@ -18,24 +18,10 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, re_path, include
 from rest_framework import permissions
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
 from django.views.generic import TemplateView
 from django.conf import settings
 from django.conf.urls.static import static
-
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Your API",
-        default_version='v1',
-        description="Test description",
-        terms_of_service="https://www.google.com/policies/terms/",
-        contact=openapi.Contact(email="contact@yourapi.local"),
-        license=openapi.License(name="BSD License"),
-    ),
-    public=True,
-    permission_classes=(permissions.AllowAny,),
-)
+from detector.views import metrics_view, readiness_view
 
 
 class SwaggerYAMLView(TemplateView):
@@ -50,6 +36,28 @@ class SwaggerYAMLView(TemplateView):
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('detector.urls')),
-    re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
+    path('metrics', metrics_view, name='metrics'),
+    path('ready', readiness_view, name='ready'),
     path('docs/swagger/', SwaggerYAMLView.as_view(), name='swagger-ui'),  # Переименован путь для лучшего отображения
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
+
+# Схема drf_yasg только в режиме разработки: в settings_production приложения нет
+if 'drf_yasg' in settings.INSTALLED_APPS:
+    from drf_yasg.views import get_schema_view
+    from drf_yasg import openapi
+
+    schema_view = get_schema_view(
+        openapi.Info(
+            title="Your API",
+            default_version='v1',
+            description="Test description",
+            terms_of_service="https://www.google.com/policies/terms/",
+            contact=openapi.Contact(email="contact@yourapi.local"),
+            license=openapi.License(name="BSD License"),
+        ),
+        public=True,
+        permission_classes=(permissions.AllowAny,),
+    )
+    urlpatterns.append(
+        re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json')
+    )
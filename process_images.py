@@ -1,6 +1,10 @@
 import os
 import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # URL для обработки изображений
 URL = 'http://127.0.0.1:8000/api/process-image/'
@@ -11,13 +15,45 @@ IMAGES_DIR = 'input'
 # Путь для сохранения результатов
 OUTPUT_FILE = 'output/results.json'
 
+# JWT токен для заголовка Authorization (если API требует аутентификацию)
+API_TOKEN = os.getenv('POI_API_TOKEN')
+
+# Повторы временных ошибок: число попыток, множитель экспоненциальной задержки и коды ответа.
+# 503 - в том числе сигнал занятости асинхронного эндпоинта с Retry-After; 500 означает ошибку
+# обработки изображения, которая повторится при каждой попытке, поэтому не повторяется
+RETRIES = 3
+BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = (429, 502, 503, 504)
+
+
+def create_session(concurrency=1, retries=RETRIES, backoff_factor=BACKOFF_FACTOR):
+    """
+    Сессия с пулом соединений на concurrency подключений и повторами с экспоненциальной
+    задержкой для ошибок соединения и ответов RETRY_STATUSES (с учётом Retry-After).
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(['POST']),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(concurrency, 1), max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    if API_TOKEN:
+        session.headers['Authorization'] = f'Bearer {API_TOKEN}'
+    return session
+
 # Функция для обработки изображения
 
 
-def process_image(image_path):
+def process_image(image_path, session=None):
     with open(image_path, 'rb') as img:
         files = {'image': img}
-        response = requests.post(URL, files=files, timeout=10)
+        post = session.post if session is not None else requests.post
+        response = post(URL, files=files, timeout=10)
         if response.status_code == 200:
             return response.json()
         else:
@@ -25,27 +61,85 @@ def process_image(image_path):
             return None
 
 
-def main(input_files, output_file):
-    results = {}
+class ResultWriter:
+    """
+    Потоковая запись результатов в JSON объект {имя файла: результат}: каждая запись
+    дописывается в файл сразу после получения и не хранится в памяти.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.count = 0
+
+    def __enter__(self):
+        self.file.write('{')
+        return self
+
+    def write(self, image_file, result):
+        key = json.dumps(image_file, ensure_ascii=False)
+        value = json.dumps(result, ensure_ascii=False, separators=(',', ':'))
+        self.file.write(f"{',' if self.count else ''}{key}:{value}")
+        self.file.flush()
+        self.count += 1
+
+    def __exit__(self, *exc_info):
+        self.file.write('}')
 
+
+def _process_safely(image_file, session):
+    image_path = os.path.join(IMAGES_DIR, image_file)
+    print(f"Processing {image_path}...")
+    try:
+        return process_image(image_path, session)
+    except (requests.RequestException, OSError) as e:
+        # Повторы уже исчерпаны или файл не читается (удалён, нет прав) - пропускаем его
+        # и продолжаем обработку
+        print(f"Error processing {image_path}: {e}")
+        return None
+
+
+def main(input_files, output_file, concurrency=1):
     if not os.path.exists('output'):
         os.makedirs('output')
 
-    # Обрабатываем каждое изображение и сохраняем результат
-    for image_file in input_files[:17]:  # Обработка только первых 17 изображений из переданного списка
-        image_path = os.path.join(IMAGES_DIR, image_file)
-        print(f"Processing {image_path}...")
-        result = process_image(image_path)
-        if result:
-            results[image_file] = result
+    session = create_session(concurrency)
+    with open(output_file, 'w', encoding='utf-8') as f, ResultWriter(f) as writer:
+        if concurrency <= 1:
+            for image_file in input_files:
+                result = _process_safely(image_file, session)
+                if result:
+                    writer.write(image_file, result)
+            return
 
-    # Сохраняем результаты в JSON файл
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(results, f, ensure_ascii=False, separators=(',', ':'))
+        # Число одновременно ожидающих задач ограничено, поэтому память не растёт
+        # с размером каталога: новые файлы берутся из итератора по мере завершения старых
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            pending = {}
+            for image_file in input_files:
+                if len(pending) >= 2 * concurrency:
+                    _write_completed(pending, writer)
+                pending[executor.submit(_process_safely, image_file, session)] = image_file
+            while pending:
+                _write_completed(pending, writer)
+
+
+def _write_completed(pending, writer):
+    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+    for future in done:
+        image_file = pending.pop(future)
+        result = future.result()
+        if result:
+            writer.write(image_file, result)
 
 
 # Пример вызова функции main() с передачей аргументов
 if __name__ == "__main__":
-    input_files = [f for f in os.listdir(IMAGES_DIR) if os.path.isfile(os.path.join(IMAGES_DIR, f))]
-    output_file = 'output/results.json'
-    main(input_files, output_file)
+    parser = argparse.ArgumentParser(description='Send images to the point of interest detection API.')
+    parser.add_argument('--concurrency', type=int, default=8, help='Number of parallel requests.')
+    parser.add_argument('--url', default=URL, help='Detection endpoint URL.')
+    parser.add_argument('--output', default=OUTPUT_FILE, help='Path of the output JSON file.')
+    args = parser.parse_args()
+
+    URL = args.url
+    input_files = (entry.name for entry in os.scandir(IMAGES_DIR) if entry.is_file())
+    main(input_files, args.output, args.concurrency)